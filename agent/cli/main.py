@@ -1,8 +1,8 @@
+import asyncio
+import glob
 import os
 import sys
-from typing import Optional
-
-import duckdb
+from typing import Dict, List, Optional
 
 try:
     from rich.console import Console
@@ -19,24 +19,19 @@ DEFAULT_DATA_DIR = os.path.abspath(os.path.join(os.getcwd(), "data"))
 
 
 def find_parquet_path(user_path: Optional[str]) -> str:
+    """Resolve the dataset: a parquet file, a glob of files, or a (hive-partitioned) directory."""
     if user_path and os.path.exists(user_path):
         return os.path.abspath(user_path)
+    if user_path and glob.glob(user_path, recursive=True):
+        return os.path.abspath(user_path)
     if os.path.isdir(DEFAULT_DATA_DIR):
-        # pick first .parquet file
-        for name in os.listdir(DEFAULT_DATA_DIR):
-            if name.endswith(".parquet"):
-                return os.path.join(DEFAULT_DATA_DIR, name)
-    raise FileNotFoundError("No parquet file found. Pass --path or place a .parquet in ./data/")
-
-
-def open_duckdb():
-    return duckdb.connect(database=':memory:')
-
-
-def preview_rows(con, parquet_path: str, limit: int = 10):
-    return con.execute(
-        "SELECT * FROM read_parquet(?) LIMIT ?", [parquet_path, limit]
-    ).fetch_df()
+        files = glob.glob(os.path.join(DEFAULT_DATA_DIR, "**", "*.parquet"), recursive=True)
+        if len(files) == 1:
+            return files[0]
+        if files:
+            # daily/monthly feed files are read together as one dataset
+            return DEFAULT_DATA_DIR
+    raise FileNotFoundError("No parquet file found. Pass --path (file, glob or directory) or place .parquet files in ./data/")
 
 
 def _render_result(console, title: str, result):
@@ -44,6 +39,9 @@ def _render_result(console, title: str, result):
         table = Table(title=title)
         try:
             import pyarrow as pa  # type: ignore
+            if isinstance(result, pa.RecordBatchReader):
+                from agent.exec.streaming import read_head
+                result = read_head(result, 20, count_rest=False).table
             if isinstance(result, pa.Table):
                 for name in result.column_names:
                     table.add_column(name)
@@ -59,18 +57,161 @@ def _render_result(console, title: str, result):
         print(result)
 
 
+def _fmt_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.1f}{unit}" if unit != "B" else f"{n}B"
+        n /= 1024
+    return str(n)
+
+
+def _correlation_pipelines_arg(ql: str) -> Optional[int]:
+    """`pipelines=N` limits correlation to the N largest pipelines (default 20); `pipelines=all` uses every one."""
+    import re
+    m = re.search(r"pipelines\s*=\s*(\d+|all)", ql)
+    if not m:
+        return 20
+    return None if m.group(1) == "all" else max(2, int(m.group(1)))
+
+
+_SEGMENT_ALIASES = {
+    "pipeline": "pipeline_name", "pipelines": "pipeline_name", "pipeline_name": "pipeline_name",
+    "category": "category_short", "categories": "category_short", "category_short": "category_short",
+    "state": "state_abb", "states": "state_abb", "state_abb": "state_abb",
+    "location": "loc_name", "locations": "loc_name", "loc": "loc_name", "loc_name": "loc_name",
+}
+
+
+def _segment_arg(ql: str) -> Optional[str]:
+    """Segment column named by `by <dim>` / `per <dim>` (pipeline, category, state, location), if any."""
+    import re
+    m = re.search(r"\b(?:by|per)\s+([a-z_]+)", ql)
+    return _SEGMENT_ALIASES.get(m.group(1)) if m else None
+
+
+def _add_resource_args(parser) -> None:
+    # Defaults come from DUCKDB_* env vars (see DuckDBConfig.from_env); flags override them
+    parser.add_argument("--threads", dest="threads", type=int, default=None, help="DuckDB worker threads (env DUCKDB_THREADS)")
+    parser.add_argument("--memory-limit", dest="memory_limit", default=None, help="DuckDB memory limit, e.g. 4GB (env DUCKDB_MEMORY_LIMIT)")
+    parser.add_argument("--temp-directory", dest="temp_directory", default=None, help="Spill directory for out-of-memory operators (env DUCKDB_TEMP_DIRECTORY)")
+    parser.add_argument("--preserve-insertion-order", dest="preserve_insertion_order", action="store_true", default=None)
+    parser.add_argument("--no-preserve-insertion-order", dest="preserve_insertion_order", action="store_false", help="Let large sorts/aggregates spill instead of keeping row order (env DUCKDB_PRESERVE_INSERTION_ORDER)")
+
+
+def _resource_config(args, **kwargs):
+    from agent.exec.duck import DuckDBConfig
+
+    return DuckDBConfig.from_env(
+        threads=args.threads,
+        memory_limit=args.memory_limit,
+        temp_directory=args.temp_directory,
+        preserve_insertion_order=args.preserve_insertion_order,
+        **kwargs,
+    )
+
+
+def optimize_main(argv) -> int:
+    import argparse
+    from agent.tools.optimize import DEFAULT_ROW_GROUP_SIZE, default_output_path, optimize_dataset
+
+    parser = argparse.ArgumentParser(prog="synmax-agent optimize", description="Rewrite the dataset sorted by (eff_gas_day, pipeline_name) for scan pruning")
+    parser.add_argument("--path", dest="path", default=None, help="Parquet file, glob, or directory to rewrite (defaults to ./data)")
+    parser.add_argument("--out", dest="out", default=None, help="Output parquet file (defaults to <source>.optimized.parquet)")
+    parser.add_argument("--row-group-size", dest="row_group_size", type=int, default=DEFAULT_ROW_GROUP_SIZE)
+    parser.add_argument("--compression-level", dest="compression_level", type=int, default=None, help="zstd level (default: writer default)")
+    _add_resource_args(parser)
+    args = parser.parse_args(argv)
+    console = Console() if Console else None
+
+    src = find_parquet_path(args.path)
+    out = os.path.abspath(args.out or default_output_path(src))
+    settings = _resource_config(args).settings()
+    report = optimize_dataset(src, out, row_group_size=args.row_group_size, compression_level=args.compression_level, settings=settings)
+    msg = (
+        f"Optimized {report['rows']} rows -> {report['output']} ({report['row_groups']} row groups of {report['row_group_size']}); "
+        f"file size {_fmt_bytes(report['file_bytes_before'])} -> {_fmt_bytes(report['file_bytes_after'])}"
+    )
+    (console.print(Panel.fit(msg)) if console else print(msg))
+    if console and Table:
+        table = Table(title="Estimated bytes scanned (standard questions)")
+        for name in ("question", "before", "after", "reduction"):
+            table.add_column(name)
+        for r in report["scans"]:
+            red = 1 - r["bytes_after"] / r["bytes_before"] if r["bytes_before"] else 0.0
+            table.add_row(r["question"], _fmt_bytes(r["bytes_before"]), _fmt_bytes(r["bytes_after"]), f"{red:.0%}")
+        console.print(table)
+    else:
+        for r in report["scans"]:
+            print(f"{r['question']}: {r['bytes_before']} -> {r['bytes_after']} bytes")
+    return 0
+
+
+def ingest_main(argv) -> int:
+    import argparse
+    from agent.tools.ingest import ingest_files
+
+    parser = argparse.ArgumentParser(prog="synmax-agent ingest", description="Append new gas days to a dataset directory and update its rollups incrementally")
+    parser.add_argument("files", nargs="+", help="New parquet files (globs allowed)")
+    parser.add_argument("--path", dest="path", default=None, help="Dataset directory to append to (defaults to ./data)")
+    parser.add_argument("--restate", dest="restate", action="store_true", default=False, help="Replace days at or before the watermark with the incoming rows (late corrections) instead of skipping them")
+    parser.add_argument("--no-rollups", dest="use_rollups", action="store_false", default=True, help="Leave the rollup cache to be rebuilt on next use")
+    _add_resource_args(parser)
+    args = parser.parse_args(argv)
+    console = Console() if Console else None
+
+    dataset_dir = os.path.abspath(args.path) if args.path else DEFAULT_DATA_DIR
+    files = sorted({f for pattern in args.files for f in (glob.glob(pattern, recursive=True) or [pattern])})
+    missing = [f for f in files if not os.path.exists(f)]
+    if missing:
+        msg = f"No such file: {', '.join(missing)}"
+        (console.print(Panel.fit(msg)) if console else print(msg))
+        return 2
+    try:
+        report = ingest_files(dataset_dir, files, restate=args.restate, use_rollups=args.use_rollups, settings=_resource_config(args).settings())
+    except ValueError as e:
+        (console.print(Panel.fit(str(e))) if console else print(str(e)))
+        return 2
+
+    def _days(days) -> str:
+        return f"{len(days)} ({days[0]} .. {days[-1]})" if days else "0"
+
+    msg = (
+        f"Ingested {report['rows_added']} rows into {report['dataset']}; new days {_days(report['new_days'])}, "
+        f"restated {_days(report['restated_days'])} ({report['rows_removed']} rows replaced), skipped {_days(report['skipped_days'])}; "
+        f"watermark {report['watermark']}; rollups {report['rollups']}"
+    )
+    if report["skipped_days"]:
+        msg += "\nSkipped days are at or before the watermark; pass --restate to replace them."
+    (console.print(Panel.fit(msg)) if console else print(msg))
+    return 0
+
+
+SUBCOMMANDS = {"optimize": optimize_main, "ingest": ingest_main}
+
+
 def main(argv=None):
     argv = argv or sys.argv[1:]
+    if argv and argv[0] in SUBCOMMANDS:
+        sys.exit(SUBCOMMANDS[argv[0]](argv[1:]))
     import argparse
     import re
+    import threading
     import time as _time
     parser = argparse.ArgumentParser(prog="synmax-agent", description="SynMax Data Agent")
-    parser.add_argument("--path", dest="path", default=None, help="Path to parquet (defaults to ./data)")
+    parser.add_argument("--path", dest="path", default=None, help="Parquet file, glob, or (hive-partitioned) directory (defaults to ./data)")
     parser.add_argument("--model", dest="model", default=os.environ.get("OPENAI_MODEL", "gpt-4o-mini"))
     parser.add_argument("--max-preview-rows", dest="max_preview_rows", type=int, default=1000)
-    parser.add_argument("--timeout-sec", dest="timeout_sec", type=int, default=30)
+    parser.add_argument("--timeout-sec", dest="timeout_sec", type=int, default=30, help="Per-query deadline in seconds (0 disables)")
     parser.add_argument("--save-run", dest="save_run", action="store_true", default=True)
     parser.add_argument("--no-save-run", dest="save_run", action="store_false")
+    parser.add_argument("--db", dest="db", default=None, help="Query a persistent DuckDB file instead of raw parquet; imported from --path when missing or stale")
+    parser.add_argument("--no-db-sort", dest="db_sort", action="store_false", default=True, help="Import without ordering by (eff_gas_day, pipeline_name)")
+    parser.add_argument("--no-rollups", dest="use_rollups", action="store_false", default=True, help="Scan raw parquet instead of the cached daily/monthly rollups")
+    parser.add_argument("--no-result-cache", dest="use_result_cache", action="store_false", default=True, help="Always execute SQL instead of reusing cached results")
+    parser.add_argument("--approx", dest="approx", action="store_true", default=False, help="Answer sums, counts, group totals and top-N from a persisted stratified sample, with 95%% confidence intervals (per question: approx=true)")
+    parser.add_argument("--refine", dest="refine", action="store_true", default=False, help="With --approx, also compute the exact answer in the background (per question: refine=true)")
+    parser.add_argument("--profile-queries", dest="profile_queries", action="store_true", default=False, help="Capture DuckDB operator-level profiles of every query into the run's profile.json")
+    _add_resource_args(parser)
     parser.add_argument("--query", dest="query", default=None, help="Run a single question non-interactively and exit")
     args = parser.parse_args(argv)
 
@@ -78,7 +219,11 @@ def main(argv=None):
 
     parquet_path = None
     try:
-        parquet_path = find_parquet_path(args.path)
+        if args.db and not args.path and os.path.exists(args.db):
+            # previously imported database; no parquet source needed
+            parquet_path = os.path.abspath(args.db)
+        else:
+            parquet_path = find_parquet_path(args.path)
     except Exception as e:
         if console:
             console.print(Panel.fit(str(e)))
@@ -86,60 +231,163 @@ def main(argv=None):
             print(str(e))
         sys.exit(2)
 
-    con = open_duckdb()
-    df = preview_rows(con, parquet_path, min(10, args.max_preview_rows))
+    from agent.exec.duck import QueryCancelled, QueryTimeout
+    from agent.exec.session import DuckDBSession
+
+    from agent.exec.dataset import import_to_duckdb, imported_fingerprint, is_duckdb_file
+    from agent.utils.fingerprint import dataset_fingerprint
+
+    config = _resource_config(args, timeout_sec=args.timeout_sec)
+    if args.db:
+        db_path = os.path.abspath(args.db)
+        if parquet_path != db_path and dataset_fingerprint(parquet_path) != imported_fingerprint(db_path):
+            msg = f"Importing {parquet_path} into {db_path} ..."
+            (console.print(Panel.fit(msg)) if console else print(msg))
+            import_to_duckdb(parquet_path, db_path, sort=args.db_sort, settings=config.settings())
+        parquet_path = db_path
+    if is_duckdb_file(parquet_path):
+        # the dataset table lives in the database the executor connects to
+        config.database = parquet_path
+        config.read_only = True
+
+    session = DuckDBSession(parquet_path, config, use_rollups=args.use_rollups, use_result_cache=args.use_result_cache, profile_queries=args.profile_queries)
+    run_context = {"duckdb_settings": session.executor.effective_settings()}
+    df = session.preview(min(10, args.max_preview_rows))
+    try:
+        df = df.to_pandas().head()
+    except ImportError:
+        pass  # pandas is optional; print the Arrow table
 
     if console:
         console.print(Panel.fit(f"Loaded dataset: {parquet_path}"))
-        console.print(df.head())
+        console.print(df)
     else:
         print(f"Loaded dataset: {parquet_path}")
-        print(df.head())
+        print(df)
 
-    from agent.exec.duck import DuckDBExecutor
-    from agent.utils.schema_cache import SchemaCache
     from agent.planner.rule_planner import parse_simple
     from agent.exec.sql_builder import build_sql
+    from agent.exec.sampling import approx_relation, build_approx_sql
+    from agent.exec.streaming import read_head
+    from agent.exec.duck import AsyncDuckDBExecutor
+    from agent.tools.analytics_async import correlation_and_clustering
     from agent.report.reporter import Reporter
-    from agent.tools.analytics import correlation_pipelines, cluster_pipelines_monthly, anomalies_vs_category, anomalies_iqr, sudden_shifts, trends_summary, seasonality_summary, top_trending_segments
+    from agent.tools.analytics import correlation_pipelines, correlated_series_pairs, cluster_pipelines_monthly, cluster_pipelines_auto_k, cluster_segments, anomalies_vs_category, anomalies_iqr, sudden_shifts, trends_summary, seasonality_summary, seasonal_decomposition, top_trending_segments, forecast
     from agent.planner.llm_explain import summarize_answer, generate_hypotheses
-    from agent.utils.profile_cache import ProfileCache
     from agent.utils.caveats import build_caveats
     from agent.utils.answers import make_concise_answer
     from agent.planner.openai_planner import choose_analytic_tool
 
-    profile_cache = ProfileCache()
-
     def parse_int(s: str, default: int) -> int:
         try:
             return int(s)
         except Exception:
             return default
 
+    refinements: List[threading.Thread] = []  # background exact answers of approximate ones
+
     def run_once(question: str):
-        executor = DuckDBExecutor()
-        schema = SchemaCache().get_or_load(executor, parquet_path)
+        executor = session.executor
+        schema = session.schema()
         ql = question.lower()
-        prof = profile_cache.get_or_profile(executor, parquet_path, sample_rows=10000)
+        prof = session.profile(sample_rows=10000)
 
         # Analytics triggers
+        if "correlat" in ql and "cluster" in ql:
+            # Composite question: both analytics run concurrently on separate cursors
+            m = re.search(r"method\s*=\s*(pearson|spearman)", ql)
+            method = m.group(1) if m else "pearson"
+            include_p = bool(re.search(r"p[-_ ]?value\s*=\s*(1|true|yes)", ql))
+            m = re.search(r"k\s*=\s*(\d+)", ql)
+            k = parse_int(m.group(1), 5) if m else 5
+            m = re.search(r"scale\s*=\s*(standard|minmax|none)", ql)
+            scaling = m.group(1) if m else "standard"
+            m = re.search(r"algo(rithm)?\s*=\s*(kmeans|minibatch)", ql)
+            algorithm = m.group(2) if m else "kmeans"
+            m = re.search(r"seed\s*=\s*(\d+)", ql)
+            seed = parse_int(m.group(1), 42) if m else 42
+            corr_kwargs = {"method": method, "include_pvalue": include_p, "top_k_pipelines": _correlation_pipelines_arg(ql)}
+            clu_kwargs = {"k": k, "scaling": scaling, "algorithm": algorithm, "seed": seed}
+
+            async def _composite():
+                async with AsyncDuckDBExecutor(executor) as aexec:
+                    return await correlation_and_clustering(aexec, parquet_path, corr_kwargs, clu_kwargs)
+
+            t0 = _time.time()
+            corr_result, clu_result = asyncio.run(_composite())
+            latency = _time.time() - t0
+            for answer in (make_concise_answer(corr_result, {"analytics": "correlation"}), make_concise_answer(clu_result, {"analytics": "clustering"})):
+                (console.print(answer) if console else print(answer))
+            htxt = f"Heuristic: analytics trigger 'correlation + clustering' (method={method}, include_pvalue={include_p}, k={k}, scaling={scaling}, algorithm={algorithm}, seed={seed}; run concurrently)"
+            (console.print(Panel.fit(htxt)) if console else print(htxt))
+            _render_result(console, "pipeline correlation (top pairs)", corr_result)
+            _render_result(console, f"pipeline clusters (k={k}, scaling={scaling}, algorithm={algorithm}, seed={seed})", clu_result)
+            if args.save_run:
+                reporter = Reporter(context=run_context, profiler=session.executor.profiler)
+                caveats = build_caveats(corr_result, {"analytics": "correlation", "profile": prof, "method": method, "include_pvalue": include_p})
+                caveats += [c for c in build_caveats(clu_result, {"analytics": "clustering", "profile": prof, "algorithm": algorithm}) if c not in caveats]
+                summary = (
+                    f"Question: {question}\n\n"
+                    + f"Notes: correlation (method={method}, include_pvalue={include_p}) + clustering (k={k}, scaling={scaling}, algorithm={algorithm}, seed={seed})\n"
+                    + "- Missing-value handling: COALESCE(scheduled_quantity,0) for totals.\n"
+                    + ("\n".join(f"- {c}" for c in caveats))
+                )
+                plan = {"intent": "analytic", "notes": "correlation+clustering", "params": {"correlation": corr_kwargs, "clustering": clu_kwargs}, "pseudo": "correlation_pipelines || cluster_pipelines_monthly (concurrent cursors)"}
+                run_dir = reporter.save_artifacts(plan, None, {"correlation": corr_result, "clustering": clu_result}, summary, latency_sec=latency)
+                (console.print(Panel.fit(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)")) if console else print(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)"))
+            return 0
+        if "correlat" in ql and re.search(r"\bloc(_name|ations?)\b", ql):
+            # Location-level: blocked top-K search over every loc_name series
+            m = re.search(r"method\s*=\s*(pearson|spearman)", ql)
+            method = m.group(1) if m else "pearson"
+            m = re.search(r"top\s*=?\s*(\d+)", ql)
+            top_n = parse_int(m.group(1), 20) if m else 20
+            m = re.search(r"min[-_ ]?days\s*=\s*(\d+)", ql)
+            min_days = parse_int(m.group(1), 30) if m else 30
+            m = re.search(r"memory\s*=\s*(\d+)", ql)
+            max_memory_mb = parse_int(m.group(1), 512) if m else 512
+            m = re.search(r"threads\s*=\s*(\d+)", ql)
+            threads = parse_int(m.group(1), 1) if m else (os.cpu_count() or 1)
+            loc_kwargs = {"method": method, "top_pairs": top_n, "min_days": min_days, "max_memory_mb": max_memory_mb, "threads": threads}
+            t0 = _time.time()
+            result = correlated_series_pairs(executor, parquet_path, group_col="loc_name", **loc_kwargs)
+            latency = _time.time() - t0
+            concise = make_concise_answer(result, {"analytics": "correlation"})
+            (console.print(concise) if console else print(concise))
+            htxt = f"Heuristic: analytics trigger 'location correlation' (method={method}, top={top_n}, min_days={min_days}, memory={max_memory_mb}MB, threads={threads})"
+            (console.print(Panel.fit(htxt)) if console else print(htxt))
+            _render_result(console, "location correlation (top pairs)", result)
+            if args.save_run:
+                reporter = Reporter(context=run_context, profiler=session.executor.profiler)
+                caveats = build_caveats(result, {"analytics": "correlation", "profile": prof, "method": method, "include_pvalue": False})
+                summary = (
+                    f"Question: {question}\n\n"
+                    + f"Notes: location correlation (method={method}, min_days={min_days}); blocked top-K search, float32\n"
+                    + "- Missing-value handling: COALESCE(scheduled_quantity,0) for totals; days without flow count as zero.\n"
+                    + ("\n".join(f"- {c}" for c in caveats))
+                )
+                plan = {"intent": "analytic", "notes": "location correlation", "params": loc_kwargs, "pseudo": "daily totals by loc_name -> standardized float32 rows -> tiled Z_a @ Z_b.T with running top-K"}
+                run_dir = reporter.save_artifacts(plan, None, result, summary, latency_sec=latency)
+                (console.print(Panel.fit(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)")) if console else print(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)"))
+            return 0
         if "correlation" in ql or "correlat" in ql:
             m = re.search(r"method\s*=\s*(pearson|spearman)", ql)
             method = m.group(1) if m else "pearson"
             include_p = bool(re.search(r"p[-_ ]?value\s*=\s*(1|true|yes)", ql))
+            top_k_pipelines = _correlation_pipelines_arg(ql)
             t0 = _time.time()
-            result = correlation_pipelines(executor, parquet_path, method=method, include_pvalue=include_p)
+            result = correlation_pipelines(executor, parquet_path, top_k_pipelines=top_k_pipelines, method=method, include_pvalue=include_p)
             latency = _time.time() - t0
             concise = make_concise_answer(result, {"analytics": "correlation"})
             (console.print(concise) if console else print(concise))
             # Heuristic + LLM info
-            htxt = f"Heuristic: analytics trigger 'correlation' (method={method}, include_pvalue={include_p})"
+            htxt = f"Heuristic: analytics trigger 'correlation' (method={method}, include_pvalue={include_p}, pipelines={top_k_pipelines or 'all'})"
             llm_txt = f"LLM(explain): model={args.model}, enabled={'YES' if os.environ.get('OPENAI_API_KEY') else 'NO'}"
             (console.print(Panel.fit(htxt)) if console else print(htxt))
             (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
             _render_result(console, "pipeline correlation (top pairs)", result)
             if args.save_run:
-                reporter = Reporter()
+                reporter = Reporter(context=run_context, profiler=session.executor.profiler)
                 expl = summarize_answer(question, f"--analytics: correlation_pipelines (method={method}, include_pvalue={include_p})", result, args.model) or ""
                 hypo = generate_hypotheses(question, expl or f"correlation (method={method})", args.model) or ""
                 caveats = build_caveats(result, {"analytics": "correlation", "profile": prof, "method": method, "include_pvalue": include_p})
@@ -160,9 +408,9 @@ def main(argv=None):
             scaling = "standard"
             algorithm = "kmeans"
             seed = 42
-            m = re.search(r"k\s*=\s*(\d+)", ql)
+            m = re.search(r"k\s*=\s*(\d+|auto)", ql)
             if m:
-                k = parse_int(m.group(1), 5)
+                k = "auto" if m.group(1) == "auto" else parse_int(m.group(1), 5)
             m = re.search(r"scale\s*=\s*(standard|minmax|none)", ql)
             if m:
                 scaling = m.group(1)
@@ -172,21 +420,37 @@ def main(argv=None):
             m = re.search(r"seed\s*=\s*(\d+)", ql)
             if m:
                 seed = parse_int(m.group(1), 42)
+            # Locations (or weekly profiles) are clustered out of core over every segment
+            segment_col = "loc_name" if re.search(r"\bloc(_name|ations?)\b", ql) else None
+            freq = "week" if re.search(r"\bweek(ly)?\b", ql) else "month"
+            if segment_col or freq == "week":
+                segment_col = segment_col or "pipeline_name"
+                algorithm = "minibatch-stream"
+                k = 8 if k == "auto" else k  # the k sweep runs on the in-memory pipeline profiles only
+            sweep_tbl = None
             t0 = _time.time()
-            result = cluster_pipelines_monthly(executor, parquet_path, k=k, scaling=scaling, algorithm=algorithm, seed=seed)
+            if segment_col:
+                result = cluster_segments(executor, parquet_path, group_col=segment_col, freq=freq, k=k, scaling=scaling, seed=seed)
+            elif k == "auto":
+                result, sweep_tbl = cluster_pipelines_auto_k(executor, parquet_path, scaling=scaling, algorithm=algorithm)
+                k, seed = f"auto->{result['k'][0].as_py()}" if result.num_rows else "auto", result["seed"][0].as_py() if result.num_rows else seed
+            else:
+                result = cluster_pipelines_monthly(executor, parquet_path, k=k, scaling=scaling, algorithm=algorithm, seed=seed)
             latency = _time.time() - t0
             concise = make_concise_answer(result, {"analytics": "clustering"})
             (console.print(concise) if console else print(concise))
-            htxt = f"Heuristic: analytics trigger 'clustering' (k={k}, scaling={scaling}, algorithm={algorithm}, seed={seed})"
+            htxt = f"Heuristic: analytics trigger 'clustering' (k={k}, scaling={scaling}, algorithm={algorithm}, seed={seed}" + (f", group_col={segment_col}, freq={freq})" if segment_col else ")")
             llm_txt = f"LLM(explain): model={args.model}, enabled={'YES' if os.environ.get('OPENAI_API_KEY') else 'NO'}"
             (console.print(Panel.fit(htxt)) if console else print(htxt))
             (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
-            _render_result(console, f"pipeline clusters (k={k}, scaling={scaling}, algorithm={algorithm}, seed={seed})", result)
+            _render_result(console, f"{segment_col or 'pipeline'} clusters (k={k}, scaling={scaling}, algorithm={algorithm}, seed={seed})", result)
+            if sweep_tbl is not None:
+                _render_result(console, "k sweep (sampled silhouette, Davies-Bouldin, seed stability)", sweep_tbl)
             if args.save_run:
-                reporter = Reporter()
-                expl = summarize_answer(question, f"--analytics: cluster_pipelines_monthly (k={k}, scaling={scaling}, algorithm={algorithm}, seed={seed})", result, args.model) or ""
+                reporter = Reporter(context=run_context, profiler=session.executor.profiler)
+                expl = summarize_answer(question, f"--analytics: {'cluster_segments' if segment_col else 'cluster_pipelines_monthly'} (k={k}, scaling={scaling}, algorithm={algorithm}, seed={seed})", result, args.model) or ""
                 hypo = generate_hypotheses(question, expl or f"clustering (k={k}, scaling={scaling})", args.model) or ""
-                caveats = build_caveats(result, {"analytics": "clustering", "profile": prof, "algorithm": algorithm})
+                caveats = build_caveats(result, {"analytics": "clustering", "profile": prof, "algorithm": algorithm, "k_auto": sweep_tbl is not None})
                 missing_note = "Missing-value handling: COALESCE(scheduled_quantity,0) for totals."
                 summary = (
                     f"Question: {question}\n\n"
@@ -195,12 +459,108 @@ def main(argv=None):
                     + f"Notes: clustering (k={k}, scaling={scaling}, algorithm={algorithm}, seed={seed})\n- {missing_note}\n"
                     + ("\n".join(f"- {c}" for c in caveats))
                 )
-                plan = {"intent": "analytic", "notes": "clustering", "params": {"k": k, "scaling": scaling, "algorithm": algorithm, "seed": seed}, "pseudo": "monthly totals by pipeline -> scale -> (MiniBatch)KMeans -> labels & silhouette"}
-                run_dir = reporter.save_artifacts(plan, None, result, summary, latency_sec=latency)
+                if segment_col:
+                    plan = {"intent": "analytic", "notes": "clustering", "params": {"k": k, "scaling": scaling, "algorithm": algorithm, "seed": seed, "group_col": segment_col, "freq": freq}, "pseudo": f"{freq}ly totals by {segment_col} streamed into a float32 feature store -> scaler/MiniBatchKMeans partial_fit per block -> sampled silhouette"}
+                elif sweep_tbl is not None:
+                    plan = {"intent": "analytic", "notes": "clustering", "params": {"k": k, "scaling": scaling, "algorithm": algorithm, "seed": seed}, "pseudo": "monthly totals by pipeline -> scale once -> (k, seed) fits in a process pool -> sampled silhouette + Davies-Bouldin + ARI stability -> chosen k"}
+                else:
+                    plan = {"intent": "analytic", "notes": "clustering", "params": {"k": k, "scaling": scaling, "algorithm": algorithm, "seed": seed}, "pseudo": "monthly totals by pipeline -> scale -> (MiniBatch)KMeans -> labels & silhouette"}
+                run_dir = reporter.save_artifacts(plan, None, {"clusters": result, "k_sweep": sweep_tbl} if sweep_tbl is not None else result, summary, latency_sec=latency)
                 (console.print(Panel.fit(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)")) if console else print(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)"))
             return 0
 
         # Additional analytics
+        if "forecast" in ql:
+            group_col = _segment_arg(ql) or "pipeline_name"
+            if re.search(r"\b(total|network)\b", ql):
+                group_col = None
+            freq = "month" if re.search(r"\bmonthly\b", ql) else "day"
+            horizon = 14 if freq == "day" else 6
+            m = re.search(r"horizon\s*=\s*(\d+)", ql)
+            if m:
+                horizon = parse_int(m.group(1), horizon)
+            methods = ("seasonal_naive", "holt_winters")
+            m = re.search(r"method\s*=\s*(snaive|hw)\b", ql)
+            if m:
+                methods = ("seasonal_naive",) if m.group(1) == "snaive" else ("holt_winters",)
+            workers = None
+            m = re.search(r"workers\s*=\s*(\d+)", ql)
+            if m:
+                workers = parse_int(m.group(1), 1)
+            t0 = _time.time()
+            try:
+                result, backtest = forecast(executor, parquet_path, group_col=group_col, freq=freq, horizon=horizon, methods=methods, max_workers=workers)
+            except ValueError as e:
+                (console.print(Panel.fit(str(e))) if console else print(str(e)))
+                return 1
+            latency = _time.time() - t0
+            concise = make_concise_answer(result, {"analytics": "forecast"})
+            (console.print(concise) if console else print(concise))
+            htxt = f"Heuristic: analytics trigger 'forecast' (group_col={group_col}, freq={freq}, horizon={horizon}, methods={'+'.join(methods)})"
+            llm_txt = f"LLM(explain): model={args.model}, enabled={'YES' if os.environ.get('OPENAI_API_KEY') else 'NO'}"
+            (console.print(Panel.fit(htxt)) if console else print(htxt))
+            (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
+            _render_result(console, f"{freq}ly forecasts by {group_col or 'network total'} (95% intervals)", result)
+            _render_result(console, "backtest errors (last horizon held out)", backtest)
+            if args.save_run:
+                reporter = Reporter(context=run_context, profiler=session.executor.profiler)
+                expl = summarize_answer(question, f"--analytics: forecast (group_col={group_col}, freq={freq}, horizon={horizon}, methods={methods})", result, args.model) or ""
+                hypo = generate_hypotheses(question, expl or f"forecast (group_col={group_col})", args.model) or ""
+                caveats = build_caveats(result, {"analytics": "forecast", "profile": prof})
+                missing_note = "Missing-value handling: COALESCE(scheduled_quantity,0) for totals; a segment without rows in a period counts 0 there."
+                summary = (
+                    f"Question: {question}\n\n"
+                    + (expl + "\n\n" if expl else "")
+                    + ("Hypotheses:\n" + hypo + "\n\n" if hypo else "")
+                    + f"Notes: forecast (group_col={group_col}, freq={freq}, horizon={horizon}, methods={'+'.join(methods)})\n- {missing_note}\n"
+                    + ("\n".join(f"- {c}" for c in caveats))
+                )
+                plan = {"intent": "analytic", "notes": "forecast", "params": {"group_col": group_col, "freq": freq, "horizon": horizon, "methods": list(methods), "workers": workers}, "pseudo": f"{freq}ly totals per segment (shared series) -> seasonal naive + grid-searched additive Holt-Winters over all segments at once -> horizon forecasts with 95% intervals; refit without the last horizon -> MAE/RMSE/MASE"}
+                run_dir = reporter.save_artifacts(plan, None, {"forecast": result, "backtest": backtest}, summary, latency_sec=latency)
+                (console.print(Panel.fit(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)")) if console else print(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)"))
+            return 0
+
+        if "decompos" in ql:
+            group_col = _segment_arg(ql) or "pipeline_name"
+            if re.search(r"\b(total|network)\b", ql):
+                group_col = None
+            seasonality = ("week", "year")
+            m = re.search(r"period\s*=\s*(week|year)\b", ql)
+            if m:
+                seasonality = (m.group(1),)
+            robust = "robust" in ql
+            workers = None
+            m = re.search(r"workers\s*=\s*(\d+)", ql)
+            if m:
+                workers = parse_int(m.group(1), 1)
+            t0 = _time.time()
+            result = seasonal_decomposition(executor, parquet_path, group_col=group_col, seasonality=seasonality, robust=robust, max_workers=workers)
+            latency = _time.time() - t0
+            concise = make_concise_answer(result, {"analytics": "decomposition"})
+            (console.print(concise) if console else print(concise))
+            htxt = f"Heuristic: analytics trigger 'decomposition' (group_col={group_col}, seasonality={'+'.join(seasonality)}, robust={robust})"
+            llm_txt = f"LLM(explain): model={args.model}, enabled={'YES' if os.environ.get('OPENAI_API_KEY') else 'NO'}"
+            (console.print(Panel.fit(htxt)) if console else print(htxt))
+            (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
+            _render_result(console, f"seasonal decomposition by {group_col or 'network total'}", result)
+            if args.save_run:
+                reporter = Reporter(context=run_context, profiler=session.executor.profiler)
+                expl = summarize_answer(question, f"--analytics: seasonal_decomposition (group_col={group_col}, seasonality={seasonality}, robust={robust})", result, args.model) or ""
+                hypo = generate_hypotheses(question, expl or f"decomposition (group_col={group_col})", args.model) or ""
+                caveats = build_caveats(result, {"analytics": "decomposition", "profile": prof})
+                missing_note = "Missing-value handling: COALESCE(scheduled_quantity,0) for totals; a segment without rows on a day counts 0 there."
+                summary = (
+                    f"Question: {question}\n\n"
+                    + (expl + "\n\n" if expl else "")
+                    + ("Hypotheses:\n" + hypo + "\n\n" if hypo else "")
+                    + f"Notes: seasonal decomposition (group_col={group_col}, seasonality={'+'.join(seasonality)}, robust={robust})\n- {missing_note}\n"
+                    + ("\n".join(f"- {c}" for c in caveats))
+                )
+                plan = {"intent": "analytic", "notes": "decomposition", "params": {"group_col": group_col, "seasonality": list(seasonality), "robust": robust, "workers": workers}, "pseudo": "daily totals per segment (shared series) -> one design matrix (piecewise-linear trend + Fourier terms) -> batched least squares -> trend/seasonal strength, peak month/weekday"}
+                run_dir = reporter.save_artifacts(plan, None, result, summary, latency_sec=latency)
+                (console.print(Panel.fit(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)")) if console else print(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)"))
+            return 0
+
         if "seasonality" in ql or "seasonal" in ql:
             group_col = None
             m = re.search(r"by\s+([a-zA-Z0-9_]+)", ql)
@@ -217,7 +577,7 @@ def main(argv=None):
             (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
             _render_result(console, f"seasonality summary" + (f" by {group_col}" if group_col else ""), result)
             if args.save_run:
-                reporter = Reporter()
+                reporter = Reporter(context=run_context, profiler=session.executor.profiler)
                 expl = summarize_answer(question, f"--analytics: seasonality_summary (group_col={group_col})", result, args.model) or ""
                 hypo = generate_hypotheses(question, expl or f"seasonality (group_col={group_col})", args.model) or ""
                 caveats = build_caveats(result, {"analytics": "trends", "profile": prof})
@@ -247,19 +607,23 @@ def main(argv=None):
             m = re.search(r"min[_-]?months\s*=\s*(\d+)", ql)
             if m:
                 min_months = parse_int(m.group(1), 6)
+            growth = "mom"
+            m = re.search(r"\b(mom|qoq|yoy)\b", ql)
+            if m:
+                growth = m.group(1)
             t0 = _time.time()
-            result = top_trending_segments(executor, parquet_path, group_col=group_col, n=n, min_months=min_months)
+            result = top_trending_segments(executor, parquet_path, group_col=group_col, n=n, min_months=min_months, growth=growth)
             latency = _time.time() - t0
             concise = make_concise_answer(result, {"analytics": "trends"})
             (console.print(concise) if console else print(concise))
-            htxt = f"Heuristic: analytics trigger 'top_trending' (group_col={group_col}, top={n}, min_months={min_months})"
+            htxt = f"Heuristic: analytics trigger 'top_trending' (group_col={group_col}, top={n}, min_months={min_months}, growth={growth})"
             llm_txt = f"LLM(explain): model={args.model}, enabled={'YES' if os.environ.get('OPENAI_API_KEY') else 'NO'}"
             (console.print(Panel.fit(htxt)) if console else print(htxt))
             (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
-            _render_result(console, f"top trending {group_col} (top={n}, min_months={min_months})", result)
+            _render_result(console, f"top trending {group_col} (top={n}, min_months={min_months}, growth={growth})", result)
             if args.save_run:
-                reporter = Reporter()
-                expl = summarize_answer(question, f"--analytics: top_trending_segments (group_col={group_col}, top={n}, min_months={min_months})", result, args.model) or ""
+                reporter = Reporter(context=run_context, profiler=session.executor.profiler)
+                expl = summarize_answer(question, f"--analytics: top_trending_segments (group_col={group_col}, top={n}, min_months={min_months}, growth={growth})", result, args.model) or ""
                 hypo = generate_hypotheses(question, expl or f"top_trending (group_col={group_col})", args.model) or ""
                 caveats = build_caveats(result, {"analytics": "trends", "profile": prof})
                 missing_note = "Missing-value handling: COALESCE(scheduled_quantity,0) for totals."
@@ -267,10 +631,10 @@ def main(argv=None):
                     f"Question: {question}\n\n"
                     + (expl + "\n\n" if expl else "")
                     + ("Hypotheses:\n" + hypo + "\n\n" if hypo else "")
-                    + f"Notes: top trending segments (group_col={group_col}, top={n}, min_months={min_months})\n- {missing_note}\n"
+                    + f"Notes: top trending segments (group_col={group_col}, top={n}, min_months={min_months}, growth={growth})\n- {missing_note}\n"
                     + ("\n".join(f"- {c}" for c in caveats))
                 )
-                plan = {"intent": "analytic", "notes": "top_trending", "params": {"group_col": group_col, "top": n, "min_months": min_months}, "pseudo": "monthly totals pivot -> MoM growth -> rank latest growth with min months"}
+                plan = {"intent": "analytic", "notes": "top_trending", "params": {"group_col": group_col, "top": n, "min_months": min_months, "growth": growth}, "pseudo": "monthly totals in SQL -> LAG to the baseline month -> QUALIFY latest month -> top N by growth with min months"}
                 run_dir = reporter.save_artifacts(plan, None, result, summary, latency_sec=latency)
                 (console.print(Panel.fit(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)")) if console else print(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)"))
             return 0
@@ -282,19 +646,20 @@ def main(argv=None):
                     k = float(m.group(1))
                 except Exception:
                     k = 1.5
+            group_col = _segment_arg(ql)
             t0 = _time.time()
-            result = anomalies_iqr(executor, parquet_path, k=k)
+            result = anomalies_iqr(executor, parquet_path, k=k, group_col=group_col)
             latency = _time.time() - t0
             concise = make_concise_answer(result, {"analytics": "anomalies_iqr"})
             (console.print(concise) if console else print(concise))
-            htxt = f"Heuristic: analytics trigger 'anomalies_iqr' (k={k})"
+            htxt = f"Heuristic: analytics trigger 'anomalies_iqr' (k={k}, group_col={group_col})"
             llm_txt = f"LLM(explain): model={args.model}, enabled={'YES' if os.environ.get('OPENAI_API_KEY') else 'NO'}"
             (console.print(Panel.fit(htxt)) if console else print(htxt))
             (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
-            _render_result(console, f"daily outliers by IQR (k={k})", result)
+            _render_result(console, f"daily outliers by IQR (k={k})" + (f" per {group_col}" if group_col else ""), result)
             if args.save_run:
-                reporter = Reporter()
-                expl = summarize_answer(question, f"--analytics: anomalies_iqr (k={k})", result, args.model) or ""
+                reporter = Reporter(context=run_context, profiler=session.executor.profiler)
+                expl = summarize_answer(question, f"--analytics: anomalies_iqr (k={k}, group_col={group_col})", result, args.model) or ""
                 hypo = generate_hypotheses(question, expl or f"anomalies_iqr (k={k})", args.model) or ""
                 caveats = build_caveats(result, {"analytics": "anomalies_iqr", "profile": prof})
                 missing_note = "Missing-value handling: COALESCE(scheduled_quantity,0) for totals."
@@ -302,10 +667,11 @@ def main(argv=None):
                     f"Question: {question}\n\n"
                     + (expl + "\n\n" if expl else "")
                     + ("Hypotheses:\n" + hypo + "\n\n" if hypo else "")
-                    + f"Notes: IQR outliers (k={k})\n- {missing_note}\n"
+                    + f"Notes: IQR outliers (k={k}, group_col={group_col})\n- {missing_note}\n"
                     + ("\n".join(f"- {c}" for c in caveats))
                 )
-                plan = {"intent": "analytic", "notes": "anomalies_iqr", "params": {"k": k}, "pseudo": "daily totals -> IQR fences -> flag days outside [Q1-k*IQR, Q3+k*IQR]"}
+                pseudo = "daily totals per group -> quantile_cont fences over PARTITION BY group -> flag days outside" if group_col else "daily totals -> IQR fences -> flag days outside [Q1-k*IQR, Q3+k*IQR]"
+                plan = {"intent": "analytic", "notes": "anomalies_iqr", "params": {"k": k, "group_col": group_col}, "pseudo": pseudo}
                 run_dir = reporter.save_artifacts(plan, None, result, summary, latency_sec=latency)
                 (console.print(Panel.fit(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)")) if console else print(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)"))
             return 0
@@ -322,19 +688,20 @@ def main(argv=None):
                     sigma = float(m.group(1))
                 except Exception:
                     sigma = 3.0
+            group_col = _segment_arg(ql)
             t0 = _time.time()
-            result = sudden_shifts(executor, parquet_path, window=window, sigma=sigma)
+            result = sudden_shifts(executor, parquet_path, window=window, sigma=sigma, group_col=group_col)
             latency = _time.time() - t0
             concise = make_concise_answer(result, {"analytics": "sudden_shifts"})
             (console.print(concise) if console else print(concise))
-            htxt = f"Heuristic: analytics trigger 'sudden_shifts' (window={window}, sigma={sigma})"
+            htxt = f"Heuristic: analytics trigger 'sudden_shifts' (window={window}, sigma={sigma}, group_col={group_col})"
             llm_txt = f"LLM(explain): model={args.model}, enabled={'YES' if os.environ.get('OPENAI_API_KEY') else 'NO'}"
             (console.print(Panel.fit(htxt)) if console else print(htxt))
             (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
-            _render_result(console, f"sudden shifts (window={window}, sigma={sigma})", result)
+            _render_result(console, f"sudden shifts (window={window}, sigma={sigma})" + (f" per {group_col}" if group_col else ""), result)
             if args.save_run:
-                reporter = Reporter()
-                expl = summarize_answer(question, f"--analytics: sudden_shifts (window={window}, sigma={sigma})", result, args.model) or ""
+                reporter = Reporter(context=run_context, profiler=session.executor.profiler)
+                expl = summarize_answer(question, f"--analytics: sudden_shifts (window={window}, sigma={sigma}, group_col={group_col})", result, args.model) or ""
                 hypo = generate_hypotheses(question, expl or f"sudden_shifts (window={window}, sigma={sigma})", args.model) or ""
                 caveats = build_caveats(result, {"analytics": "sudden_shifts", "profile": prof})
                 missing_note = "Missing-value handling: COALESCE(scheduled_quantity,0) for totals."
@@ -342,10 +709,11 @@ def main(argv=None):
                     f"Question: {question}\n\n"
                     + (expl + "\n\n" if expl else "")
                     + ("Hypotheses:\n" + hypo + "\n\n" if hypo else "")
-                    + f"Notes: sudden shifts (window={window}, sigma={sigma})\n- {missing_note}\n"
+                    + f"Notes: sudden shifts (window={window}, sigma={sigma}, group_col={group_col})\n- {missing_note}\n"
                     + ("\n".join(f"- {c}" for c in caveats))
                 )
-                plan = {"intent": "analytic", "notes": "sudden_shifts", "params": {"window": window, "sigma": sigma}, "pseudo": "daily totals -> rolling mean/std -> |x-mean|/std >= sigma"}
+                pseudo = "daily totals per segment -> AVG/STDDEV_SAMP over ROWS BETWEEN window PRECEDING AND 1 PRECEDING -> |x-mean|/std >= sigma" if group_col else "daily totals -> rolling mean/std -> |x-mean|/std >= sigma"
+                plan = {"intent": "analytic", "notes": "sudden_shifts", "params": {"window": window, "sigma": sigma, "group_col": group_col}, "pseudo": pseudo}
                 run_dir = reporter.save_artifacts(plan, None, result, summary, latency_sec=latency)
                 (console.print(Panel.fit(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)")) if console else print(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)"))
             return 0
@@ -363,7 +731,7 @@ def main(argv=None):
             (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
             _render_result(console, f"trends summary by {by}", result)
             if args.save_run:
-                reporter = Reporter()
+                reporter = Reporter(context=run_context, profiler=session.executor.profiler)
                 expl = summarize_answer(question, f"--analytics: trends_summary (by={by})", result, args.model) or ""
                 hypo = generate_hypotheses(question, expl or f"trends (by={by})", args.model) or ""
                 caveats = build_caveats(result, {"analytics": "trends", "profile": prof})
@@ -405,7 +773,7 @@ def main(argv=None):
             (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
             _render_result(console, "anomalous locations vs category baseline", result)
             if args.save_run:
-                reporter = Reporter()
+                reporter = Reporter(context=run_context, profiler=session.executor.profiler)
                 expl = summarize_answer(question, f"--analytics: anomalies_vs_category (z>={z}, min_days={min_days})", result, args.model) or ""
                 hypo = generate_hypotheses(question, expl or f"anomalies_vs_category (z>={z}, min_days={min_days})", args.model) or ""
                 caveats = build_caveats(result, {"analytics": "anomalies_vs_category", "profile": prof})
@@ -416,7 +784,9 @@ def main(argv=None):
                     + f"Notes: category baseline z-threshold {z}, min days {min_days}\n"
                     + ("\n".join(f"- {c}" for c in caveats))
                 )
-                run_dir = reporter.save_artifacts({"intent": "analytic", "notes": "anomalies_vs_category"}, None, result, summary, latency_sec=latency)
+                materialized = session.executor.materialized
+                plan = {"intent": "analytic", "notes": "anomalies_vs_category", "params": {"z_threshold": z, "min_anomaly_days": min_days, "year": year, "state": state, "rec_del_sign": rds}, "materialized": materialized.stats() if materialized is not None else {}}
+                run_dir = reporter.save_artifacts(plan, None, result, summary, latency_sec=latency)
                 (console.print(Panel.fit(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)")) if console else print(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)"))
             return 0
         if parsed.special and parsed.special.get("type") == "trends":
@@ -432,7 +802,7 @@ def main(argv=None):
             (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
             _render_result(console, f"trends summary by {by}", result)
             if args.save_run:
-                reporter = Reporter()
+                reporter = Reporter(context=run_context, profiler=session.executor.profiler)
                 expl = summarize_answer(question, f"--analytics: trends_summary (by={by})", result, args.model) or ""
                 caveats = build_caveats(result, {"analytics": "trends", "profile": prof})
                 hypo = generate_hypotheses(question, expl or f"trends {by}", args.model) or ""
@@ -465,7 +835,7 @@ def main(argv=None):
                     (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
                     _render_result(console, "pipeline correlation (top pairs)", result)
                     if args.save_run:
-                        reporter = Reporter()
+                        reporter = Reporter(context=run_context, profiler=session.executor.profiler)
                         expl = summarize_answer(question, f"--analytics: correlation_pipelines (method={method}, include_pvalue={include_pvalue})", result, args.model) or ""
                         hypo = generate_hypotheses(question, expl or f"correlation (method={method})", args.model) or ""
                         caveats = build_caveats(result, {"analytics": "correlation", "profile": prof, "method": method, "include_pvalue": include_pvalue})
@@ -496,7 +866,7 @@ def main(argv=None):
                     (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
                     _render_result(console, f"pipeline clusters (k={k}, scaling={scaling}, algorithm={algorithm}, seed={seed})", result)
                     if args.save_run:
-                        reporter = Reporter()
+                        reporter = Reporter(context=run_context, profiler=session.executor.profiler)
                         expl = summarize_answer(question, f"--analytics: cluster_pipelines_monthly (k={k}, scaling={scaling}, algorithm={algorithm}, seed={seed})", result, args.model) or ""
                         hypo = generate_hypotheses(question, expl or f"clustering (k={k}, scaling={scaling})", args.model) or ""
                         caveats = build_caveats(result, {"analytics": "clustering", "profile": prof, "algorithm": algorithm})
@@ -523,7 +893,7 @@ def main(argv=None):
                     (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
                     _render_result(console, "anomalous locations vs category baseline", result)
                     if args.save_run:
-                        reporter = Reporter()
+                        reporter = Reporter(context=run_context, profiler=session.executor.profiler)
                         z = params.get('z_threshold'); mnd = params.get('min_anomaly_days'); yr = params.get('year'); st = params.get('state'); rds = params.get('rec_del_sign')
                         expl = summarize_answer(question, f"--analytics: anomalies_vs_category (z>={z}, min_days={mnd}, year={yr}, state={st}, rec_del_sign={rds})", result, args.model) or ""
                         hypo = generate_hypotheses(question, expl or f"anomalies_vs_category (z>={z}, min_days={mnd})", args.model) or ""
@@ -541,8 +911,9 @@ def main(argv=None):
                     return 0
                 if tool == 'anomalies_iqr':
                     k = float(params.get('k', 1.5))
+                    group_col = params.get('group_col') if params.get('group_col') in set(_SEGMENT_ALIASES.values()) else None
                     t0 = _time.time()
-                    result = anomalies_iqr(executor, parquet_path, k=k)
+                    result = anomalies_iqr(executor, parquet_path, k=k, group_col=group_col)
                     latency = _time.time() - t0
                     concise = make_concise_answer(result, {"analytics": "anomalies_iqr"})
                     (console.print(concise) if console else print(concise))
@@ -552,7 +923,7 @@ def main(argv=None):
                     (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
                     _render_result(console, "daily outliers by IQR", result)
                     if args.save_run:
-                        reporter = Reporter()
+                        reporter = Reporter(context=run_context, profiler=session.executor.profiler)
                         expl = summarize_answer(question, f"--analytics: anomalies_iqr (k={k})", result, args.model) or ""
                         hypo = generate_hypotheses(question, expl or f"anomalies_iqr (k={k})", args.model) or ""
                         caveats = build_caveats(result, {"analytics": "anomalies_iqr", "profile": prof})
@@ -570,19 +941,20 @@ def main(argv=None):
                 if tool == 'sudden_shifts':
                     window = int(params.get('window', 7))
                     sigma = float(params.get('sigma', 3.0))
+                    group_col = params.get('group_col') if params.get('group_col') in set(_SEGMENT_ALIASES.values()) else None
                     t0 = _time.time()
-                    result = sudden_shifts(executor, parquet_path, window=window, sigma=sigma)
+                    result = sudden_shifts(executor, parquet_path, window=window, sigma=sigma, group_col=group_col)
                     latency = _time.time() - t0
                     concise = make_concise_answer(result, {"analytics": "sudden_shifts"})
                     (console.print(concise) if console else print(concise))
-                    htxt = f"Heuristic: LLM planner tool='sudden_shifts' (window={window}, sigma={sigma})"
+                    htxt = f"Heuristic: LLM planner tool='sudden_shifts' (window={window}, sigma={sigma}, group_col={group_col})"
                     llm_txt = f"LLM(planner): model={args.model}, used={'YES' if os.environ.get('OPENAI_API_KEY') else 'NO'}"
                     (console.print(Panel.fit(htxt)) if console else print(htxt))
                     (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
-                    _render_result(console, f"sudden shifts (window={window}, sigma={sigma})", result)
+                    _render_result(console, f"sudden shifts (window={window}, sigma={sigma})" + (f" per {group_col}" if group_col else ""), result)
                     if args.save_run:
-                        reporter = Reporter()
-                        expl = summarize_answer(question, f"--analytics: sudden_shifts (window={window}, sigma={sigma})", result, args.model) or ""
+                        reporter = Reporter(context=run_context, profiler=session.executor.profiler)
+                        expl = summarize_answer(question, f"--analytics: sudden_shifts (window={window}, sigma={sigma}, group_col={group_col})", result, args.model) or ""
                         hypo = generate_hypotheses(question, expl or f"sudden_shifts (window={window}, sigma={sigma})", args.model) or ""
                         caveats = build_caveats(result, {"analytics": "sudden_shifts", "profile": prof})
                         missing_note = "Missing-value handling: COALESCE(scheduled_quantity,0) for totals."
@@ -590,10 +962,10 @@ def main(argv=None):
                             f"Question: {question}\n\n"
                             + (expl + "\n\n" if expl else "")
                             + ("Hypotheses:\n" + hypo + "\n\n" if hypo else "")
-                            + f"Notes: sudden shifts (window={window}, sigma={sigma})\n- {missing_note}\n"
+                            + f"Notes: sudden shifts (window={window}, sigma={sigma}, group_col={group_col})\n- {missing_note}\n"
                             + ("\n".join(f"- {c}" for c in caveats))
                         )
-                        plan = {"intent": "analytic", "notes": "sudden_shifts", "params": {"window": window, "sigma": sigma}, "pseudo": "daily totals -> rolling mean/std -> |x-mean|/std >= sigma"}
+                        plan = {"intent": "analytic", "notes": "sudden_shifts", "params": {"window": window, "sigma": sigma, "group_col": group_col}, "pseudo": "daily totals -> rolling mean/std -> |x-mean|/std >= sigma"}
                         reporter.save_artifacts(plan, None, result, summary, latency_sec=latency)
                     return 0
                 if tool == 'trends':
@@ -609,7 +981,7 @@ def main(argv=None):
                     (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
                     _render_result(console, f"trends summary by {by}", result)
                     if args.save_run:
-                        reporter = Reporter()
+                        reporter = Reporter(context=run_context, profiler=session.executor.profiler)
                         expl = summarize_answer(question, f"--analytics: trends_summary (by={by})", result, args.model) or ""
                         hypo = generate_hypotheses(question, expl or f"trends (by={by})", args.model) or ""
                         caveats = build_caveats(result, {"analytics": "trends", "profile": prof})
@@ -625,31 +997,54 @@ def main(argv=None):
                         reporter.save_artifacts(plan, None, result, summary, latency_sec=latency)
                     return 0
             # If still unknown, inform user
-            msg = "I can: anomalies vs category, correlations, clustering, trends, seasonality, top trending, preview, sums, distincts, group-bys, and top-N by a column."
+            msg = "I can: anomalies vs category, correlations, clustering, trends, seasonality, decomposition, forecasting, top trending, preview, sums, distincts, group-bys, and top-N by a column."
             if parsed.suggestions:
                 msg += "\nDid you mean one of these columns? " + ", ".join(parsed.suggestions[:5])
             (console.print(Panel.fit(msg)) if console else print(msg))
             return 1
 
         # Deterministic rule-based
-        sql, params = build_sql(parquet_path, parsed.plan, schema)
+        approx = (args.approx or bool(re.search(r"\bapprox\s*=\s*(1|true|yes)", ql))) and not re.search(r"\bapprox\s*=\s*(0|false|no)", ql)
+        refine = args.refine or bool(re.search(r"\brefine\s*=\s*(1|true|yes)", ql))
+        exact_sql, exact_params = build_sql(parquet_path, parsed.plan, schema)
+        approx_sql = None
+        sample_stats: Dict[str, int] = {}
+        if approx and executor.samples is not None:
+            if not os.path.exists(executor.samples.sample_file(parquet_path)):
+                msg = "Building the stratified sample (pipeline x month; one-time per dataset version) ..."
+                (console.print(Panel.fit(msg)) if console else print(msg))
+            alias = approx_relation(executor, parquet_path)
+            approx_sql = build_approx_sql(alias, parsed.plan, schema) if alias else None
+            if approx_sql is None:
+                msg = "Approximate mode covers sums, row counts, group totals and top-N; running the exact query."
+                (console.print(Panel.fit(msg)) if console else print(msg))
+            else:
+                sample_stats = executor.samples.stats(executor, parquet_path)
+        sql, params = approx_sql or (exact_sql, exact_params)
         if console:
-            console.print(Panel.fit("Executed SQL:"))
+            console.print(Panel.fit("Executed SQL" + (" (approximate, stratified sample):" if approx_sql else ":")))
             console.print(sql)
         else:
-            print("Executed SQL:\n" + sql)
+            print("Executed SQL" + (" (approximate, stratified sample):" if approx_sql else ":") + "\n" + sql)
         t0 = _time.time()
-        result = executor.query(sql, params)
+        # Stream the result; only the head shown/saved is kept in memory and the rest is never read
+        head = read_head(executor.query_batches(sql, params), count_rest=False)
+        result = head.table
         latency = _time.time() - t0
-        concise = make_concise_answer(result, {"intent": parsed.intent})
+        concise = make_concise_answer(result, {"intent": parsed.intent, "approx": approx_sql is not None})
         (console.print(concise) if console else print(concise))
         htxt = f"Heuristic: deterministic rule plan ({parsed.notes})"
+        if approx_sql:
+            htxt += f" APPROXIMATE from a {sample_stats.get('sample', 0):,}-row stratified sample of {sample_stats.get('population', 0):,} rows (95% CI)"
         llm_txt = f"LLM(explain): model={args.model}, enabled={'YES' if os.environ.get('OPENAI_API_KEY') else 'NO'}"
         (console.print(Panel.fit(htxt)) if console else print(htxt))
         (console.print(Panel.fit(llm_txt)) if console else print(llm_txt))
-        _render_result(console, parsed.notes, result)
+        _render_result(console, f"{parsed.notes} (APPROXIMATE, 95% CI)" if approx_sql else parsed.notes, result)
+        if head.truncated:
+            more = f"{'' if head.complete else 'at least '}{head.total_rows} rows in result; showing the first {min(20, result.num_rows)}"
+            (console.print(more) if console else print(more))
         if args.save_run:
-            reporter = Reporter()
+            reporter = Reporter(context=run_context, profiler=session.executor.profiler)
             plan_dict = {
                 "intent": parsed.intent,
                 "notes": parsed.notes,
@@ -659,30 +1054,87 @@ def main(argv=None):
                     "aggregations": parsed.plan.aggregations,
                     "limit": parsed.plan.limit,
                 },
+                "result_cache": session.cache_stats(),
+                "result_rows": head.total_rows,
+                "result_rows_complete": head.complete,
             }
+            if approx_sql:
+                plan_dict["approx"] = {"strata": ["pipeline_name", "month"], "sample": sample_stats, "confidence": 0.95, "refine": refine}
             expl = summarize_answer(question, sql, result, args.model) or ""
-            caveats = build_caveats(result, {"profile": prof})
+            caveats = build_caveats(result, {"profile": prof, "approx": approx_sql is not None})
             # Optional hypothesis generation
             hypo = generate_hypotheses(question, expl or parsed.notes, args.model) or ""
-            summary = f"Question: {question}\n\n" + (expl + "\n\n" if expl else "") + ("Hypotheses:\n" + hypo + "\n\n" if hypo else "") + f"Notes: {parsed.notes}\n" + ("\n".join(f"- {c}" for c in caveats))
+            label = (
+                f"**APPROXIMATE**: estimated from a stratified sample ({sample_stats.get('sample', 0):,} of {sample_stats.get('population', 0):,} rows, "
+                "strata pipeline_name x month); `*_ci_low`/`*_ci_high` are 95% confidence intervals.\n\n"
+            ) if approx_sql else ""
+            summary = label + f"Question: {question}\n\n" + (expl + "\n\n" if expl else "") + ("Hypotheses:\n" + hypo + "\n\n" if hypo else "") + f"Notes: {parsed.notes}\n" + ("\n".join(f"- {c}" for c in caveats))
             run_dir = reporter.save_artifacts(plan_dict, sql, result, markdown_summary=summary, latency_sec=latency)
             if console:
                 console.print(Panel.fit(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)"))
             else:
                 print(f"Artifacts saved to {run_dir} (Latency: {latency:.2f}s)")
+        if approx_sql and refine:
+            # Exact answer on its own cursor; the approximate one is already on screen
+            refiner = executor.cursor()
+            saved_to = run_dir if args.save_run else None
+
+            def _refine() -> None:
+                t1 = _time.time()
+                try:
+                    exact = read_head(refiner.query_batches(exact_sql, exact_params)).table
+                except Exception as e:
+                    msg = f"Exact refinement failed: {e}"
+                    (console.print(Panel.fit(msg)) if console else print(msg))
+                    return
+                finally:
+                    refiner.close()
+                took = _time.time() - t1
+                _render_result(console, f"{parsed.notes} (EXACT, refined in {took:.2f}s)", exact)
+                if saved_to:
+                    Reporter(context=run_context).save_extra(saved_to, "results_exact.json", exact, note=f"Exact result (refined in {took:.2f}s): results_exact.json")
+
+            worker = threading.Thread(target=_refine, name="refine-exact", daemon=True)
+            worker.start()
+            refinements.append(worker)
         return 0
 
+    def run_guarded(question: str) -> int:
+        # Timeouts and Ctrl-C abort the current question only; the session stays usable
+        if session.executor.profiler is not None:
+            # profile.json covers the queries of this question only
+            session.executor.profiler.reset()
+        try:
+            return run_once(question)
+        except QueryTimeout as e:
+            msg = f"{e}. Narrow the question (e.g. add a year or state) or raise --timeout-sec."
+            (console.print(Panel.fit(msg)) if console else print(msg))
+            return 3
+        except (QueryCancelled, KeyboardInterrupt):
+            session.executor.interrupt()
+            (console.print(Panel.fit("Cancelled.")) if console else print("Cancelled."))
+            return 130
+
     # Non-interactive
     if args.query:
-        code = run_once(args.query)
+        code = run_guarded(args.query)
+        for worker in refinements:
+            worker.join()
+        session.close()
         sys.exit(code)
 
-    # Interactive loop
-    while True:
-        q = Prompt.ask("Ask a question (:exit to quit)") if Prompt else input("Q (:exit to quit): ")
-        if q.strip().lower() in {":exit", ":quit", "exit", "quit"}:
-            break
-        run_once(q)
+    # Interactive loop (one warm session for all follow-up questions)
+    with session:
+        while True:
+            try:
+                q = Prompt.ask("Ask a question (:exit to quit)") if Prompt else input("Q (:exit to quit): ")
+            except (KeyboardInterrupt, EOFError):
+                break
+            if q.strip().lower() in {":exit", ":quit", "exit", "quit"}:
+                break
+            run_guarded(q)
+        for worker in refinements:
+            worker.join()
 
 
 if __name__ == "__main__":
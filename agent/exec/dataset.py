@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import glob
+import os
+import re
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+DAY_COLUMN = "eff_gas_day"
+DEFAULT_TABLE = "pipeline_data"
+DUCKDB_EXTENSIONS = (".duckdb", ".db")
+SORT_KEYS = ["eff_gas_day", "pipeline_name"]
+_GLOB_CHARS = re.compile(r"[*?\[]")
+_HIVE_PART = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*)=(.*)$")
+
+DayRange = Tuple[Optional[str], Optional[str]]  # inclusive ISO dates, either side open
+
+
+def is_glob(path: str) -> bool:
+    return bool(_GLOB_CHARS.search(path))
+
+
+def _hive_values(file_path: str) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    for part in os.path.dirname(file_path).split(os.sep):
+        m = _HIVE_PART.match(part)
+        if m:
+            out[m.group(1)] = m.group(2)
+    return out
+
+
+def _partition_day_bounds(values: Dict[str, str]) -> Optional[Tuple[date, date]]:
+    """Day span implied by year=/month=/eff_gas_day= partition directories, if any."""
+    try:
+        if DAY_COLUMN in values:
+            d = date.fromisoformat(values[DAY_COLUMN][:10])
+            return d, d
+        if "year" in values:
+            y = int(values["year"])
+            if "month" in values:
+                m = int(values["month"])
+                last = date(y + (m == 12), m % 12 + 1, 1).toordinal() - 1
+                return date(y, m, 1), date.fromordinal(last)
+            return date(y, 1, 1), date(y, 12, 31)
+    except ValueError:
+        return None
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _footer_day_bounds(file_path: str, size: int, mtime_ns: int) -> Optional[Tuple[date, date]]:
+    # Keyed on size/mtime so rewritten files are re-read; only the footer is touched
+    try:
+        import pyarrow.parquet as pq  # type: ignore
+        md = pq.ParquetFile(file_path).metadata
+        idx = md.schema.names.index(DAY_COLUMN)
+        lo: Optional[date] = None
+        hi: Optional[date] = None
+        for rg in range(md.num_row_groups):
+            st = md.row_group(rg).column(idx).statistics
+            if st is None or not st.has_min_max:
+                return None
+            mn, mx = st.min, st.max
+            mn = mn.date() if hasattr(mn, "date") else mn
+            mx = mx.date() if hasattr(mx, "date") else mx
+            lo = mn if lo is None or mn < lo else lo
+            hi = mx if hi is None or mx > hi else hi
+        return (lo, hi) if lo is not None and hi is not None else None
+    except Exception:
+        return None
+
+
+def file_day_bounds(file_path: str) -> Optional[Tuple[date, date]]:
+    """Day span of one parquet file from its partition directories, else its footer statistics."""
+    bounds = _partition_day_bounds(_hive_values(file_path))
+    if bounds is None:
+        st = os.stat(file_path)
+        bounds = _footer_day_bounds(file_path, st.st_size, st.st_mtime_ns)
+    return bounds
+
+
+@dataclass(frozen=True)
+class ParquetDataset:
+    """A parquet source: one file, a glob, or a (hive-partitioned) directory of files."""
+
+    path: str
+    pattern: str
+    hive_keys: Tuple[str, ...] = ()
+
+    @property
+    def multi_file(self) -> bool:
+        return self.pattern != self.path or is_glob(self.pattern)
+
+    def files(self) -> List[str]:
+        if not self.multi_file:
+            return [self.path]
+        return sorted(glob.glob(self.pattern, recursive=True))
+
+    def files_for_days(self, day_range: DayRange) -> List[str]:
+        """Files that may hold rows in the inclusive day range (partition dirs first, then footer stats)."""
+        try:
+            lo = date.fromisoformat(day_range[0][:10]) if day_range[0] else None
+            hi = date.fromisoformat(day_range[1][:10]) if day_range[1] else None
+        except ValueError:
+            return self.files()
+        keep: List[str] = []
+        for f in self.files():
+            bounds = file_day_bounds(f)
+            if bounds is not None and ((lo and bounds[1] < lo) or (hi and bounds[0] > hi)):
+                continue
+            keep.append(f)
+        return keep
+
+    def options_sql(self) -> str:
+        if not self.multi_file:
+            return ""
+        hive = "true" if self.hive_keys else "false"
+        return f", hive_partitioning = {hive}, union_by_name = true"
+
+    def relation(self, day_range: Optional[DayRange] = None) -> Tuple[str, List[Any]]:
+        """`read_parquet(...)` FROM-clause and params, pruned to files overlapping `day_range`."""
+        target: Any = self.pattern
+        if self.multi_file and day_range is not None:
+            files = self.files_for_days(day_range)
+            if files:
+                target = files
+        return f"read_parquet(?{self.options_sql()})", [target]
+
+    def relation_inline(self) -> str:
+        # For DDL (CREATE VIEW ...) where prepared parameters are not allowed
+        path_sql = self.pattern.replace("'", "''")
+        return f"read_parquet('{path_sql}'{self.options_sql()})"
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+@dataclass(frozen=True)
+class DuckDBTable:
+    """A dataset imported into a persistent DuckDB file, queried by table name."""
+
+    path: str
+    table: str = DEFAULT_TABLE
+
+    @property
+    def catalog(self) -> str:
+        # DuckDB names a database opened or attached without an alias after its file stem
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    @property
+    def multi_file(self) -> bool:
+        return False
+
+    def files(self) -> List[str]:
+        return [self.path]
+
+    def qualified_name(self) -> str:
+        return f"{_quote(self.catalog)}.main.{_quote(self.table)}"
+
+    def relation(self, day_range: Optional[DayRange] = None) -> Tuple[str, List[Any]]:
+        # Day filters are pruned by DuckDB's zonemaps (effective when imported sorted by day)
+        return self.qualified_name(), []
+
+    def relation_inline(self) -> str:
+        return self.qualified_name()
+
+
+DatasetSource = Union[ParquetDataset, DuckDBTable]
+
+
+def is_duckdb_file(path: str) -> bool:
+    return path.endswith(DUCKDB_EXTENSIONS)
+
+
+@lru_cache(maxsize=64)
+def resolve_dataset(path: str) -> DatasetSource:
+    if is_duckdb_file(path):
+        return DuckDBTable(path=path)
+    if os.path.isdir(path):
+        pattern = os.path.join(path, "**", "*.parquet")
+    else:
+        pattern = path
+    hive_keys: List[str] = []
+    if pattern != path or is_glob(pattern):
+        for f in glob.glob(pattern, recursive=True):
+            for k in _hive_values(f):
+                if k not in hive_keys:
+                    hive_keys.append(k)
+            if hive_keys:
+                break
+    return ParquetDataset(path=path, pattern=pattern, hive_keys=tuple(hive_keys))
+
+
+def scan_relation(parquet_path: str, day_range: Optional[DayRange] = None) -> Tuple[str, List[Any]]:
+    return resolve_dataset(parquet_path).relation(day_range)
+
+
+def intersect_day_ranges(a: Optional[DayRange], b: Optional[DayRange]) -> Optional[DayRange]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    lo = max([x for x in (a[0], b[0]) if x], default=None)
+    hi = min([x for x in (a[1], b[1]) if x], default=None)
+    return lo, hi
+
+
+def day_range_from_filter(op: str, value: Any) -> Optional[DayRange]:
+    """Inclusive day range implied by a filter on the day column (None when it cannot prune)."""
+    op = op.upper()
+    try:
+        if op == "BETWEEN" and isinstance(value, list) and len(value) == 2:
+            return str(value[0]), str(value[1])
+        if op == "=":
+            return str(value), str(value)
+        if op in (">", ">="):
+            return str(value), None
+        if op in ("<", "<="):
+            return None, str(value)
+    except Exception:
+        return None
+    return None
+
+
+def import_to_duckdb(
+    src_path: str,
+    db_path: str,
+    table: str = DEFAULT_TABLE,
+    sort: bool = True,
+    settings: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Import a parquet dataset into a persistent DuckDB file as `table`. With `sort`, rows are
+    ordered by (eff_gas_day, pipeline_name) so DuckDB's per-block zonemaps can skip day ranges.
+    The source fingerprint is stored alongside so stale imports can be detected.
+    `settings` are DuckDB connection settings (see DuckDBConfig.settings) bounding the import.
+    """
+    import duckdb
+
+    from agent.utils.fingerprint import dataset_fingerprint
+
+    src = resolve_dataset(src_path)
+    source_sql, params = src.relation()
+    fp = dataset_fingerprint(src_path)
+    con = duckdb.connect(database=db_path, config=settings or {})
+    try:
+        columns = [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {source_sql}", params).fetchall()]
+        order = ", ".join(_quote(c) for c in SORT_KEYS if c in columns) if sort else ""
+        con.execute(
+            f"CREATE OR REPLACE TABLE {_quote(table)} AS SELECT * FROM {source_sql}" + (f" ORDER BY {order}" if order else ""),
+            params,
+        )
+        con.execute("CREATE OR REPLACE TABLE _import_meta AS SELECT ? AS source, ? AS fingerprint, ? AS sorted, ? AS table_name", [os.path.abspath(src_path), fp, bool(order), table])
+        rows = con.execute(f"SELECT COUNT(*) FROM {_quote(table)}").fetchone()[0]
+        con.execute("CHECKPOINT")
+    finally:
+        con.close()
+    return {"source": src_path, "db": db_path, "table": table, "rows": int(rows), "sorted": bool(order), "fingerprint": fp}
+
+
+def imported_fingerprint(db_path: str) -> Optional[str]:
+    """Fingerprint of the source recorded by `import_to_duckdb`, or None if missing/unreadable."""
+    import duckdb
+
+    if not os.path.exists(db_path):
+        return None
+    try:
+        con = duckdb.connect(database=db_path, read_only=True)
+        try:
+            row = con.execute("SELECT fingerprint FROM _import_meta").fetchone()
+        finally:
+            con.close()
+        return row[0] if row else None
+    except Exception:
+        return None
@@ -1,33 +1,278 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 import duckdb
+import pyarrow as pa
+
+from agent.exec.profiling import QueryProfiler
+from agent.exec.result_cache import ResultCache, is_cacheable
+from agent.exec.streaming import on_release
+from agent.utils.fingerprint import dataset_fingerprint
 
 
 @dataclass
 class DuckDBConfig:
-    timeout_sec: int = 30
+    timeout_sec: int = 30  # per-query deadline; <= 0 disables the watchdog
+    database: str = ":memory:"  # or a persistent .duckdb file (see agent.exec.dataset.DuckDBTable)
+    read_only: bool = False
+    # Resource controls, applied when the connection is created; None keeps DuckDB's default
+    threads: Optional[int] = None
+    memory_limit: Optional[str] = None  # e.g. "4GB"
+    temp_directory: Optional[str] = None  # where operators spill when over memory_limit
+    preserve_insertion_order: Optional[bool] = None  # false lets large sorts/aggregates spill
+
+    @classmethod
+    def from_env(cls, **overrides: Any) -> "DuckDBConfig":
+        """Config from DUCKDB_THREADS / DUCKDB_MEMORY_LIMIT / DUCKDB_TEMP_DIRECTORY / DUCKDB_PRESERVE_INSERTION_ORDER; None overrides are ignored."""
+        cfg = cls()
+        threads = os.environ.get("DUCKDB_THREADS")
+        if threads:
+            cfg.threads = int(threads)
+        cfg.memory_limit = os.environ.get("DUCKDB_MEMORY_LIMIT") or None
+        cfg.temp_directory = os.environ.get("DUCKDB_TEMP_DIRECTORY") or None
+        order = os.environ.get("DUCKDB_PRESERVE_INSERTION_ORDER")
+        if order:
+            cfg.preserve_insertion_order = order.strip().lower() not in ("0", "false", "no", "off")
+        for name, value in overrides.items():
+            if value is not None:
+                setattr(cfg, name, value)
+        return cfg
+
+    def settings(self) -> Dict[str, Any]:
+        """DuckDB connection settings for the resource controls that are set."""
+        out: Dict[str, Any] = {}
+        if self.threads is not None:
+            out["threads"] = self.threads
+        if self.memory_limit:
+            out["memory_limit"] = self.memory_limit
+        if self.temp_directory:
+            out["temp_directory"] = self.temp_directory
+        if self.preserve_insertion_order is not None:
+            out["preserve_insertion_order"] = self.preserve_insertion_order
+        return out
+
+
+DEFAULT_BATCH_ROWS = 65_536
+
+# Reported in plan.json so runs can be compared under the limits they actually ran with
+EFFECTIVE_SETTINGS = ("threads", "memory_limit", "temp_directory", "preserve_insertion_order")
+
+
+class QueryTimeout(TimeoutError):
+    def __init__(self, timeout_sec: float, sql: str):
+        super().__init__(f"Query exceeded timeout of {timeout_sec}s and was interrupted")
+        self.timeout_sec = timeout_sec
+        self.sql = sql
+
+
+class QueryCancelled(Exception):
+    def __init__(self, sql: str):
+        super().__init__("Query cancelled")
+        self.sql = sql
 
 
 class DuckDBExecutor:
-    def __init__(self, config: Optional[DuckDBConfig] = None):
+    def __init__(self, config: Optional[DuckDBConfig] = None, connection: Optional[duckdb.DuckDBPyConnection] = None):
         self.config = config or DuckDBConfig()
-        self._con = duckdb.connect(database=':memory:')
+        if connection is None:
+            connection = duckdb.connect(database=self.config.database, read_only=self.config.read_only, config=self.config.settings())
+        self._con = connection
+        # Optional RollupStore; analytics read pre-aggregated tables through it when set
+        self.rollups: Optional[Any] = None
+        # Optional DailySeriesStore; time-series analytics share one daily aggregate through it
+        self.series: Optional[Any] = None
+        # Optional MaterializedRelations; expensive intermediate relations built once per parameter slice
+        self.materialized: Optional[Any] = None
+        # Optional SampleStore; approximate answers read its stratified sample
+        self.samples: Optional[Any] = None
+        # Optional ResultCache; keyed on the fingerprint of `dataset_path`
+        self.result_cache: Optional[ResultCache] = None
+        self.dataset_path: Optional[str] = None
+        # Optional QueryProfiler; set through enable_profiling()
+        self.profiler: Optional[QueryProfiler] = None
+        self._stream_timer: Optional[threading.Timer] = None
+
+    def enable_profiling(self, profiler: Optional[QueryProfiler] = None) -> QueryProfiler:
+        """Capture DuckDB's operator-level profile of every statement this executor runs."""
+        self.profiler = profiler or QueryProfiler()
+        self.profiler.enable(self._con)
+        return self.profiler
 
     def query(self, sql: str, params: Optional[List[Any]] = None):
-        # DuckDB Python API doesn't expose per-query timeout directly; callers should control complexity
-        result = self._con.execute(sql, params or [])
+        key = self._cache_key(sql, params)
+        if key is not None:
+            cached = self.result_cache.get(key)  # type: ignore[union-attr]
+            if cached is not None:
+                if self.profiler is not None:
+                    self.profiler.record_cache_hit(sql, params)
+                return cached
+        tbl = self._execute_with_deadline(sql, params)
+        if key is not None and isinstance(tbl, pa.Table):
+            self.result_cache.put(key, tbl)  # type: ignore[union-attr]
+        return tbl
+
+    def query_batches(self, sql: str, params: Optional[List[Any]] = None, batch_rows: int = DEFAULT_BATCH_ROWS) -> pa.RecordBatchReader:
+        """
+        Stream the result as record batches instead of materializing it. The timeout covers the
+        whole stream; results that fit the result cache budget are cached once fully read.
+        """
+        key = self._cache_key(sql, params)
+        if key is not None:
+            cached = self.result_cache.get(key)  # type: ignore[union-attr]
+            if cached is not None:
+                if self.profiler is not None:
+                    self.profiler.record_cache_hit(sql, params)
+                return cached.to_reader(max_chunksize=batch_rows)
+        timed_out = threading.Event()
+        timer = self._arm_watchdog(timed_out)
         try:
-            return result.fetch_arrow_table()
-        except Exception:
-            return result.fetchall()
+            reader = self._con.execute(sql, params or []).to_arrow_reader(batch_rows)
+        except BaseException as e:
+            if timer is not None:
+                timer.cancel()
+            self._raise_interrupt(e, sql, timed_out)
+            raise
+        # Until the stream ends, is closed (close_reader) or dropped, the next statement on the connection disarms the watchdog
+        self._stream_timer = timer
+
+        def _disarm() -> None:
+            if timer is not None:
+                timer.cancel()
+            if self._stream_timer is timer:
+                self._stream_timer = None
+
+        def _stream():
+            budget = self.result_cache.max_bytes if key is not None else 0  # type: ignore[union-attr]
+            kept: List[pa.RecordBatch] = []
+            size = 0
+            try:
+                for batch in reader:
+                    if budget:
+                        size += batch.nbytes
+                        if size <= budget:
+                            kept.append(batch)
+                        else:
+                            kept, budget = [], 0
+                    yield batch
+            except BaseException as e:
+                self._raise_interrupt(e, sql, timed_out)
+                raise
+            finally:
+                _disarm()
+            if self.profiler is not None:
+                # The profile is complete only once the stream is exhausted
+                self.profiler.capture(self._con, sql, params)
+            if budget:
+                self.result_cache.put(key, pa.Table.from_batches(kept, schema=reader.schema))  # type: ignore[union-attr,arg-type]
+
+        stream = _stream()
+
+        def _release() -> None:
+            # Closing a started generator runs its finally; one never started is disarmed here
+            stream.close()
+            _disarm()
+            reader.close()
+
+        return on_release(pa.RecordBatchReader.from_batches(reader.schema, stream), _release)
+
+    def _arm_watchdog(self, timed_out: threading.Event) -> Optional[threading.Timer]:
+        # DuckDB has no per-query timeout; a watchdog thread interrupts the connection instead
+        if self._stream_timer is not None:
+            self._stream_timer.cancel()
+            self._stream_timer = None
+        if not self.config.timeout_sec or self.config.timeout_sec <= 0:
+            return None
+
+        def _expire() -> None:
+            timed_out.set()
+            self._con.interrupt()
+
+        timer = threading.Timer(self.config.timeout_sec, _expire)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def _raise_interrupt(self, e: BaseException, sql: str, timed_out: threading.Event) -> None:
+        """Re-raise DuckDB interrupts as QueryTimeout/QueryCancelled; other errors are left to the caller."""
+        if isinstance(e, duckdb.InterruptException):
+            if timed_out.is_set():
+                raise QueryTimeout(self.config.timeout_sec, sql) from e
+            raise QueryCancelled(sql) from e
+        if isinstance(e, KeyboardInterrupt):
+            self._con.interrupt()
+            raise QueryCancelled(sql) from e
+        # Ctrl-C while DuckDB is executing surfaces as "Query interrupted"
+        if isinstance(e, RuntimeError) and "interrupted" in str(e).lower():
+            raise QueryCancelled(sql) from e
+
+    def _execute_with_deadline(self, sql: str, params: Optional[List[Any]]):
+        timed_out = threading.Event()
+        timer = self._arm_watchdog(timed_out)
+        try:
+            result = self._con.execute(sql, params or [])
+            try:
+                out = result.fetch_arrow_table()
+            except duckdb.InterruptException:
+                raise
+            except Exception:
+                out = result.fetchall()
+            if self.profiler is not None:
+                self.profiler.capture(self._con, sql, params)
+            return out
+        except BaseException as e:
+            self._raise_interrupt(e, sql, timed_out)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    def effective_settings(self) -> Dict[str, str]:
+        rows = self._con.execute(
+            "SELECT name, value FROM duckdb_settings() WHERE name IN (SELECT unnest(?))", [list(EFFECTIVE_SETTINGS)]
+        ).fetchall()
+        return {name: value for name, value in rows}
+
+    def interrupt(self) -> None:
+        self._con.interrupt()
+
+    def cursor(self) -> "DuckDBExecutor":
+        """
+        Executor on a new cursor (a separate connection to the same database) sharing the rollup
+        store, daily series store, materialized relations, sample store and result cache. Attached databases are shared; TEMP views are not.
+        """
+        child = DuckDBExecutor(self.config, connection=self._con.cursor())
+        child.rollups = self.rollups
+        child.series = self.series
+        child.materialized = self.materialized
+        child.samples = self.samples
+        child.result_cache = self.result_cache
+        child.dataset_path = self.dataset_path
+        if self.profiler is not None:
+            child.enable_profiling(self.profiler)
+        return child
+
+    def _cache_key(self, sql: str, params: Optional[List[Any]]) -> Optional[str]:
+        if self.result_cache is None or not self.dataset_path or not is_cacheable(sql):
+            return None
+        try:
+            fp = dataset_fingerprint(self.dataset_path)
+        except OSError:
+            return None
+        return ResultCache.make_key(sql, params, fp)
 
     def read_parquet(self, path: str, columns: Optional[List[str]] = None, where: Optional[str] = None, limit: Optional[int] = None):
+        from agent.exec.dataset import scan_relation
+
         projection = ", ".join(columns) if columns else "*"
-        sql = f"SELECT {projection} FROM read_parquet(?)"
-        params: List[Any] = [path]
+        source_sql, params = scan_relation(path)
+        sql = f"SELECT {projection} FROM {source_sql}"
         if where:
             sql += f" WHERE {where}"
         if limit is not None:
@@ -35,3 +280,72 @@ class DuckDBExecutor:
             params.append(limit)
         return self.query(sql, params)
 
+    def close(self) -> None:
+        self._con.close()
+
+
+@contextmanager
+def writable_executor(executor: DuckDBExecutor, parquet_path: str) -> Iterator[DuckDBExecutor]:
+    """
+    Executor that can create cache files (rollups, samples) over the dataset: `executor` itself,
+    unless its connection is read-only (`--db`). Then a short-lived in-memory connection with the
+    same resource settings, the dataset's database attached READ_ONLY under the catalog name the
+    dataset SQL uses, closed on exit.
+    """
+    if not executor.config.read_only:
+        yield executor
+        return
+    from agent.exec.dataset import DuckDBTable, resolve_dataset
+
+    builder = DuckDBExecutor(replace(executor.config, database=":memory:", read_only=False, timeout_sec=0))
+    try:
+        ds = resolve_dataset(parquet_path)
+        if isinstance(ds, DuckDBTable):
+            path_sql = os.path.abspath(ds.path).replace("'", "''")
+            catalog = '"' + ds.catalog.replace('"', '""') + '"'
+            builder.query(f"ATTACH '{path_sql}' AS {catalog} (READ_ONLY)")
+        yield builder
+    finally:
+        builder.close()
+
+
+class AsyncDuckDBExecutor:
+    """
+    asyncio front-end over a DuckDBExecutor. Every call gets its own cursor and runs in a worker
+    thread, so independent queries (or whole analytics) execute concurrently on one database.
+    """
+
+    def __init__(self, executor: DuckDBExecutor, max_workers: int = 4) -> None:
+        self.executor = executor
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="duckdb")
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Await `fn(cursor_executor, *args, **kwargs)`; cancelling the task interrupts its query."""
+        cur = self.executor.cursor()
+
+        def _call() -> Any:
+            try:
+                return fn(cur, *args, **kwargs)
+            finally:
+                cur.close()
+
+        fut = self._pool.submit(_call)
+        try:
+            return await asyncio.wrap_future(fut)
+        except asyncio.CancelledError:
+            if not fut.done():
+                cur.interrupt()
+            raise
+
+    async def query(self, sql: str, params: Optional[List[Any]] = None) -> Any:
+        return await self.run(lambda ex: ex.query(sql, params))
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+    async def __aenter__(self) -> "AsyncDuckDBExecutor":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        # Waiting for in-flight queries must not block the event loop
+        await asyncio.to_thread(self.close)
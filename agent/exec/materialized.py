@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.exec.duck import DuckDBExecutor
+from agent.utils.fingerprint import dataset_fingerprint
+
+SCRATCH_DB = "synmax_scratch"
+
+
+class MaterializedRelations:
+    """
+    Intermediate relations materialized once per (name, parameters, dataset version) as tables in an
+    in-memory database attached to the executor's connection, so every cursor sees them. Analytics
+    that re-run a cheap final step over an expensive base (e.g. threshold sweeps) read the table
+    instead of rescanning. Least recently used tables are dropped beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 4) -> None:
+        self.max_entries = max_entries
+        self._tables: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()  # key -> (table, fingerprint)
+        self._hits = 0
+        self._misses = 0
+        # Concurrent analytics on cursors build each relation once
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(name: str, parquet_path: str, params: Dict[str, Any]) -> str:
+        return json.dumps([name, parquet_path, params], sort_keys=True, default=str)
+
+    def get(self, executor: DuckDBExecutor, name: str, parquet_path: str, params: Dict[str, Any], build_sql: str, build_params: Optional[List[Any]] = None) -> Optional[str]:
+        """
+        Qualified table holding the result of `build_sql` for these parameters, building it when
+        missing or when the dataset changed since it was built. None on a read-only connection
+        (e.g. `--db`), which cannot attach the scratch database; callers then run `build_sql` inline.
+        """
+        if executor.config.read_only:
+            return None
+        key = self.make_key(name, parquet_path, params)
+        try:
+            fp = dataset_fingerprint(parquet_path)
+        except OSError:
+            fp = ""
+        with self._lock:
+            cached = self._tables.get(key)
+            if cached is not None and cached[1] == fp:
+                self._tables.move_to_end(key)
+                self._hits += 1
+                return cached[0]
+            self._misses += 1
+            digest = hashlib.sha1(f"{key}\0{fp}".encode("utf-8")).hexdigest()[:16]
+            table = f"{SCRATCH_DB}.{name}_{digest}"
+            executor.query(f"ATTACH IF NOT EXISTS ':memory:' AS {SCRATCH_DB}")
+            if cached is not None:
+                executor.query(f"DROP TABLE IF EXISTS {cached[0]}")
+            executor.query(f"CREATE OR REPLACE TABLE {table} AS {build_sql}", build_params)
+            self._tables[key] = (table, fp)
+            self._tables.move_to_end(key)
+            while len(self._tables) > self.max_entries:
+                _, (old, _) = self._tables.popitem(last=False)
+                executor.query(f"DROP TABLE IF EXISTS {old}")
+            return table
+
+    def clear(self, executor: DuckDBExecutor) -> None:
+        with self._lock:
+            for table, _ in self._tables.values():
+                executor.query(f"DROP TABLE IF EXISTS {table}")
+            self._tables.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "entries": len(self._tables)}
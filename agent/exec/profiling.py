@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+# Metrics requested from DuckDB (>= 1.1 honours custom_profiling_settings; older releases emit their defaults)
+PROFILING_METRICS = (
+    "QUERY_NAME",
+    "LATENCY",
+    "ROWS_RETURNED",
+    "CUMULATIVE_ROWS_SCANNED",
+    "TOTAL_BYTES_READ",
+    "RESULT_SET_SIZE",
+    "OPERATOR_TYPE",
+    "OPERATOR_NAME",
+    "OPERATOR_TIMING",
+    "OPERATOR_CARDINALITY",
+    "OPERATOR_ROWS_SCANNED",
+    "EXTRA_INFO",
+)
+HOTSPOTS = 5
+
+
+def _operator(node: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "name": node.get("operator_name") or node.get("name"),
+        "type": node.get("operator_type"),
+        "time_sec": node.get("operator_timing", node.get("timing")),
+        "rows_scanned": node.get("operator_rows_scanned"),
+        "rows_emitted": node.get("operator_cardinality", node.get("cardinality")),
+        "extra_info": node.get("extra_info") or {},
+        "children": [_operator(c) for c in node.get("children", [])],
+    }
+
+
+def _walk(op: Dict[str, Any]):
+    yield op
+    for c in op["children"]:
+        yield from _walk(c)
+
+
+def normalize_profile(raw: Dict[str, Any], sql: str, params: Optional[List[Any]]) -> Dict[str, Any]:
+    """DuckDB's JSON profile as one record: query totals, the operator tree and its slowest operators."""
+    operators = [_operator(c) for c in raw.get("children", [])]
+    flat = [op for root in operators for op in _walk(root)]
+    hotspots = sorted((op for op in flat if op["time_sec"] is not None), key=lambda op: op["time_sec"], reverse=True)[:HOTSPOTS]
+    return {
+        "sql": sql,
+        "params": params or [],
+        "source": "duckdb",
+        "latency_sec": raw.get("latency", raw.get("timing")),
+        "rows_returned": raw.get("rows_returned"),
+        "rows_scanned": raw.get("cumulative_rows_scanned"),
+        "bytes_read": raw.get("total_bytes_read"),
+        "hotspots": [{k: op[k] for k in ("name", "time_sec", "rows_scanned", "rows_emitted")} for op in hotspots],
+        "operators": operators,
+    }
+
+
+class QueryProfiler:
+    """
+    Opt-in capture of DuckDB's profiling output (what EXPLAIN ANALYZE shows) for every statement an
+    executor runs. Profiles accumulate until `reset`; Reporter writes them to profile.json.
+    """
+
+    def __init__(self) -> None:
+        self._profiles: List[Dict[str, Any]] = []
+        self._outputs: Dict[int, str] = {}  # connection id -> profiling_output file (DuckDB < 1.1)
+        # Shared by cursors of an AsyncDuckDBExecutor running in worker threads
+        self._lock = threading.Lock()
+
+    def enable(self, con: Any) -> None:
+        """Turn on profiling for one DuckDB connection (settings are per connection)."""
+        if not hasattr(con, "get_profiling_information"):
+            # DuckDB < 1.1 only writes profiles to a file; each statement overwrites it
+            con.execute("PRAGMA enable_profiling = 'json'")
+            fd, path = tempfile.mkstemp(prefix="duckdb-profile-", suffix=".json")
+            os.close(fd)
+            path_sql = path.replace("'", "''")
+            con.execute(f"PRAGMA profiling_output = '{path_sql}'")
+            self._outputs[id(con)] = path
+        else:
+            con.execute("PRAGMA enable_profiling = 'no_output'")
+            settings = json.dumps({m: "true" for m in PROFILING_METRICS})
+            try:
+                con.execute(f"SET custom_profiling_settings = '{settings}'")
+            except Exception:
+                pass
+
+    def capture(self, con: Any, sql: str, params: Optional[List[Any]]) -> None:
+        """Record the profile of the statement `con` just finished (best effort)."""
+        try:
+            if hasattr(con, "get_profiling_information"):
+                text = con.get_profiling_information(format="json")
+            else:
+                with open(self._outputs[id(con)], "r", encoding="utf-8") as f:
+                    text = f.read()
+            raw = json.loads(text)
+        except Exception:
+            return
+        if not raw.get("children"):
+            return  # DDL / SET / ATTACH: no operator tree to report
+        with self._lock:
+            self._profiles.append(normalize_profile(raw, sql, params))
+
+    def record_cache_hit(self, sql: str, params: Optional[List[Any]]) -> None:
+        with self._lock:
+            self._profiles.append({"sql": sql, "params": params or [], "source": "result_cache"})
+
+    def profiles(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._profiles)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._profiles.clear()
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+
+from agent.utils.fingerprint import cache_root
+
+# Statements whose result can change without the dataset changing are never cached
+_VOLATILE = re.compile(r"\b(sample|random|uuid|gen_random_uuid|now|current_date|current_time|current_timestamp|setseed)\b", re.IGNORECASE)
+_READ_ONLY = re.compile(r"^\s*(select|with|from)\b", re.IGNORECASE)
+
+
+# String literals and quoted identifiers (quotes escaped by doubling), or a run of whitespace
+_QUOTED_OR_SPACE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace outside quotes; 'A  B' and 'A B' stay different keys."""
+    collapsed = _QUOTED_OR_SPACE.sub(lambda m: " " if m.group(0)[0].isspace() else m.group(0), sql)
+    return collapsed.strip().rstrip(";").strip()
+
+
+def is_cacheable(sql: str) -> bool:
+    return bool(_READ_ONLY.match(sql)) and not _VOLATILE.search(sql)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    spills: int = 0
+    evictions: int = 0
+    mem_bytes: int = 0
+    mem_entries: int = 0
+
+
+class ResultCache:
+    """
+    Two-tier cache for query results: an in-memory LRU bounded by bytes, spilling evicted
+    (or oversized) Arrow tables to IPC files on disk. Keys cover normalized SQL, params and
+    the dataset fingerprint, so results are invalidated when the source changes.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, spill_dir: Optional[str] = None, max_spill_bytes: int = 2 * 1024 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir if spill_dir is not None else os.path.join(cache_root(), "results")
+        self.max_spill_bytes = max_spill_bytes
+        self._mem: "OrderedDict[str, pa.Table]" = OrderedDict()
+        self._stats = CacheStats()
+        # Shared by cursors of an AsyncDuckDBExecutor running in worker threads
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def make_key(sql: str, params: Optional[List[Any]], fingerprint: str) -> str:
+        payload = json.dumps([normalize_sql(sql), list(params or []), fingerprint], default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[pa.Table]:
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key: str) -> Optional[pa.Table]:
+        tbl = self._mem.get(key)
+        if tbl is not None:
+            self._mem.move_to_end(key)
+            self._stats.hits += 1
+            return tbl
+        tbl = self._read_spill(key)
+        if tbl is not None:
+            self._stats.disk_hits += 1
+            self._remember(key, tbl)
+            return tbl
+        self._stats.misses += 1
+        return None
+
+    def put(self, key: str, tbl: pa.Table) -> None:
+        with self._lock:
+            if tbl.nbytes > self.max_bytes:
+                self._spill(key, tbl)
+                return
+            self._remember(key, tbl)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            self._stats.mem_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._stats.mem_entries = len(self._mem)
+            return asdict(self._stats)
+
+    def _remember(self, key: str, tbl: pa.Table) -> None:
+        if key in self._mem:
+            self._stats.mem_bytes -= self._mem.pop(key).nbytes
+        self._mem[key] = tbl
+        self._stats.mem_bytes += tbl.nbytes
+        while self._stats.mem_bytes > self.max_bytes and self._mem:
+            old_key, old_tbl = self._mem.popitem(last=False)
+            self._stats.mem_bytes -= old_tbl.nbytes
+            self._stats.evictions += 1
+            self._spill(old_key, old_tbl)
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.arrow")
+
+    def _spill(self, key: str, tbl: pa.Table) -> None:
+        if not self.spill_dir:
+            return
+        path = self._spill_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            tmp = f"{path}.tmp-{os.getpid()}"
+            with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, tbl.schema) as writer:
+                writer.write_table(tbl)
+            os.replace(tmp, path)
+            self._stats.spills += 1
+            self._prune_spill()
+        except Exception:
+            # best-effort spill
+            pass
+
+    def _read_spill(self, key: str) -> Optional[pa.Table]:
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            # The table keeps the mapping alive; buffers are read lazily without copying
+            return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        except Exception:
+            return None
+
+    def _prune_spill(self) -> None:
+        entries = []
+        for name in os.listdir(self.spill_dir):
+            if name.endswith(".arrow"):
+                st = os.stat(os.path.join(self.spill_dir, name))
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_spill_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.spill_dir, name))
+                total -= size
+            except Exception:
+                pass
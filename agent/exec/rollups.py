@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import duckdb
+
+from agent.exec.dataset import scan_relation
+from agent.exec.duck import DuckDBExecutor, writable_executor
+from agent.exec.sql_builder import escape_ident
+from agent.utils.fingerprint import cache_root, dataset_fingerprint, path_key
+
+ROLLUP_VERSION = 3
+# Columns with at most DISTINCT_SET_LIMIT distinct values, and at most DISTINCT_SET_RATIO of their non-null
+# rows, keep an exact value set in the rollup file; the others (quantities, near-unique columns) keep an
+# approx_count_distinct estimate, so the file stays small.
+DISTINCT_SET_LIMIT = 50_000
+DISTINCT_SET_RATIO = 0.1
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RollupSpec:
+    # output column -> SQL expression over the raw dataset
+    dims: Dict[str, str]
+
+
+# Small aggregates shared by the analytics. `total_qty` is always SUM(COALESCE(scheduled_quantity, 0));
+# `n_rows` counts the raw rows behind each group so incremental updates can drop groups that empty out.
+ROLLUPS: Dict[str, RollupSpec] = {
+    "pipeline_daily": RollupSpec(dims={
+        "day": "eff_gas_day::DATE",
+        "pipeline_name": "pipeline_name",
+    }),
+    "segment_monthly": RollupSpec(dims={
+        "month": "date_trunc('month', eff_gas_day)::DATE",
+        "pipeline_name": "pipeline_name",
+        "category_short": "category_short",
+        "state_abb": "state_abb",
+        "loc_name": "loc_name",
+    }),
+}
+
+
+def _projection(name: str, extra_dims: Optional[List[str]] = None, sign: str = "") -> str:
+    spec = ROLLUPS[name]
+    parts = [f"{expr} AS {escape_ident(col)}" for col, expr in spec.dims.items()]
+    for col in extra_dims or []:
+        if col not in spec.dims:
+            parts.append(escape_ident(col))
+    parts.append(f"{sign}COALESCE(scheduled_quantity, 0) AS total_qty")
+    return ", ".join(parts)
+
+
+def raw_projection(parquet_path: str, name: str, extra_dims: Optional[List[str]] = None) -> Tuple[str, List[Any]]:
+    """Row-level projection of the raw dataset with the same columns as rollup `name` (plus extra dims)."""
+    source_sql, params = scan_relation(parquet_path)
+    return f"(SELECT {_projection(name, extra_dims)} FROM {source_sql})", params
+
+
+def _columns(executor: DuckDBExecutor, relation: str, params: Optional[List[Any]] = None) -> List[str]:
+    return [r["column_name"] for r in executor.query(f"DESCRIBE SELECT * FROM {relation}", params).to_pylist()]
+
+
+def _column_counts(executor: DuckDBExecutor, relation: str, columns: List[str], params: Optional[List[Any]] = None) -> Dict[str, Tuple[int, int, int]]:
+    """column -> (rows, nulls, approximate distinct values) in one pass over `relation`."""
+    if not columns:
+        return {}
+    exprs = ", ".join(f"COUNT({escape_ident(c)}) AS c{i}, approx_count_distinct({escape_ident(c)}) AS d{i}" for i, c in enumerate(columns))
+    row = executor.query(f"SELECT COUNT(*) AS n, {exprs} FROM {relation}", params).to_pylist()[0]
+    n = int(row["n"])
+    return {c: (n, n - int(row[f"c{i}"]), int(row[f"d{i}"] or 0)) for i, c in enumerate(columns)}
+
+
+def _insert_distinct_values(executor: DuckDBExecutor, table: str, relation: str, columns: List[str], params: Optional[List[Any]] = None) -> None:
+    """Add the non-null values of `columns` (as VARCHAR) missing from `table`, all columns in one pass."""
+    if not columns:
+        return
+    cast = ", ".join(f"{escape_ident(c)}::VARCHAR AS {escape_ident(c)}" for c in columns)
+    on = ", ".join(escape_ident(c) for c in columns)
+    # UNPIVOT drops NULL values
+    executor.query(
+        f"INSERT INTO {table} SELECT DISTINCT column_name, value FROM (UNPIVOT (SELECT {cast} FROM {relation}) "
+        f"ON {on} INTO NAME column_name VALUE value) EXCEPT SELECT column_name, value FROM {table}",
+        params,
+    )
+
+
+class RollupStore:
+    """
+    Materialized daily/monthly aggregates in a local DuckDB file per dataset path, plus per-column
+    row/null/distinct counts backing the profile (exact value sets for low-cardinality columns). The file records the dataset
+    fingerprint (path + size + mtime) and is rebuilt when the source changes, unless `ingest`
+    folded the change in with `apply_increment`.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None) -> None:
+        self.cache_dir = cache_dir or os.path.join(cache_root(), "rollups")
+        self._attached: Dict[str, Tuple[str, str]] = {}  # source path -> (alias, fingerprint)
+        # Cursors of one database share attachments; serialize checks/builds across threads
+        self._lock = threading.Lock()
+
+    def rollup_file(self, parquet_path: str) -> str:
+        return os.path.join(self.cache_dir, f"{path_key(parquet_path)}.duckdb")
+
+    def ensure(self, executor: DuckDBExecutor, parquet_path: str) -> str:
+        """Attach an up-to-date rollup database to the executor's connection; returns its catalog alias."""
+        with self._lock:
+            return self._ensure(executor, parquet_path)
+
+    def _ensure(self, executor: DuckDBExecutor, parquet_path: str) -> str:
+        fp = dataset_fingerprint(parquet_path)
+        alias = f"rollup_{path_key(parquet_path)}"
+        current = self._attached.get(parquet_path)
+        if current and current[1] == fp:
+            return alias
+        if current:
+            executor.query(f"DETACH {alias}")
+            self._attached.pop(parquet_path, None)
+        path = self.rollup_file(parquet_path)
+        if os.path.exists(path):
+            if self._stored_fingerprint(executor, path, alias, fp):
+                self._attached[parquet_path] = (alias, fp)
+                return alias
+            os.remove(path)
+        self._build(executor, parquet_path, path, fp)
+        self._attach(executor, path, alias)
+        self._attached[parquet_path] = (alias, fp)
+        return alias
+
+    def table(self, executor: DuckDBExecutor, parquet_path: str, name: str) -> str:
+        alias = self.ensure(executor, parquet_path)
+        return f"{alias}.{name}"
+
+    def _attach(self, executor: DuckDBExecutor, path: str, alias: str) -> None:
+        path_sql = path.replace("'", "''")
+        executor.query(f"ATTACH '{path_sql}' AS {alias} (READ_ONLY)")
+
+    def _stored_fingerprint(self, executor: DuckDBExecutor, path: str, alias: str, fp: str) -> bool:
+        """Attach the rollup file under `alias` when it was built from dataset version `fp`; otherwise leave it detached."""
+        try:
+            # An alias left attached to a file `apply_increment` has since replaced is dropped first
+            executor.query(f"DETACH DATABASE IF EXISTS {alias}")
+            self._attach(executor, path, alias)
+            rows = executor.query(f"SELECT fingerprint, version FROM {alias}._rollup_meta").to_pylist()
+        except Exception:
+            rows = []
+        if rows and rows[0]["version"] == ROLLUP_VERSION and rows[0]["fingerprint"] == fp:
+            return True
+        # A stale file stays detached, so it can be replaced and the rebuilt one attached under the alias
+        try:
+            executor.query(f"DETACH {alias}")
+        except Exception:
+            pass
+        return False
+
+    def _build(self, executor: DuckDBExecutor, parquet_path: str, path: str, fp: str) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Build into a private file and rename so concurrent agents never see a partial rollup
+        tmp = f"{path}.tmp-{os.getpid()}"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        alias = f"rollup_build_{path_key(parquet_path)}"
+        tmp_sql = tmp.replace("'", "''")
+        # Under --db the executor's connection is read-only, so the file is written on a builder connection
+        with writable_executor(executor, parquet_path) as builder:
+            builder.query(f"ATTACH '{tmp_sql}' AS {alias}")
+            try:
+                for name, spec in ROLLUPS.items():
+                    dims = ", ".join(escape_ident(c) for c in spec.dims)
+                    src, params = raw_projection(parquet_path, name)
+                    builder.query(
+                        f"CREATE TABLE {alias}.{name} AS SELECT {dims}, SUM(total_qty) AS total_qty, COUNT(*) AS n_rows "
+                        f"FROM {src} GROUP BY ALL ORDER BY ALL",
+                        params,
+                    )
+                source_sql, params = scan_relation(parquet_path)
+                columns = _columns(builder, source_sql, params)
+                counts = _column_counts(builder, source_sql, columns, params)
+                builder.query(f"CREATE TABLE {alias}._profile_stats (position INTEGER, column_name VARCHAR, n_rows BIGINT, n_nulls BIGINT, n_distinct BIGINT)")
+                self._write_profile_stats(builder, alias, counts)
+                builder.query(f"CREATE TABLE {alias}._distinct_values (column_name VARCHAR, value VARCHAR)")
+                low_cardinality = [
+                    c for c, (n_rows, n_nulls, distinct) in counts.items()
+                    if distinct <= DISTINCT_SET_LIMIT and distinct <= DISTINCT_SET_RATIO * (n_rows - n_nulls)
+                ]
+                _insert_distinct_values(builder, f"{alias}._distinct_values", source_sql, low_cardinality, params)
+                builder.query(f"CREATE TABLE {alias}._rollup_meta AS SELECT ? AS fingerprint, ? AS source, ? AS version", [fp, os.path.abspath(parquet_path), ROLLUP_VERSION])
+            except BaseException:
+                builder.query(f"DETACH {alias}")
+                os.remove(tmp)
+                raise
+            builder.query(f"DETACH {alias}")
+            os.replace(tmp, path)
+
+    def _write_profile_stats(self, executor: DuckDBExecutor, alias: str, counts: Dict[str, Tuple[int, int, int]]) -> None:
+        executor.query(f"DELETE FROM {alias}._profile_stats")
+        for i, (col, (n_rows, n_nulls, n_distinct)) in enumerate(counts.items()):
+            executor.query(f"INSERT INTO {alias}._profile_stats VALUES (?, ?, ?, ?, ?)", [i, col, n_rows, n_nulls, n_distinct])
+
+    def profile_stats(self, executor: DuckDBExecutor, parquet_path: str) -> Dict[str, Tuple[int, int, int]]:
+        """
+        column -> (rows, nulls, distinct values) over the whole dataset, read from the rollup file.
+        Distinct counts are exact for columns with a value set, approximate for the others.
+        """
+        alias = self.ensure(executor, parquet_path)
+        rows = executor.query(
+            f"SELECT s.column_name, s.n_rows, s.n_nulls, COALESCE(d.n, s.n_distinct) AS n_distinct FROM {alias}._profile_stats s "
+            f"LEFT JOIN (SELECT column_name, COUNT(*) AS n FROM {alias}._distinct_values GROUP BY 1) d USING (column_name) "
+            "ORDER BY s.position"
+        ).to_pylist()
+        return {r["column_name"]: (int(r["n_rows"]), int(r["n_nulls"]), int(r["n_distinct"])) for r in rows}
+
+    def apply_increment(
+        self,
+        executor: DuckDBExecutor,
+        parquet_path: str,
+        old_fingerprint: str,
+        new_fingerprint: str,
+        added: str,
+        removed: Optional[str] = None,
+    ) -> bool:
+        """
+        Fold rows added to (and removed from) the dataset into its rollup file instead of rebuilding it.
+        `added`/`removed` are relations on the executor's connection holding raw dataset rows. The update
+        runs on a copy that replaces the file atomically. Returns False (leaving the next `ensure` to
+        rebuild) when there is no rollup file current for `old_fingerprint`.
+        Distinct-value sets only grow: values that disappear with removed rows stay until a rebuild.
+        Approximate distinct counts add the added rows' estimate (capped at the non-null rows).
+        """
+        with self._lock:
+            path = self.rollup_file(parquet_path)
+            if not os.path.exists(path):
+                return False
+            tmp = f"{path}.tmp-{os.getpid()}"
+            shutil.copyfile(path, tmp)
+            alias = f"rollup_build_{path_key(parquet_path)}"
+            tmp_sql = tmp.replace("'", "''")
+            executor.query(f"ATTACH '{tmp_sql}' AS {alias}")
+            try:
+                meta = executor.query(f"SELECT fingerprint, version FROM {alias}._rollup_meta").to_pylist()
+                current = bool(meta) and meta[0]["fingerprint"] == old_fingerprint and meta[0]["version"] == ROLLUP_VERSION
+                if current:
+                    for name in ROLLUPS:
+                        self._merge_rollup(executor, alias, name, added, removed)
+                    self._merge_profile(executor, alias, added, removed)
+                    executor.query(f"UPDATE {alias}._rollup_meta SET fingerprint = ?", [new_fingerprint])
+            except BaseException:
+                executor.query(f"DETACH {alias}")
+                os.remove(tmp)
+                raise
+            executor.query(f"DETACH {alias}")
+            if not current:
+                os.remove(tmp)
+                return False
+            os.replace(tmp, path)
+            self._attached.pop(parquet_path, None)
+            return True
+
+    def _merge_rollup(self, executor: DuckDBExecutor, alias: str, name: str, added: str, removed: Optional[str]) -> None:
+        dims = [escape_ident(c) for c in ROLLUPS[name].dims]
+        dim_list = ", ".join(dims)
+        delta = f"SELECT {_projection(name)}, 1 AS n_rows FROM {added}"
+        if removed:
+            delta += f" UNION ALL SELECT {_projection(name, sign='-')}, -1 AS n_rows FROM {removed}"
+        match = " AND ".join(f"t.{d} IS NOT DISTINCT FROM d.{d}" for d in dims)
+        table = f"{alias}.{name}"
+        executor.query(
+            f"CREATE OR REPLACE TEMP TABLE _rollup_delta AS SELECT {dim_list}, SUM(total_qty) AS total_qty, SUM(n_rows) AS n_rows "
+            f"FROM ({delta}) GROUP BY ALL"
+        )
+        # Existing groups touched by the delta are re-summed with it; groups left without rows are dropped
+        executor.query(
+            f"CREATE OR REPLACE TEMP TABLE _rollup_merged AS SELECT {dim_list}, SUM(total_qty) AS total_qty, SUM(n_rows) AS n_rows FROM ("
+            f"SELECT t.* FROM {table} t WHERE EXISTS (SELECT 1 FROM _rollup_delta d WHERE {match}) "
+            f"UNION ALL BY NAME SELECT * FROM _rollup_delta) GROUP BY ALL HAVING SUM(n_rows) > 0"
+        )
+        executor.query(f"DELETE FROM {table} t WHERE EXISTS (SELECT 1 FROM _rollup_delta d WHERE {match})")
+        executor.query(f"INSERT INTO {table} BY NAME SELECT * FROM _rollup_merged")
+        executor.query("DROP TABLE _rollup_delta")
+        executor.query("DROP TABLE _rollup_merged")
+
+    def _merge_profile(self, executor: DuckDBExecutor, alias: str, added: str, removed: Optional[str]) -> None:
+        rows = executor.query(f"SELECT column_name, n_rows, n_nulls, n_distinct FROM {alias}._profile_stats ORDER BY position").to_pylist()
+        counts: Dict[str, Tuple[int, int, int]] = {r["column_name"]: (int(r["n_rows"]), int(r["n_nulls"]), int(r["n_distinct"])) for r in rows}
+        total = next(iter(counts.values()), (0, 0, 0))[0]
+        known = set(counts)
+        added_cols = _columns(executor, added)
+        for sign, rel in ((1, added), (-1, removed)):
+            if not rel:
+                continue
+            delta = _column_counts(executor, rel, added_cols if rel == added else _columns(executor, rel))
+            n = next(iter(delta.values()), (0, 0, 0))[0]
+            for col in list(counts) + [c for c in delta if c not in counts]:
+                # A column missing on either side is all-null there
+                base = counts.get(col, (total, total, 0))
+                d = delta.get(col, (n, n, 0))
+                n_rows, n_nulls = base[0] + sign * d[0], base[1] + sign * d[1]
+                distinct = base[2] + d[2] if sign > 0 else base[2]
+                counts[col] = (n_rows, n_nulls, min(distinct, n_rows - n_nulls))
+            total += sign * n
+        # Columns with a value set (or new ones, all of whose values are added) merge it exactly;
+        # a set that outgrows the limit is dropped for the estimate
+        table = f"{alias}._distinct_values"
+        with_sets = {r["column_name"] for r in executor.query(f"SELECT DISTINCT column_name FROM {table}").to_pylist()}
+        _insert_distinct_values(executor, table, added, [c for c in added_cols if c in with_sets or c not in known])
+        for r in executor.query(f"SELECT column_name, COUNT(*) AS n FROM {table} GROUP BY 1").to_pylist():
+            n_rows, n_nulls, _ = counts[r["column_name"]]
+            counts[r["column_name"]] = (n_rows, n_nulls, int(r["n"]))
+            if r["n"] > DISTINCT_SET_LIMIT:
+                executor.query(f"DELETE FROM {table} WHERE column_name = ?", [r["column_name"]])
+        self._write_profile_stats(executor, alias, counts)
+
+
+def rollup_relation(
+    executor: DuckDBExecutor,
+    parquet_path: str,
+    name: str,
+    extra_dims: Optional[List[str]] = None,
+) -> Tuple[str, List[Any]]:
+    """
+    FROM-clause relation (and its params) exposing the columns of rollup `name`.
+    Reads the materialized rollup when the executor has a store and it covers the requested dims;
+    otherwise falls back to an equivalent projection over the raw parquet.
+    """
+    store: Optional[RollupStore] = getattr(executor, "rollups", None)
+    covered = all(c in ROLLUPS[name].dims for c in (extra_dims or []))
+    if store is not None and covered:
+        try:
+            return store.table(executor, parquet_path, name), []
+        except (duckdb.Error, OSError) as e:
+            logger.warning("rollup %s unavailable for %s, scanning the dataset instead: %s", name, parquet_path, e)
+    return raw_projection(parquet_path, name, extra_dims)
@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.exec.dataset import DAY_COLUMN, scan_relation
+from agent.exec.duck import DuckDBExecutor, writable_executor
+from agent.exec.sql_builder import QueryPlan, escape_ident
+from agent.utils.fingerprint import cache_root, dataset_fingerprint, path_key
+from agent.utils.schema_cache import SchemaSnapshot
+
+SAMPLE_VERSION = 1
+# Strata: every (pipeline, month) keeps at least MIN_PER_STRATUM rows (all of them when smaller)
+STRATA = {
+    "pipeline_name": "pipeline_name",
+    "month": f"date_trunc('month', {DAY_COLUMN})::DATE",
+}
+SAMPLE_RATE = 0.01
+MIN_PER_STRATUM = 50
+Z_95 = 1.959963984540054
+
+_SUM = re.compile(r"^\s*SUM\(\s*([A-Za-z_][A-Za-z0-9_]*)\s*\)\s*$", re.IGNORECASE)
+_COUNT_STAR = re.compile(r"^\s*COUNT\(\s*\*\s*\)\s*$", re.IGNORECASE)
+
+
+class SampleStore:
+    """
+    Persisted stratified sample of a dataset in a local DuckDB file per dataset path (like the
+    rollups): a fixed-size, hash-ordered draw of rows from every (pipeline_name, month) stratum plus
+    the population and sample size of each stratum. Rebuilt when the dataset fingerprint changes.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, rate: float = SAMPLE_RATE, min_per_stratum: int = MIN_PER_STRATUM, seed: int = 42) -> None:
+        self.cache_dir = cache_dir or os.path.join(cache_root(), "samples")
+        self.rate = rate
+        self.min_per_stratum = min_per_stratum
+        self.seed = seed
+        self._attached: Dict[str, Tuple[str, str]] = {}  # source path -> (alias, fingerprint)
+        self._lock = threading.Lock()
+
+    def sample_file(self, parquet_path: str) -> str:
+        return os.path.join(self.cache_dir, f"{path_key(parquet_path)}.duckdb")
+
+    def ensure(self, executor: DuckDBExecutor, parquet_path: str) -> str:
+        """Attach an up-to-date sample database to the executor's connection; returns its catalog alias."""
+        with self._lock:
+            fp = dataset_fingerprint(parquet_path)
+            alias = f"sample_{path_key(self.sample_file(parquet_path))}"
+            current = self._attached.get(parquet_path)
+            if current and current[1] == fp:
+                return alias
+            if current:
+                executor.query(f"DETACH {alias}")
+                self._attached.pop(parquet_path, None)
+            path = self.sample_file(parquet_path)
+            if os.path.exists(path):
+                if self._stored_meta(executor, path, alias, (fp, self.rate, self.min_per_stratum, self.seed)):
+                    self._attached[parquet_path] = (alias, fp)
+                    return alias
+                os.remove(path)
+            self._build(executor, parquet_path, path, fp)
+            self._attach(executor, path, alias)
+            self._attached[parquet_path] = (alias, fp)
+            return alias
+
+    def _attach(self, executor: DuckDBExecutor, path: str, alias: str) -> None:
+        path_sql = path.replace("'", "''")
+        executor.query(f"ATTACH '{path_sql}' AS {alias} (READ_ONLY)")
+
+    def _stored_meta(self, executor: DuckDBExecutor, path: str, alias: str, expected: Tuple[str, float, int, int]) -> bool:
+        """Attach the sample file under `alias` when its meta matches `expected`; otherwise leave it detached."""
+        try:
+            self._attach(executor, path, alias)
+            rows = executor.query(f"SELECT fingerprint, version, rate, min_per_stratum, seed FROM {alias}._sample_meta").to_pylist()
+        except Exception:
+            rows = []
+        if rows and rows[0]["version"] == SAMPLE_VERSION:
+            r = rows[0]
+            if (r["fingerprint"], r["rate"], r["min_per_stratum"], r["seed"]) == expected:
+                return True
+        # A stale file stays detached, so it can be replaced and the rebuilt one attached under the alias
+        try:
+            executor.query(f"DETACH {alias}")
+        except Exception:
+            pass
+        return False
+
+    def _build(self, executor: DuckDBExecutor, parquet_path: str, path: str, fp: str) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Build into a private file and rename so concurrent agents never see a partial sample
+        tmp = f"{path}.tmp-{os.getpid()}"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        alias = f"sample_build_{path_key(parquet_path)}"
+        tmp_sql = tmp.replace("'", "''")
+        # Under --db the executor's connection is read-only, so the file is written on a builder connection
+        with writable_executor(executor, parquet_path) as builder:
+            source_sql, params = scan_relation(parquet_path)
+            columns = [r["column_name"] for r in builder.query(f"DESCRIBE SELECT * FROM {source_sql}", params).to_pylist()]
+            row_hash = "hash(" + ", ".join([str(int(self.seed))] + [escape_ident(c) for c in columns]) + ")"
+            strata = ", ".join(f"{expr} AS {escape_ident('_s_' + name)}" for name, expr in STRATA.items())
+            partition = ", ".join(escape_ident("_s_" + name) for name in STRATA)
+            builder.query(f"ATTACH '{tmp_sql}' AS {alias}")
+            try:
+                # Per stratum: n_sample = min(n_pop, max(min_per_stratum, ceil(rate * n_pop))) rows, lowest row hashes first
+                builder.query(
+                    f"CREATE TABLE {alias}.sample AS SELECT * EXCLUDE (_rank, _n_pop) FROM ("
+                    f"  SELECT *, {strata},"
+                    f"         ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY {row_hash}) AS _rank,"
+                    f"         COUNT(*) OVER (PARTITION BY {partition}) AS _n_pop"
+                    f"  FROM {source_sql}"
+                    f") WHERE _rank <= LEAST(_n_pop, GREATEST(?, CEIL(? * _n_pop)))",
+                    params + [int(self.min_per_stratum), float(self.rate)],
+                )
+                builder.query(
+                    f"CREATE TABLE {alias}.strata AS SELECT p.*, s.n_sample FROM ("
+                    f"  SELECT {strata}, COUNT(*) AS n_pop FROM {source_sql} GROUP BY ALL"
+                    f") p JOIN (SELECT {partition}, COUNT(*) AS n_sample FROM {alias}.sample GROUP BY ALL) s"
+                    f" USING ({partition})",
+                    params,
+                )
+                builder.query(
+                    f"CREATE TABLE {alias}._sample_meta AS SELECT ? AS fingerprint, ? AS version, ?::DOUBLE AS rate, ? AS min_per_stratum, ? AS seed",
+                    [fp, SAMPLE_VERSION, float(self.rate), int(self.min_per_stratum), int(self.seed)],
+                )
+            except BaseException:
+                builder.query(f"DETACH {alias}")
+                os.remove(tmp)
+                raise
+            builder.query(f"DETACH {alias}")
+            os.replace(tmp, path)
+
+    def stats(self, executor: DuckDBExecutor, parquet_path: str) -> Dict[str, int]:
+        alias = self.ensure(executor, parquet_path)
+        row = executor.query(f"SELECT COUNT(*) AS strata, SUM(n_pop) AS population, SUM(n_sample) AS sample FROM {alias}.strata").to_pylist()[0]
+        return {k: int(v or 0) for k, v in row.items()}
+
+
+def _estimand(expr: str) -> Optional[str]:
+    """Per-row variable whose stratified total estimates the aggregate `expr`, if it is a SUM/COUNT."""
+    m = _SUM.match(expr)
+    if m:
+        return f"COALESCE({escape_ident(m.group(1))}, 0)"
+    if _COUNT_STAR.match(expr):
+        return "1"
+    return None
+
+
+def build_approx_sql(alias: str, plan: QueryPlan, schema: SchemaSnapshot) -> Optional[Tuple[str, List[Any]]]:
+    """
+    Estimate a rule plan's SUM/COUNT(*) aggregates from the stratified sample in catalog `alias`,
+    with 95% confidence intervals (`<name>_ci_low`, `<name>_ci_high`). None when the plan has other
+    aggregates or projects columns it does not group by.
+
+    Every aggregate is a population total of a per-row variable y restricted to the plan's filters
+    and group (a domain): estimated as sum_h N_h * mean_h(y), with variance
+    sum_h N_h^2 (1 - n_h / N_h) s_h^2 / n_h, where y is 0 on sampled rows outside the domain.
+    """
+    if not plan.aggregations:
+        return None
+    estimands = {name: _estimand(expr) for name, expr in plan.aggregations.items()}
+    if any(v is None for v in estimands.values()):
+        return None
+    if any(c not in plan.group_by for c in plan.columns):
+        return None
+    valid_cols = {c.name for c in schema.columns}
+    for col in plan.group_by + [f.column for f in plan.filters]:
+        if col and col not in valid_cols:
+            raise ValueError(f"Unknown column: {col}")
+
+    params: List[Any] = []
+    keys: List[str] = []
+    dom_parts: List[str] = []
+    for name, expr in (plan.select_exprs or {}).items():
+        dom_parts.append(f"{expr} AS {escape_ident(name)}")
+        keys.append(escape_ident(name))
+    for col in plan.group_by:
+        if escape_ident(col) not in keys:
+            dom_parts.append(escape_ident(col))
+            keys.append(escape_ident(col))
+    for extra in plan.group_by_exprs or []:
+        if extra not in (plan.select_exprs or {}).values():
+            return None  # grouped by an expression the result does not show
+    strata_cols = [escape_ident("_s_" + name) for name in STRATA]
+    dom_parts.extend(strata_cols)
+    for i, y in enumerate(estimands.values()):
+        dom_parts.append(f"SUM({y}) AS _sy_{i}, SUM(({y}) * ({y})) AS _syy_{i}")
+
+    where_clauses: List[str] = []
+    for f in plan.filters:
+        col_sql = escape_ident(f.column)
+        if f.op.upper() == "IN" and isinstance(f.value, list):
+            where_clauses.append(f"{col_sql} IN ({', '.join(['?'] * len(f.value))})")
+            params.extend(f.value)
+        elif f.op.upper() == "BETWEEN" and isinstance(f.value, list) and len(f.value) == 2:
+            where_clauses.append(f"{col_sql} BETWEEN ? AND ?")
+            params.extend(f.value)
+        else:
+            where_clauses.append(f"{col_sql} {f.op} ?")
+            params.append(f.value)
+    where_sql = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+
+    est_parts = [f"d.{k}" for k in keys]
+    out_parts = list(keys)
+    for i, name in enumerate(estimands):
+        q = escape_ident(name)
+        est_parts.append(f"SUM(st.n_pop * d._sy_{i} / st.n_sample) AS {q}")
+        est_parts.append(
+            f"SUM(CASE WHEN st.n_sample > 1 THEN st.n_pop * st.n_pop * (1 - st.n_sample / st.n_pop)"
+            f" * GREATEST(d._syy_{i} - d._sy_{i} * d._sy_{i} / st.n_sample, 0) / (st.n_sample - 1) / st.n_sample ELSE 0 END) AS _var_{i}"
+        )
+        out_parts.append(q)
+        out_parts.append(f"{q} - {Z_95} * SQRT(_var_{i}) AS {escape_ident(name + '_ci_low')}")
+        out_parts.append(f"{q} + {Z_95} * SQRT(_var_{i}) AS {escape_ident(name + '_ci_high')}")
+    join = " AND ".join(f"d.{c} IS NOT DISTINCT FROM st.{c}" for c in strata_cols)
+    sql = (
+        f"WITH dom AS (SELECT {', '.join(dom_parts)} FROM {alias}.sample{where_sql} GROUP BY ALL),"
+        f" est AS (SELECT {', '.join(est_parts)} FROM dom d JOIN {alias}.strata st ON {join}"
+        + (f" GROUP BY {', '.join(f'd.{k}' for k in keys)}" if keys else "")
+        + f") SELECT {', '.join(out_parts)} FROM est"
+    )
+    if plan.order_by:
+        sql += " ORDER BY " + ", ".join(f"{expr} {direction}" for expr, direction in plan.order_by)
+    sql += " LIMIT ?"
+    params.append(plan.limit if plan.limit is not None else 1000)
+    return sql, params
+
+
+def approx_relation(executor: DuckDBExecutor, parquet_path: str) -> Optional[str]:
+    """Catalog alias of the dataset's stratified sample when the executor has a SampleStore."""
+    store: Optional[SampleStore] = getattr(executor, "samples", None)
+    if store is None:
+        return None
+    return store.ensure(executor, parquet_path)
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from agent.exec.duck import DuckDBExecutor
+from agent.exec.rollups import rollup_relation
+from agent.exec.sql_builder import escape_ident
+from agent.utils.fingerprint import dataset_fingerprint
+
+ArrowColumn = Union[pa.Array, pa.ChunkedArray]
+
+
+def f64(col: ArrowColumn) -> np.ndarray:
+    """float64 NumPy view of an Arrow column (nulls as NaN); zero-copy for a single null-free float64 chunk."""
+    if isinstance(col, pa.ChunkedArray):
+        col = col.chunk(0) if col.num_chunks == 1 else col.combine_chunks()
+    col = pc.cast(col, pa.float64())
+    if col.null_count:
+        col = pc.fill_null(col, np.nan)
+    return col.to_numpy(zero_copy_only=False)
+
+
+def sorted_unique(col: ArrowColumn) -> pa.Array:
+    uniq = pc.unique(pc.drop_null(col))
+    return uniq.take(pc.sort_indices(uniq))
+
+
+def pivot_dense(tbl: pa.Table, index: str, columns: str, values: str) -> Tuple[pa.Array, pa.Array, np.ndarray]:
+    """
+    Dense (index x columns) float64 matrix from a long table, labels sorted and null labels dropped.
+    Missing cells are NaN.
+    """
+    tbl = tbl.filter(pc.and_(pc.is_valid(tbl[index]), pc.is_valid(tbl[columns])))
+    rows, cols = sorted_unique(tbl[index]), sorted_unique(tbl[columns])
+    mat = np.full((len(rows), len(cols)), np.nan)
+    ri = pc.index_in(tbl[index], value_set=rows).to_numpy()
+    ci = pc.index_in(tbl[columns], value_set=cols).to_numpy()
+    mat[ri, ci] = f64(tbl[values])
+    return rows, cols, mat
+
+
+@dataclass(frozen=True)
+class DailySeries:
+    """
+    Daily totals of one dataset version: `values[t]` (or `values[key, t]` when grouped) is the
+    total on `days[t]`. Days are the sorted gas days present in the dataset; a key without rows on a
+    day has 0 there. `values` is a C-contiguous float64 array and must not be modified.
+    """
+
+    days: pa.Array  # date32
+    values: np.ndarray
+    by: Optional[str] = None
+    keys: Optional[pa.Array] = None
+
+    def table(self) -> pa.Table:
+        """`day, total_qty` as Arrow, wrapping `values` without a copy (ungrouped series only)."""
+        if self.by is not None:
+            raise ValueError("table() needs an ungrouped series; use values/keys for grouped ones")
+        return pa.table({"day": self.days, "total_qty": pa.array(self.values, pa.float64())})
+
+    def row(self, key: Any) -> np.ndarray:
+        if self.keys is None:
+            raise ValueError("row() needs a grouped series")
+        idx = self.keys.index(key).as_py()
+        if idx < 0:
+            raise KeyError(key)
+        return self.values[idx]
+
+
+def load_daily_series(executor: DuckDBExecutor, parquet_path: str, by: Optional[str] = None) -> DailySeries:
+    """One GROUP BY over the pipeline x day rollup (raw scan when `by` is not a rollup dimension)."""
+    if by is None:
+        src, params = rollup_relation(executor, parquet_path, "pipeline_daily")
+        tbl = executor.query(f"SELECT day, SUM(total_qty) AS total_qty FROM {src} GROUP BY 1 ORDER BY 1", params)
+        values = np.ascontiguousarray(f64(tbl["total_qty"]))
+        values.flags.writeable = False
+        return DailySeries(days=tbl["day"].combine_chunks(), values=values)
+    qcol = escape_ident(by)
+    src, params = rollup_relation(executor, parquet_path, "pipeline_daily", [by])
+    tbl = executor.query(f"SELECT {qcol} AS key, day, SUM(total_qty) AS total_qty FROM {src} GROUP BY 1, 2", params)
+    keys, days, mat = pivot_dense(tbl, "key", "day", "total_qty")
+    values = np.ascontiguousarray(np.nan_to_num(mat, nan=0.0))
+    values.flags.writeable = False
+    return DailySeries(days=days, values=values, by=by, keys=keys)
+
+
+class DailySeriesStore:
+    """
+    In-process cache of daily series per (dataset path, grouping column), computed once per dataset
+    version (fingerprint) and shared by every time-series analytic on the executor and its cursors.
+    """
+
+    def __init__(self, max_entries: int = 8) -> None:
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[Tuple[str, Optional[str]], Tuple[str, DailySeries]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        # Concurrent analytics on cursors load each series once
+        self._lock = threading.Lock()
+
+    def get(self, executor: DuckDBExecutor, parquet_path: str, by: Optional[str] = None) -> DailySeries:
+        key = (parquet_path, by)
+        try:
+            fp = dataset_fingerprint(parquet_path)
+        except OSError:
+            fp = ""
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == fp:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return cached[1]
+            self._misses += 1
+            series = load_daily_series(executor, parquet_path, by)
+            self._cache[key] = (fp, series)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            return series
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "entries": len(self._cache)}
+
+
+def daily_series(executor: DuckDBExecutor, parquet_path: str, by: Optional[str] = None) -> DailySeries:
+    """Daily series through the executor's DailySeriesStore when it has one; computed directly otherwise."""
+    store: Optional[DailySeriesStore] = getattr(executor, "series", None)
+    if store is not None:
+        return store.get(executor, parquet_path, by)
+    return load_daily_series(executor, parquet_path, by)
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Optional
+
+from agent.exec.dataset import scan_relation
+from agent.exec.duck import DuckDBConfig, DuckDBExecutor
+from agent.exec.materialized import MaterializedRelations
+from agent.exec.result_cache import ResultCache
+from agent.exec.rollups import RollupStore
+from agent.exec.sampling import SampleStore
+from agent.exec.series import DailySeriesStore
+from agent.utils.profile_cache import ColumnProfile, ProfileCache
+from agent.utils.schema_cache import SchemaCache, SchemaSnapshot
+
+# Caches that keep parquet footers/metadata warm across queries on one connection.
+# `enable_object_cache` is the pre-1.1 name; newer DuckDB releases ignore it and use
+# `parquet_metadata_cache` instead, so both are applied best-effort.
+_WARM_SETTINGS = (
+    "SET enable_object_cache = true",
+    "SET parquet_metadata_cache = true",
+    "SET enable_external_file_cache = true",
+)
+
+
+class DuckDBSession:
+    """
+    Long-lived state for an interactive session: one DuckDB connection, the schema/profile caches,
+    the daily series store, materialized relations, the stratified sample and (optionally) the
+    rollup store and result cache.
+    Follow-up questions reuse all of it instead of paying cold-start parquet metadata parsing again.
+    """
+
+    def __init__(
+        self,
+        parquet_path: str,
+        config: Optional[DuckDBConfig] = None,
+        use_rollups: bool = True,
+        use_result_cache: bool = True,
+        profile_queries: bool = False,
+    ) -> None:
+        self.parquet_path = parquet_path
+        self.executor = DuckDBExecutor(config)
+        self.executor.dataset_path = parquet_path
+        self.executor.series = DailySeriesStore()
+        self.executor.materialized = MaterializedRelations()
+        # Built on first use by an approximate answer
+        self.executor.samples = SampleStore()
+        if use_rollups:
+            self.executor.rollups = RollupStore()
+        if use_result_cache:
+            max_mb = int(os.environ.get("RESULT_CACHE_MB", "256"))
+            self.executor.result_cache = ResultCache(max_bytes=max_mb * 1024 * 1024)
+        if profile_queries:
+            self.executor.enable_profiling()
+        self.schema_cache = SchemaCache()
+        self.profile_cache = ProfileCache()
+        for stmt in _WARM_SETTINGS:
+            try:
+                self.executor.query(stmt)
+            except Exception:
+                pass
+
+    def preview(self, limit: int = 10) -> Any:
+        source_sql, params = scan_relation(self.parquet_path)
+        return self.executor.query(f"SELECT * FROM {source_sql} LIMIT ?", params + [limit])
+
+    def schema(self) -> SchemaSnapshot:
+        return self.schema_cache.get_or_load(self.executor, self.parquet_path)
+
+    def profile(self, sample_rows: int = 10000) -> Dict[str, ColumnProfile]:
+        return self.profile_cache.get_or_profile(self.executor, self.parquet_path, sample_rows=sample_rows)
+
+    def cache_stats(self) -> Dict[str, int]:
+        cache = self.executor.result_cache
+        return cache.stats() if cache is not None else {}
+
+    def close(self) -> None:
+        self.executor.close()
+
+    def __enter__(self) -> "DuckDBSession":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
@@ -3,6 +3,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Tuple
 
+from agent.exec.dataset import DAY_COLUMN, day_range_from_filter, intersect_day_ranges, scan_relation
 from agent.utils.schema_cache import SchemaSnapshot
 
 
@@ -37,8 +38,14 @@ def build_sql(parquet_path: str, plan: QueryPlan, schema: SchemaSnapshot) -> Tup
         if col and col not in valid_cols:
             raise ValueError(f"Unknown column: {col}")
 
+    # Day filters prune whole files/partitions of multi-file datasets before the scan
+    day_range = None
+    for f in plan.filters:
+        if f.column == DAY_COLUMN:
+            day_range = intersect_day_ranges(day_range, day_range_from_filter(f.op, f.value))
+    source_sql, params = scan_relation(parquet_path, day_range)
+
     select_parts: List[str] = []
-    params: List[Any] = [parquet_path]
 
     # Raw select expressions first
     if plan.select_exprs:
@@ -56,7 +63,7 @@ def build_sql(parquet_path: str, plan: QueryPlan, schema: SchemaSnapshot) -> Tup
     if not select_parts:
         select_parts = ['*']
 
-    sql = f"SELECT {', '.join(select_parts)} FROM read_parquet(?)"
+    sql = f"SELECT {', '.join(select_parts)} FROM {source_sql}"
 
     # Filters (parameterized where possible)
     where_clauses: List[str] = []
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import weakref
+from dataclasses import dataclass
+from typing import Callable, List
+
+import pyarrow as pa
+
+# The console shows 20 rows and results.json keeps 100; nothing downstream needs more
+HEAD_ROWS = 100
+
+# RecordBatchReader.close() does not close the Python iterator behind a from_batches reader, so
+# streams that hold resources (DuckDBExecutor.query_batches: the DuckDB result and its timeout
+# watchdog) register a release callback here. It runs on close_reader, or when the reader is dropped.
+_RELEASE: "weakref.WeakKeyDictionary[pa.RecordBatchReader, weakref.finalize]" = weakref.WeakKeyDictionary()
+
+
+def on_release(reader: pa.RecordBatchReader, release: Callable[[], None]) -> pa.RecordBatchReader:
+    """Run `release` (once) when `reader` is closed with close_reader or garbage collected."""
+    _RELEASE[reader] = weakref.finalize(reader, release)
+    return reader
+
+
+def close_reader(reader: pa.RecordBatchReader) -> None:
+    """Close a reader that may be abandoned half-read, releasing what its stream holds."""
+    reader.close()
+    release = _RELEASE.pop(reader, None)
+    if release is not None:
+        release()
+
+
+@dataclass
+class ResultHead:
+    """The first rows of a streamed result plus the row count (a lower bound unless `complete`)."""
+
+    table: pa.Table
+    total_rows: int
+    complete: bool = True
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_rows > self.table.num_rows
+
+
+def read_head(reader: pa.RecordBatchReader, max_rows: int = HEAD_ROWS, count_rest: bool = True) -> ResultHead:
+    """
+    Consume `reader` one batch at a time, keeping at most `max_rows` rows. With `count_rest` the
+    remaining batches are drained (and dropped) to count rows; otherwise the stream is closed early.
+    """
+    kept: List[pa.RecordBatch] = []
+    kept_rows = 0
+    total = 0
+    for batch in reader:
+        total += batch.num_rows
+        if kept_rows < max_rows:
+            # take() copies, so the rest of the batch is not kept alive by a slice
+            n = min(batch.num_rows, max_rows - kept_rows)
+            kept.append(batch.take(pa.array(range(n), type=pa.int64())))
+            kept_rows += n
+        elif not count_rest:
+            close_reader(reader)
+            return ResultHead(table=pa.Table.from_batches(kept, schema=reader.schema), total_rows=total, complete=False)
+    return ResultHead(table=pa.Table.from_batches(kept, schema=reader.schema), total_rows=total)
@@ -9,8 +9,12 @@ from typing import Any, Dict, Optional
 
 
 class Reporter:
-    def __init__(self, base_dir: str = "runs"):
+    def __init__(self, base_dir: str = "runs", context: Optional[Dict[str, Any]] = None, profiler: Optional[Any] = None):
         self.base_dir = base_dir
+        # Run-wide facts (e.g. effective DuckDB settings) merged into every plan.json
+        self.context = context or {}
+        # Optional QueryProfiler; its captured query profiles are written to profile.json
+        self.profiler = profiler
 
     def _run_dir(self) -> Path:
         ts = time.strftime("%Y%m%d-%H%M%S")
@@ -36,9 +40,13 @@ class Reporter:
 
     def save_artifacts(self, plan: Dict[str, Any], sql: Optional[str], results: Any, markdown_summary: str, latency_sec: Optional[float] = None) -> str:
         run_dir = self._run_dir()
-        (run_dir / "plan.json").write_text(json.dumps(plan, indent=2))
+        plan = {**self.context, **plan}
+        (run_dir / "plan.json").write_text(json.dumps(self._safe_json(plan), indent=2))
         if sql:
             (run_dir / "query.sql").write_text(sql)
+        profiles = self.profiler.profiles() if self.profiler is not None else []
+        if profiles:
+            (run_dir / "profile.json").write_text(json.dumps(self._safe_json({"latency_sec": latency_sec, "queries": profiles}), indent=2))
         (run_dir / "results.json").write_text(json.dumps(self._safe_json(results), indent=2))
         if latency_sec is not None:
             markdown_summary = f"Latency: {latency_sec:.2f}s\n\n" + markdown_summary
@@ -47,6 +55,13 @@ class Reporter:
         self._prune_runs()
         return str(run_dir)
 
+    def save_extra(self, run_dir: str, name: str, results: Any, note: Optional[str] = None) -> None:
+        """Add a result file to an existing run (e.g. an exact refinement of an approximate answer)."""
+        (Path(run_dir) / name).write_text(json.dumps(self._safe_json(results), indent=2))
+        if note:
+            with open(Path(run_dir) / "summary.md", "a", encoding="utf-8") as f:
+                f.write(f"\n\n{note}\n")
+
     def _safe_json(self, obj: Any):
         # Normalize common datetime types
         if isinstance(obj, (date, datetime, dtime)):
@@ -69,6 +84,10 @@ class Reporter:
                 return {k: [self._safe_json(v) for v in vals] for k, vals in pyd.items()}
             if isinstance(obj, pa.Scalar):
                 return self._safe_json(obj.as_py())
+            if isinstance(obj, pa.RecordBatchReader):
+                # Only the first 100 rows are read; the rest of the stream is never materialized
+                from agent.exec.streaming import read_head
+                return self._safe_json(read_head(obj, 100, count_rest=False).table)
         except Exception:
             pass
         try:
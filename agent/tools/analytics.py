@@ -1,37 +1,79 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
-import pandas as pd
 import pyarrow as pa
+import pyarrow.compute as pc
 from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
 from sklearn.metrics import silhouette_score
-from math import isnan
 
+from agent.exec.dataset import scan_relation
 from agent.exec.duck import DuckDBExecutor
+from agent.exec.rollups import rollup_relation
+from agent.exec.series import daily_series, f64 as _f64, pivot_dense as _pivot
 from agent.exec.sql_builder import escape_ident
+from agent.tools.clustering import K_SWEEP_SCHEMA, FeatureStore, build_features, fit_streaming_kmeans, sweep_k
+from agent.tools.decomposition import PERIODS, decompose_batch, decomposition_basis
+from agent.tools.forecasting import Z_95, forecast_batch
+from agent.tools.correlation import correlation_matrix, correlation_pvalues, top_correlated_series, top_pairs as _top_corr_pairs
+
+
+# Results stay in Arrow; numeric work runs on NumPy views of the Arrow buffers (no pandas round trip)
+def _rolling_mean_std(x: np.ndarray, window: int, min_periods: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Trailing-window mean and sample std (ddof=1) including the current point; NaN below min_periods."""
+    valid = ~np.isnan(x)
+    if not valid.any():
+        return np.full(x.shape, np.nan), np.full(x.shape, np.nan)
+    # Windowed sums as differences of running sums (O(n) memory); centering limits cancellation
+    center = float(x[valid].mean())
+    xc = np.where(valid, x - center, 0.0)
+    s0 = np.concatenate([[0], np.cumsum(valid)])
+    s1 = np.concatenate([[0.0], np.cumsum(xc)])
+    s2 = np.concatenate([[0.0], np.cumsum(xc * xc)])
+    hi = np.arange(1, x.shape[0] + 1)
+    lo = np.maximum(hi - window, 0)
+    count = s0[hi] - s0[lo]
+    sum1 = s1[hi] - s1[lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sum1 / count
+        var = np.maximum((s2[hi] - s2[lo]) - sum1 * mean, 0.0) / (count - 1)
+    std = np.sqrt(var)
+    mean += center
+    mean[count < min_periods] = np.nan
+    std[(count < min_periods) | (count < 2)] = np.nan
+    return mean, std
+
+
+def _pct_change(x: np.ndarray, periods: int = 1) -> np.ndarray:
+    out = np.full(x.shape, np.nan)
+    if x.shape[0] > periods:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[periods:] = x[periods:] / x[:-periods] - 1
+    return out
 
 
 def daily_totals(executor: DuckDBExecutor, parquet_path: str) -> Any:
-    sql = "SELECT eff_gas_day::DATE AS day, SUM(COALESCE(scheduled_quantity, 0)) AS total_qty FROM read_parquet(?) GROUP BY 1 ORDER BY 1"
-    return executor.query(sql, [parquet_path])
+    """`day, total_qty` ordered by day, from the executor's daily series store when it has one."""
+    return daily_series(executor, parquet_path).table()
 
 
 def top_k_by(executor: DuckDBExecutor, parquet_path: str, column: str, k: int = 10) -> Any:
-    sql = f"SELECT {escape_ident(column)} AS key, SUM(COALESCE(scheduled_quantity, 0)) AS total_qty FROM read_parquet(?) GROUP BY 1 ORDER BY 2 DESC LIMIT ?"
-    return executor.query(sql, [parquet_path, k])
+    src, params = scan_relation(parquet_path)
+    sql = f"SELECT {escape_ident(column)} AS key, SUM(COALESCE(scheduled_quantity, 0)) AS total_qty FROM {src} GROUP BY 1 ORDER BY 2 DESC LIMIT ?"
+    return executor.query(sql, params + [k])
 
 
 def anomaly_candidates(executor: DuckDBExecutor, parquet_path: str, z: float = 3.5) -> Any:
+    src, params = scan_relation(parquet_path)
     sql = (
         "WITH d AS ("
-        "  SELECT eff_gas_day::DATE AS day, SUM(COALESCE(scheduled_quantity, 0)) AS total_qty FROM read_parquet(?) GROUP BY 1"
+        f"  SELECT eff_gas_day::DATE AS day, SUM(COALESCE(scheduled_quantity, 0)) AS total_qty FROM {src} GROUP BY 1"
         ") SELECT day, total_qty, (total_qty - AVG(total_qty) OVER())/NULLIF(STDDEV_POP(total_qty) OVER(),0) AS zscore"
         " FROM d WHERE ABS((total_qty - AVG(total_qty) OVER())/NULLIF(STDDEV_POP(total_qty) OVER(),0)) >= ? ORDER BY ABS(zscore) DESC"
     )
-    return executor.query(sql, [parquet_path, z])
+    return executor.query(sql, params + [z])
 
 
 def anomalies_vs_category(
@@ -50,7 +92,10 @@ def anomalies_vs_category(
     Returns top locations by max |z| with counts.
     """
     where_clauses: List[str] = []
-    params: List[Any] = [parquet_path]
+    params: List[Any] = []
+    day_range = (f"{year}-01-01", f"{year}-12-31") if year is not None else None
+    src, src_params = scan_relation(parquet_path, day_range)
+    params.extend(src_params)
     if year is not None:
         where_clauses.append("eff_gas_day BETWEEN ? AND ?")
         params.extend([f"{year}-01-01", f"{year}-12-31"]) 
@@ -62,60 +107,114 @@ def anomalies_vs_category(
         params.append(int(rec_del_sign))
     where_sql = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
 
-    sql = (
+    scored_sql = (
         "WITH base AS ("
         "  SELECT eff_gas_day::DATE AS day, category_short, loc_name, SUM(COALESCE(scheduled_quantity, 0)) AS total_qty"
-        "  FROM read_parquet(?)" + where_sql + " GROUP BY 1,2,3"
+        f"  FROM {src}" + where_sql + " GROUP BY 1,2,3"
         "), cat_stats AS ("
         "  SELECT day, category_short, AVG(total_qty) AS cat_avg, STDDEV_POP(total_qty) AS cat_std, COUNT(*) AS n_locs"
         "  FROM base GROUP BY 1,2"
-        "), scored AS ("
-        "  SELECT b.day, b.category_short, b.loc_name, b.total_qty, c.cat_avg, c.cat_std, c.n_locs,"
-        "         (b.total_qty - c.cat_avg)/NULLIF(c.cat_std,0) AS zscore"
-        "  FROM base b JOIN cat_stats c USING(day, category_short)"
         ")"
+        " SELECT b.day, b.category_short, b.loc_name, b.total_qty, c.cat_avg, c.cat_std, c.n_locs,"
+        "        (b.total_qty - c.cat_avg)/NULLIF(c.cat_std,0) AS zscore"
+        " FROM base b JOIN cat_stats c USING(day, category_short)"
+    )
+    final_sql = (
         " SELECT category_short, loc_name,"
         "        COUNT_IF(ABS(zscore) >= ?) AS anomaly_days,"
         "        MAX(ABS(zscore)) AS max_abs_z,"
         "        AVG(ABS(zscore)) AS avg_abs_z,"
         "        COUNT(*) AS days_observed"
-        " FROM scored"
+        " FROM {scored}"
         " WHERE zscore IS NOT NULL"
         " GROUP BY 1,2"
         " HAVING anomaly_days >= ?"
         " ORDER BY max_abs_z DESC"
         " LIMIT ?"
     )
+    store = getattr(executor, "materialized", None)
+    if store is not None:
+        # Threshold sweeps over one slice rescore only the final GROUP BY / HAVING
+        slice_params = {"year": year, "state": state, "rec_del_sign": rec_del_sign}
+        table = store.get(executor, "category_scores", parquet_path, slice_params, scored_sql, params)
+        if table is not None:
+            return executor.query(final_sql.format(scored=table), [z_threshold, min_anomaly_days, limit])
+    sql = f"WITH scored AS ({scored_sql})" + final_sql.format(scored="scored")
     params2 = params + [z_threshold, min_anomaly_days, limit]
     return executor.query(sql, params2)
 
 
+def _grouped_anomalies_iqr(executor: DuckDBExecutor, parquet_path: str, group_col: str, k: float, limit: int) -> pa.Table:
+    # quantile_cont is the linear interpolation np.nanquantile uses for the ungrouped fences.
+    # Across groups, extremeness is the distance from the IQR midpoint in IQRs (zero-IQR groups last).
+    qcol = escape_ident(group_col)
+    src, params = rollup_relation(executor, parquet_path, "pipeline_daily", [group_col])
+    sql = (
+        f"WITH s AS (SELECT {qcol} AS grp, day, SUM(total_qty) AS total_qty FROM {src} "
+        f"WHERE {qcol} IS NOT NULL GROUP BY 1, 2), "
+        "f AS (SELECT grp, day, total_qty,"
+        "  quantile_cont(total_qty, 0.25) OVER w AS q1,"
+        "  quantile_cont(total_qty, 0.75) OVER w AS q3"
+        "  FROM s WINDOW w AS (PARTITION BY grp)) "
+        f"SELECT grp AS {qcol}, day, total_qty, q1 - ? * (q3 - q1) AS lower, q3 + ? * (q3 - q1) AS upper, "
+        "ABS(total_qty - (q1 + q3) / 2) / NULLIF(q3 - q1, 0) AS iqr_distance, ? AS method "
+        "FROM f WHERE total_qty < q1 - ? * (q3 - q1) OR total_qty > q3 + ? * (q3 - q1) "
+        "ORDER BY iqr_distance DESC NULLS LAST, ABS(total_qty - (q1 + q3) / 2) DESC, 1, 2 LIMIT ?"
+    )
+    return executor.query(sql, params + [k, k, f"IQR(k={k})", k, k, limit])
+
+
 def anomalies_iqr(
     executor: DuckDBExecutor,
     parquet_path: str,
     k: float = 1.5,
     limit: int = 50,
+    group_col: Optional[str] = None,
 ) -> pa.Table:
     """
     Flag daily total outliers using IQR fences: [Q1 - k*IQR, Q3 + k*IQR].
     Returns days outside the fence ordered by extremeness.
+    With group_col (pipeline_name, category_short, state_abb, loc_name, ...), fences are computed
+    per group in one SQL pass and outliers of all groups are returned together.
     """
-    tbl = daily_totals(executor, parquet_path)
-    df = tbl.to_pandas()
-    if df.empty:
+    if group_col is not None:
+        return _grouped_anomalies_iqr(executor, parquet_path, group_col, k, limit)
+    series = daily_series(executor, parquet_path)
+    if series.values.shape[0] == 0:
         return pa.table({"day": [], "total_qty": [], "lower": [], "upper": [], "method": []})
-    q1 = df["total_qty"].quantile(0.25)
-    q3 = df["total_qty"].quantile(0.75)
+    tbl, x = series.table(), series.values
+    q1, q3 = np.nanquantile(x, [0.25, 0.75])
     iqr = float(q3 - q1)
     lower = float(q1 - k * iqr)
     upper = float(q3 + k * iqr)
-    mask = (df["total_qty"] < lower) | (df["total_qty"] > upper)
-    out = df.loc[mask, ["day", "total_qty"]].copy()
-    out["lower"] = lower
-    out["upper"] = upper
-    out["method"] = f"IQR(k={k})"
-    out = out.sort_values(by="total_qty", key=lambda s: (s - (q1 + q3) / 2).abs(), ascending=False).head(limit)
-    return pa.Table.from_pandas(out, preserve_index=False)
+    idx = np.flatnonzero((x < lower) | (x > upper))
+    idx = idx[np.argsort(-np.abs(x[idx] - (q1 + q3) / 2), kind="stable")][:limit]
+    out = tbl.select(["day", "total_qty"]).take(pa.array(idx, pa.int64()))
+    n = out.num_rows
+    return out.append_column("lower", pa.array(np.full(n, lower))).append_column(
+        "upper", pa.array(np.full(n, upper))
+    ).append_column("method", pa.array([f"IQR(k={k})"] * n, pa.string()))
+
+
+def _grouped_sudden_shifts(executor: DuckDBExecutor, parquet_path: str, group_col: str, window: int, sigma: float, limit: int) -> pa.Table:
+    # Each day is scored against the `window` days of its segment before it (the current day is
+    # excluded from its own baseline); days a segment has no rows for are not in its series.
+    qcol = escape_ident(group_col)
+    window = max(2, int(window))
+    src, params = rollup_relation(executor, parquet_path, "pipeline_daily", [group_col])
+    sql = (
+        f"WITH s AS (SELECT {qcol} AS grp, day, SUM(total_qty) AS total_qty FROM {src} "
+        f"WHERE {qcol} IS NOT NULL GROUP BY 1, 2), "
+        "r AS (SELECT grp, day, total_qty,"
+        "  AVG(total_qty) OVER w AS rolling_mean,"
+        "  STDDEV_SAMP(total_qty) OVER w AS rolling_std,"
+        "  COUNT(total_qty) OVER w AS n_prior"
+        f"  FROM s WINDOW w AS (PARTITION BY grp ORDER BY day ROWS BETWEEN {window} PRECEDING AND 1 PRECEDING)), "
+        "z AS (SELECT *, (total_qty - rolling_mean) / NULLIF(rolling_std, 0) AS z FROM r WHERE n_prior >= ?) "
+        f"SELECT grp AS {qcol}, day, total_qty, rolling_mean, rolling_std, z FROM z "
+        "WHERE ABS(z) >= ? ORDER BY ABS(z) DESC, 1, 2 LIMIT ?"
+    )
+    return executor.query(sql, params + [max(2, window // 2), sigma, limit])
 
 
 def sudden_shifts(
@@ -124,144 +223,179 @@ def sudden_shifts(
     window: int = 7,
     sigma: float = 3.0,
     limit: int = 50,
+    group_col: Optional[str] = None,
 ) -> pa.Table:
     """
     Detect sudden shifts using rolling mean/std on daily totals.
     Flags days where |x_t - mean_{t-window}| > sigma * std_{t-window}.
+    With group_col, every segment's series is scored in one DuckDB window query and the largest
+    shifts across all segments are returned.
     """
-    tbl = daily_totals(executor, parquet_path)
-    df = tbl.to_pandas()
-    if df.empty:
+    if group_col is not None:
+        return _grouped_sudden_shifts(executor, parquet_path, group_col, window, sigma, limit)
+    series = daily_series(executor, parquet_path)
+    if series.values.shape[0] == 0:
         return pa.table({"day": [], "total_qty": [], "rolling_mean": [], "rolling_std": [], "z": []})
-    df = df.sort_values("day").reset_index(drop=True)
-    roll_mean = df["total_qty"].rolling(window, min_periods=max(2, window // 2)).mean()
-    roll_std = df["total_qty"].rolling(window, min_periods=max(2, window // 2)).std()
-    z = (df["total_qty"] - roll_mean) / roll_std.replace(0, np.nan)
-    df_out = df.copy()
-    df_out["rolling_mean"] = roll_mean
-    df_out["rolling_std"] = roll_std
-    df_out["z"] = z
-    df_out = df_out[np.abs(df_out["z"]).fillna(0) >= sigma]
-    df_out = df_out.sort_values("z", key=lambda s: np.abs(s), ascending=False).head(limit)
-    return pa.Table.from_pandas(df_out, preserve_index=False)
-
-
-def _top_pipelines(executor: DuckDBExecutor, parquet_path: str, k: int = 20) -> List[str]:
-    tbl = executor.query(
-        "SELECT pipeline_name, SUM(scheduled_quantity) AS total FROM read_parquet(?) GROUP BY 1 ORDER BY 2 DESC LIMIT ?",
-        [parquet_path, k],
-    )
-    df = tbl.to_pandas()
-    return df["pipeline_name"].dropna().astype(str).tolist()
+    tbl, x = series.table(), series.values
+    roll_mean, roll_std = _rolling_mean_std(x, window, max(2, window // 2))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (x - roll_mean) / np.where(roll_std == 0, np.nan, roll_std)
+    absz = np.nan_to_num(np.abs(z), nan=0.0)
+    idx = np.flatnonzero(absz >= sigma)
+    idx = idx[np.argsort(-absz[idx], kind="stable")][:limit]
+    take = pa.array(idx, pa.int64())
+    return tbl.take(take).append_column(
+        "rolling_mean", pa.array(roll_mean[idx], from_pandas=True)
+    ).append_column("rolling_std", pa.array(roll_std[idx], from_pandas=True)).append_column("z", pa.array(z[idx], from_pandas=True))
+
+
+def _top_pipelines(executor: DuckDBExecutor, parquet_path: str, k: Optional[int] = 20) -> List[str]:
+    src, params = rollup_relation(executor, parquet_path, "pipeline_daily")
+    sql = f"SELECT pipeline_name, SUM(total_qty) AS total FROM {src} GROUP BY 1 ORDER BY 2 DESC"
+    if k is not None:
+        sql, params = sql + " LIMIT ?", params + [k]
+    tbl = executor.query(sql, params)
+    return [str(v) for v in pc.drop_null(tbl["pipeline_name"]).to_pylist()]
+
+
+def _pairs_table(names: List[str], a_idx: np.ndarray, b_idx: np.ndarray, corr: np.ndarray, pvalues: Optional[np.ndarray]) -> pa.Table:
+    labels = pa.array(names, pa.string())
+    cols: Dict[str, Any] = {
+        "a": labels.take(pa.array(a_idx, pa.int64())),
+        "b": labels.take(pa.array(b_idx, pa.int64())),
+        "corr": pa.array(corr, pa.float64()),
+    }
+    if pvalues is not None:
+        cols["pvalue"] = pa.array(pvalues, pa.float64(), from_pandas=True)
+    return pa.table(cols)
 
 
 def correlation_pipelines(
     executor: DuckDBExecutor,
     parquet_path: str,
-    top_k_pipelines: int = 20,
+    top_k_pipelines: Optional[int] = 20,
     top_pairs: int = 20,
     method: str = "pearson",
     include_pvalue: bool = False,
 ) -> pa.Table:
+    """
+    Most correlated pairs among the top_k_pipelines pipelines by volume (None: all of them), on
+    daily totals. The full matrix and its p-values come from agent.tools.correlation in a few
+    array operations; pairs are ordered by descending correlation, NaN correlations dropped.
+    """
+    empty: Dict[str, List[Any]] = {"a": [], "b": [], "corr": []}
+    if include_pvalue:
+        empty["pvalue"] = []
     pipelines = _top_pipelines(executor, parquet_path, top_k_pipelines)
     if not pipelines:
-        cols: Dict[str, List[Any]] = {"a": [], "b": [], "corr": []}
-        if include_pvalue:
-            cols["pvalue"] = []
-        return pa.table(cols)
+        return pa.table(empty)
     placeholders = ", ".join(["?"] * len(pipelines))
+    src, src_params = rollup_relation(executor, parquet_path, "pipeline_daily")
     sql = (
-        f"SELECT eff_gas_day::DATE AS day, pipeline_name, SUM(COALESCE(scheduled_quantity, 0)) AS total_qty "
-        f"FROM read_parquet(?) WHERE pipeline_name IN ({placeholders}) GROUP BY 1,2 ORDER BY 1"
+        f"SELECT day, pipeline_name, SUM(total_qty) AS total_qty "
+        f"FROM {src} WHERE pipeline_name IN ({placeholders}) GROUP BY 1,2 ORDER BY 1"
     )
-    params = [parquet_path] + pipelines
+    params = src_params + pipelines
     tbl = executor.query(sql, params)
-    df = tbl.to_pandas()
-    if df.empty:
-        cols: Dict[str, List[Any]] = {"a": [], "b": [], "corr": []}
-        if include_pvalue:
-            cols["pvalue"] = []
-        return pa.table(cols)
-    pivot = df.pivot(index="day", columns="pipeline_name", values="total_qty").fillna(0)
-    if method.lower() == "pearson":
-        corr = pivot.corr(method="pearson")
-        corr.index.name = "a"
-        corr.columns.name = "b"
-        mask = np.triu(np.ones(corr.shape), k=0).astype(bool)
-        pairs_df = corr.where(~mask).stack().reset_index(name="corr").sort_values("corr", ascending=False)
-        if include_pvalue:
-            try:
-                from scipy.stats import pearsonr  # type: ignore
-                pvals: List[float] = []
-                for a, b in pairs_df[["a", "b"]].values.tolist():
-                    r, p = pearsonr(pivot[a].values, pivot[b].values)
-                    pvals.append(float(p) if not isnan(p) else None)  # type: ignore[arg-type]
-                pairs_df["pvalue"] = pvals
-            except Exception:
-                pairs_df["pvalue"] = [None] * len(pairs_df)
-        pairs_df = pairs_df.head(top_pairs)
-        return pa.Table.from_pandas(pairs_df, preserve_index=False)
-    else:
-        # Spearman
-        try:
-            from scipy.stats import spearmanr  # type: ignore
-        except Exception:
-            # fallback to pandas spearman without p-values
-            corr = pivot.corr(method="spearman")
-            corr.index.name = "a"
-            corr.columns.name = "b"
-            mask = np.triu(np.ones(corr.shape), k=0).astype(bool)
-            corr_pairs = corr.where(~mask).stack().reset_index(name="corr").sort_values("corr", ascending=False).head(top_pairs)
-            if include_pvalue:
-                corr_pairs["pvalue"] = None
-            return pa.Table.from_pandas(corr_pairs, preserve_index=False)
-        # Compute pairwise with p-values
-        pairs: List[Tuple[str, str, float, float]] = []
-        cols = list(pivot.columns)
-        for i in range(len(cols)):
-            for j in range(i + 1, len(cols)):
-                a, b = cols[i], cols[j]
-                rho, p = spearmanr(pivot[a].values, pivot[b].values)
-                pairs.append((a, b, float(rho), float(p) if not isnan(p) else None))  # type: ignore[arg-type]
-        out = pd.DataFrame(pairs, columns=["a", "b", "corr", "pvalue"])  # type: ignore[list-item]
-        out = out.sort_values("corr", ascending=False).head(top_pairs)
-        if not include_pvalue:
-            out = out.drop(columns=["pvalue"])
-        return pa.Table.from_pandas(out, preserve_index=False)
+    if tbl.num_rows == 0:
+        return pa.table(empty)
+    _, names_arr, mat = _pivot(tbl, "day", "pipeline_name", "total_qty")
+    mat = np.nan_to_num(mat, nan=0.0)  # day x pipeline, missing days count as zero flow
+    spearman = method.lower() != "pearson"
+    corr = correlation_matrix(mat, "spearman" if spearman else "pearson")
+    i, j, r = _top_corr_pairs(corr, top_pairs)
+    pvalues: Optional[np.ndarray] = None
+    if include_pvalue:
+        pv = correlation_pvalues(r, mat.shape[0])
+        pvalues = pv if pv is not None else np.full(r.shape, np.nan)
+    # Pearson pairs are labelled (later name, earlier name), Spearman pairs (earlier, later)
+    a_idx, b_idx = (i, j) if spearman else (j, i)
+    return _pairs_table(names_arr.to_pylist(), a_idx, b_idx, r, pvalues)
 
 
-def cluster_pipelines_monthly(
+def correlated_series_pairs(
     executor: DuckDBExecutor,
     parquet_path: str,
-    k: int = 5,
-    top_k_pipelines: int = 50,
-    scaling: str = "standard",
-    algorithm: str = "kmeans",
-    seed: int = 42,
+    group_col: str = "loc_name",
+    top_pairs: int = 20,
+    method: str = "pearson",
+    min_days: int = 30,
+    max_memory_mb: int = 512,
+    threads: Optional[int] = None,
 ) -> pa.Table:
     """
-    Cluster pipelines by monthly total profiles.
-    scaling: 'standard' | 'minmax' | 'none'
-    Returns a table with pipeline_name, cluster, k, scaling, silhouette.
+    Most correlated pairs of daily `group_col` series (e.g. ~19k locations) by a blocked top-K search:
+    no dense pandas pivot and no n x n matrix. Series with fewer than `min_days` non-zero days are
+    dropped in SQL, and the (series x day) totals stream in batches straight into a float32 matrix;
+    max_memory_mb bounds the working set of the search (see agent.tools.correlation).
     """
+    # Missing days count as zero flow
+    fm = build_features(executor, parquet_path, group_col, "day", allocate=lambda shape: np.empty(shape, dtype=np.float32), min_nonzero=min_days)
+    i, j, r = top_correlated_series(fm.X, top_pairs, method=method, max_memory_mb=max_memory_mb, threads=threads)
+    # Pairs labelled (earlier key, later key)
+    labels = pa.array(fm.keys, pa.string())
+    swap = pc.greater(labels.take(pa.array(i)), labels.take(pa.array(j))).to_numpy(zero_copy_only=False)
+    a_idx, b_idx = np.where(swap, j, i), np.where(swap, i, j)
+    return _pairs_table(labels.to_pylist(), a_idx, b_idx, r, None)
+
+
+def _pipeline_profiles(executor: DuckDBExecutor, parquet_path: str, top_k_pipelines: Optional[int], scaling: str) -> Tuple[List[str], np.ndarray]:
+    """Scaled (pipeline x month) totals of the top_k_pipelines pipelines; empty when there is no data."""
     pipelines = _top_pipelines(executor, parquet_path, top_k_pipelines)
     if not pipelines:
-        return pa.table({"pipeline_name": [], "cluster": [], "k": [], "scaling": [], "silhouette": []})
+        return [], np.empty((0, 0))
     placeholders = ", ".join(["?"] * len(pipelines))
+    src, src_params = rollup_relation(executor, parquet_path, "segment_monthly")
     sql = (
-        f"SELECT date_trunc('month', eff_gas_day)::DATE AS month, pipeline_name, SUM(scheduled_quantity) AS total_qty "
-        f"FROM read_parquet(?) WHERE pipeline_name IN ({placeholders}) GROUP BY 1,2 ORDER BY 1"
+        f"SELECT month, pipeline_name, SUM(total_qty) AS total_qty "
+        f"FROM {src} WHERE pipeline_name IN ({placeholders}) GROUP BY 1,2 ORDER BY 1"
     )
-    params = [parquet_path] + pipelines
+    params = src_params + pipelines
     tbl = executor.query(sql, params)
-    df = tbl.to_pandas()
-    if df.empty:
-        return pa.table({"pipeline_name": [], "cluster": [], "k": [], "scaling": [], "silhouette": []})
-    pivot = df.pivot(index="pipeline_name", columns="month", values="total_qty").fillna(0)
+    if tbl.num_rows == 0:
+        return [], np.empty((0, 0))
+    names, _, profiles = _pivot(tbl, "pipeline_name", "month", "total_qty")
+    profiles = np.nan_to_num(profiles, nan=0.0)
     scaler = StandardScaler(with_mean=True, with_std=True) if scaling == "standard" else (MinMaxScaler() if scaling == "minmax" else None)
-    X = scaler.fit_transform(pivot.values) if scaler is not None else pivot.values
+    return names.to_pylist(), scaler.fit_transform(profiles) if scaler is not None else profiles
+
+
+def _cluster_table(names: List[str], labels: np.ndarray, k: int, scaling: str, algorithm: str, seed: int, sil: Optional[float]) -> pa.Table:
+    n = len(labels)
+    return pa.table({
+        "pipeline_name": pa.array(names, pa.string()),
+        "cluster": pa.array(labels, pa.int32()),
+        "k": pa.array(np.full(n, k), pa.int64()),
+        "scaling": pa.array([scaling] * n, pa.string()),
+        "algorithm": pa.array([algorithm] * n, pa.string()),
+        "seed": pa.array(np.full(n, seed), pa.int64()),
+        "silhouette": pa.array([sil] * n, pa.float64()),
+    })
+
+
+def cluster_pipelines_monthly(
+    executor: DuckDBExecutor,
+    parquet_path: str,
+    k: Union[int, str] = 5,
+    top_k_pipelines: Optional[int] = 50,
+    scaling: str = "standard",
+    algorithm: str = "kmeans",
+    seed: int = 42,
+) -> pa.Table:
+    """
+    Cluster pipelines by monthly total profiles (top_k_pipelines=None: all pipelines).
+    scaling: 'standard' | 'minmax' | 'none'
+    k='auto' picks k with cluster_pipelines_auto_k (which also returns the per-k stability table).
+    Returns a table with pipeline_name, cluster, k, scaling, silhouette.
+    For thousands of segments (e.g. every loc_name) use cluster_segments, which streams.
+    """
+    if k == "auto":
+        return cluster_pipelines_auto_k(executor, parquet_path, top_k_pipelines=top_k_pipelines, scaling=scaling, algorithm=algorithm)[0]
+    names, X = _pipeline_profiles(executor, parquet_path, top_k_pipelines, scaling)
+    if not names:
+        return pa.table({"pipeline_name": [], "cluster": [], "k": [], "scaling": [], "silhouette": []})
     n_samples = X.shape[0]
-    k_eff = max(1, min(k, n_samples))
+    k_eff = max(1, min(int(k), n_samples))
     if algorithm == "minibatch":
         km = MiniBatchKMeans(n_clusters=k_eff, n_init=10, random_state=seed, batch_size=min(1024, max(10, n_samples)))
     else:
@@ -273,16 +407,67 @@ def cluster_pipelines_monthly(
             sil = float(silhouette_score(X, labels))
     except Exception:
         sil = None
-    out = pd.DataFrame({
-        "pipeline_name": pivot.index.tolist(),
-        "cluster": labels.tolist(),
-        "k": [k_eff] * len(labels),
-        "scaling": [scaling] * len(labels),
-        "algorithm": [algorithm] * len(labels),
-        "seed": [seed] * len(labels),
-        "silhouette": [sil] * len(labels),
+    return _cluster_table(names, labels, k_eff, scaling, algorithm, seed, sil)
+
+
+def cluster_pipelines_auto_k(
+    executor: DuckDBExecutor,
+    parquet_path: str,
+    k_values: Sequence[int] = tuple(range(2, 11)),
+    seeds: Sequence[int] = (0, 1, 2),
+    top_k_pipelines: Optional[int] = 50,
+    scaling: str = "standard",
+    algorithm: str = "kmeans",
+    max_workers: Optional[int] = None,
+) -> Tuple[pa.Table, pa.Table]:
+    """
+    k=auto: every (k, seed) is fitted in a process pool over one scaled feature matrix and scored by
+    sampled silhouette and Davies-Bouldin (agent.tools.clustering.sweep_k). Returns the assignments
+    for the chosen k (same columns as cluster_pipelines_monthly) and one stability row per k.
+    """
+    names, X = _pipeline_profiles(executor, parquet_path, top_k_pipelines, scaling)
+    if len(names) < 3:
+        k_fixed = cluster_pipelines_monthly(executor, parquet_path, k=2, top_k_pipelines=top_k_pipelines, scaling=scaling, algorithm=algorithm)
+        return k_fixed, K_SWEEP_SCHEMA.empty_table()
+    sweep = sweep_k(X, k_values, seeds=seeds, algorithm=algorithm, max_workers=max_workers)
+    return _cluster_table(names, sweep.labels, sweep.k, scaling, algorithm, sweep.seed, sweep.silhouette), sweep.table
+
+
+def cluster_segments(
+    executor: DuckDBExecutor,
+    parquet_path: str,
+    group_col: str = "loc_name",
+    freq: str = "month",
+    k: int = 8,
+    scaling: str = "standard",
+    seed: int = 42,
+    block_rows: int = 4096,
+    silhouette_sample: int = 2000,
+    feature_store: bool = True,
+) -> pa.Table:
+    """
+    Cluster every `group_col` segment by its monthly or weekly profile, out of core: features stream
+    from DuckDB into a float32 memmap (persisted in the FeatureStore and reused across runs when
+    feature_store=True), MiniBatchKMeans is fitted with partial_fit over row blocks and silhouette
+    is computed on a sample. Same columns as cluster_pipelines_monthly, keyed by group_col.
+    """
+    if feature_store:
+        fm = FeatureStore().get_or_build(executor, parquet_path, group_col, freq)
+    else:
+        fm = build_features(executor, parquet_path, group_col, freq)
+    if not fm.keys:
+        return pa.table({group_col: [], "cluster": [], "k": [], "scaling": [], "silhouette": []})
+    fit = fit_streaming_kmeans(fm, k, scaling=scaling, seed=seed, block_rows=block_rows, silhouette_sample=silhouette_sample)
+    n = len(fm.keys)
+    return pa.table({
+        group_col: pa.array(fm.keys, pa.string()),
+        "cluster": pa.array(fit.labels, pa.int32()),
+        "k": pa.array(np.full(n, fit.k), pa.int64()),
+        "scaling": pa.array([scaling] * n, pa.string()),
+        "algorithm": pa.array(["minibatch-stream"] * n, pa.string()),
+        "seed": pa.array(np.full(n, seed), pa.int64()),
+        "silhouette": pa.array([fit.silhouette] * n, pa.float64()),
     })
-    return pa.Table.from_pandas(out, preserve_index=False)
 
 
 def trends_summary(
@@ -300,49 +485,48 @@ def trends_summary(
     """
     window_ma = window_ma or [7, 30]
     if by == "month":
-        sql = (
-            "SELECT date_trunc('month', eff_gas_day)::DATE AS period, "
-            "       SUM(COALESCE(scheduled_quantity, 0)) AS total_qty "
-            "FROM read_parquet(?) GROUP BY 1 ORDER BY 1"
-        )
-        tbl = executor.query(sql, [parquet_path])
-        df = tbl.to_pandas()
-        if df.empty:
+        src, params = rollup_relation(executor, parquet_path, "segment_monthly")
+        sql = f"SELECT month AS period, SUM(total_qty) AS total_qty FROM {src} GROUP BY 1 ORDER BY 1"
+        tbl = executor.query(sql, params)
+        if tbl.num_rows == 0:
             return pa.table({"period": [], "total_qty": [], "mom_growth": [], "yoy_growth": []})
-        df = df.sort_values("period").reset_index(drop=True)
-        df["mom_growth"] = df["total_qty"].pct_change()
+        tbl = tbl.sort_by("period")
+        x = _f64(tbl["total_qty"])
+        tbl = tbl.append_column("mom_growth", pa.array(_pct_change(x), from_pandas=True))
         if yoy:
-            df["yoy_growth"] = df["total_qty"].pct_change(12)
-        else:
-            df["yoy_growth"] = None
-        return pa.Table.from_pandas(df, preserve_index=False)
+            return tbl.append_column("yoy_growth", pa.array(_pct_change(x, 12), from_pandas=True))
+        return tbl.append_column("yoy_growth", pa.nulls(tbl.num_rows, pa.float64()))
     else:
         # daily
-        tbl = daily_totals(executor, parquet_path)
-        df = tbl.to_pandas()
-        if df.empty:
+        series = daily_series(executor, parquet_path)
+        tbl = series.table()
+        if tbl.num_rows == 0:
             cols: Dict[str, List[Any]] = {"day": [], "total_qty": []}
             for w in window_ma:
                 cols[f"ma_{w}"] = []
             return pa.table(cols)
-        df = df.sort_values("day").reset_index(drop=True)
         # Optional Polars acceleration for rolling means
         try:
             import os as _os  # type: ignore
             use_polars = _os.environ.get("USE_POLARS", "0") in {"1", "true", "True"}
             if use_polars:
                 import polars as pl  # type: ignore
-                pldf = pl.from_pandas(df)
+                pldf = pl.from_arrow(tbl)
                 for w in window_ma:
                     pldf = pldf.with_columns(pl.col("total_qty").rolling_mean(window_size=w, min_periods=max(2, w // 2)).alias(f"ma_{w}"))
-                out_df = pldf.to_pandas()
+                return pldf.to_arrow()
             else:
                 raise Exception()
         except Exception:
-            out_df = df.copy()
+            x = series.values
             for w in window_ma:
-                out_df[f"ma_{w}"] = out_df["total_qty"].rolling(window=w, min_periods=max(2, w // 2)).mean()
-        return pa.Table.from_pandas(out_df, preserve_index=False)
+                ma, _ = _rolling_mean_std(x, w, max(2, w // 2))
+                tbl = tbl.append_column(f"ma_{w}", pa.array(ma, from_pandas=True))
+            return tbl
+
+
+# Growth comparisons for top_trending_segments: months between the latest month and its baseline
+GROWTH_LAGS = {"mom": 1, "qoq": 3, "yoy": 12}
 
 
 def top_trending_segments(
@@ -351,37 +535,42 @@ def top_trending_segments(
     group_col: str = "pipeline_name",
     n: int = 10,
     min_months: int = 6,
+    growth: str = "mom",
 ) -> pa.Table:
     """
-    Identify top-K trending segments by last-month MoM growth on monthly totals.
-    group_col: dimension to group by (e.g., pipeline_name, category_short)
+    Identify top-K trending segments by growth of the latest month's total on monthly totals.
+    group_col: dimension to group by (e.g., pipeline_name, category_short, loc_name)
     min_months: require at least this many months of observations
+    growth: mom (vs previous month), qoq (vs 3 months earlier) or yoy (vs 12 months earlier)
+
+    Ranking happens in DuckDB: LAG within (key, month index mod lag) reaches the month exactly
+    `lag` months back, QUALIFY keeps each key's row for the latest month, and only the top `n`
+    rows are returned, so client memory does not grow with the number of keys.
     """
+    growth = growth.lower()
+    if growth not in GROWTH_LAGS:
+        raise ValueError(f"growth must be one of {sorted(GROWTH_LAGS)}")
+    lag = GROWTH_LAGS[growth]
     qcol = escape_ident(group_col)
+    src, params = rollup_relation(executor, parquet_path, "segment_monthly", [group_col])
     sql = (
-        f"SELECT date_trunc('month', eff_gas_day)::DATE AS month, {qcol} AS key, "
-        f"       SUM(COALESCE(scheduled_quantity, 0)) AS total "
-        f"FROM read_parquet(?) GROUP BY 1,2 ORDER BY 1"
+        "WITH monthly AS ("
+        f"  SELECT month, {qcol} AS key, SUM(total_qty) AS total,"
+        "         (EXTRACT('year' FROM month) * 12 + EXTRACT('month' FROM month))::BIGINT AS month_no"
+        f"  FROM {src} WHERE {qcol} IS NOT NULL GROUP BY 1, 2"
+        "), scored AS ("
+        "  SELECT key, month, total AS last_total,"
+        "         COUNT(*) OVER (PARTITION BY key) AS months_observed,"
+        f"         LAG(total) OVER (PARTITION BY key, month_no % {lag} ORDER BY month) AS base_total,"
+        f"         month_no - LAG(month_no) OVER (PARTITION BY key, month_no % {lag} ORDER BY month) AS gap"
+        "  FROM monthly"
+        "  QUALIFY month = MAX(month) OVER ()"
+        f") SELECT key, last_total / base_total - 1 AS {growth}_growth, months_observed, last_total"
+        f" FROM scored WHERE gap = {lag} AND months_observed >= ?"
+        f"   AND isfinite(last_total / base_total - 1)"
+        f" ORDER BY {growth}_growth DESC, key LIMIT ?"
     )
-    tbl = executor.query(sql, [parquet_path])
-    df = tbl.to_pandas()
-    if df.empty:
-        return pa.table({"key": [], "mom_growth": [], "months_observed": [], "last_total": []})
-    df = df.sort_values("month")
-    pivot = df.pivot(index="month", columns="key", values="total").sort_index()
-    growth = pivot.pct_change()
-    last_growth = growth.tail(1).T
-    last_total = pivot.tail(1).T
-    months_observed = pivot.notna().sum(axis=0)
-    out = pd.DataFrame({
-        "key": last_growth.index,
-        "mom_growth": last_growth.iloc[:, 0].values,
-        "months_observed": months_observed.values,
-        "last_total": last_total.iloc[:, 0].values,
-    })
-    out = out.replace([np.inf, -np.inf], np.nan).dropna(subset=["mom_growth"])  # type: ignore[list-item]
-    out = out[out["months_observed"] >= int(min_months)].sort_values("mom_growth", ascending=False).head(int(n))
-    return pa.Table.from_pandas(out, preserve_index=False)
+    return executor.query(sql, params + [int(min_months), max(int(n), 0)])
 
 
 def seasonality_summary(
@@ -394,20 +583,134 @@ def seasonality_summary(
     """
     if group_col:
         qcol = escape_ident(group_col)
+        src, params = rollup_relation(executor, parquet_path, "segment_monthly", [group_col])
         sql = (
             f"WITH monthly AS ("
-            f"  SELECT date_trunc('month', eff_gas_day)::DATE AS ym, EXTRACT('month' FROM eff_gas_day)::INT AS month, {qcol} AS key,"
-            f"         SUM(COALESCE(scheduled_quantity, 0)) AS total_month "
-            f"  FROM read_parquet(?) GROUP BY 1,2,3"
+            f"  SELECT month AS ym, EXTRACT('month' FROM month)::INT AS month, {qcol} AS key,"
+            f"         SUM(total_qty) AS total_month "
+            f"  FROM {src} GROUP BY 1,2,3"
             f") SELECT month, key, AVG(total_month) AS avg_total FROM monthly GROUP BY 1,2 ORDER BY 1,2"
         )
-        return executor.query(sql, [parquet_path])
+        return executor.query(sql, params)
     else:
+        src, params = rollup_relation(executor, parquet_path, "segment_monthly")
         sql = (
             "WITH monthly AS ("
-            "  SELECT date_trunc('month', eff_gas_day)::DATE AS ym, EXTRACT('month' FROM eff_gas_day)::INT AS month,"
-            "         SUM(COALESCE(scheduled_quantity, 0)) AS total_month "
-            "  FROM read_parquet(?) GROUP BY 1,2"
+            "  SELECT month AS ym, EXTRACT('month' FROM month)::INT AS month,"
+            "         SUM(total_qty) AS total_month "
+            f"  FROM {src} GROUP BY 1,2"
             ") SELECT month, AVG(total_month) AS avg_total FROM monthly GROUP BY 1 ORDER BY 1"
         )
-        return executor.query(sql, [parquet_path])
+        return executor.query(sql, params)
+
+
+def seasonal_decomposition(
+    executor: DuckDBExecutor,
+    parquet_path: str,
+    group_col: Optional[str] = "pipeline_name",
+    seasonality: Sequence[str] = ("week", "year"),
+    harmonics: int = 3,
+    trend_knots: int = 4,
+    robust: bool = False,
+    max_workers: Optional[int] = None,
+) -> pa.Table:
+    """
+    Trend + seasonal + residual decomposition of every segment's daily totals in one batch
+    (Fourier regression with a piecewise-linear trend, see agent.tools.decomposition).
+    One row per segment (or one for the network total when group_col is None), strongest
+    seasonality first. Periods longer than the observed span are left out of the fit.
+    """
+    series = daily_series(executor, parquet_path, by=group_col)
+    days = series.days.to_numpy(zero_copy_only=False).astype("datetime64[D]")
+    Y = series.values if group_col else series.values[None, :]
+    span = float((days[-1] - days[0]).astype(np.int64)) + 1 if days.shape[0] else 0.0
+    kept = [name for name in seasonality if PERIODS.get(name, 0.0) <= span]
+    if days.shape[0] == 0 or Y.shape[0] == 0:
+        return pa.table({group_col or "series": pa.array([], pa.string())})
+    basis = decomposition_basis(days, kept, harmonics=harmonics, trend_knots=trend_knots)
+    stats = decompose_batch(basis, Y, robust=robust, max_workers=max_workers)
+    keys = series.keys if group_col else pa.array(["total"])
+    order = np.lexsort((np.arange(Y.shape[0]), -np.nan_to_num(stats["seasonal_strength"], nan=-1.0)))
+    cols: Dict[str, Any] = {group_col or "series": keys.take(pa.array(order, pa.int64())), "n_days": pa.array(np.full(order.shape[0], days.shape[0]), pa.int64())}
+    for name, values in stats.items():
+        cols[name] = pa.array(values[order], pa.int64() if name.startswith("peak_") else pa.float64())
+    cols["seasonality"] = pa.array(["+".join(kept) or "none"] * order.shape[0])
+    cols["method"] = pa.array(["fourier-robust" if robust else "fourier-ols"] * order.shape[0])
+    return pa.table(cols)
+
+
+# freq -> (season length, horizon unit)
+FORECAST_FREQUENCIES = {"day": (7, "D"), "month": (12, "M")}
+
+
+def _monthly_matrix(executor: DuckDBExecutor, parquet_path: str, group_col: Optional[str]) -> Tuple[pa.Array, np.ndarray, np.ndarray]:
+    """(keys, months as datetime64[M], keys x months totals with 0 for missing months) from the monthly rollup."""
+    if group_col:
+        src, params = rollup_relation(executor, parquet_path, "segment_monthly", [group_col])
+        tbl = executor.query(f"SELECT {escape_ident(group_col)} AS key, month, SUM(total_qty) AS total FROM {src} GROUP BY 1, 2", params)
+    else:
+        src, params = rollup_relation(executor, parquet_path, "segment_monthly")
+        tbl = executor.query(f"SELECT 'total' AS key, month, SUM(total_qty) AS total FROM {src} GROUP BY 1, 2", params)
+    keys, months, mat = _pivot(tbl, "key", "month", "total")
+    periods = months.to_numpy(zero_copy_only=False).astype("datetime64[M]")
+    return keys, periods, np.nan_to_num(mat, nan=0.0)
+
+
+def forecast(
+    executor: DuckDBExecutor,
+    parquet_path: str,
+    group_col: Optional[str] = "pipeline_name",
+    freq: str = "day",
+    horizon: int = 14,
+    methods: Sequence[str] = ("seasonal_naive", "holt_winters"),
+    max_workers: Optional[int] = None,
+) -> Tuple[pa.Table, pa.Table]:
+    """
+    Horizon forecasts of every segment's daily (weekly season) or monthly (yearly season) totals
+    with 95% intervals, fitted for all segments at once (agent.tools.forecasting), plus a backtest
+    table: each method refitted without the last `horizon` periods and scored on them (MAE, RMSE,
+    MASE against the in-sample seasonal naive). Returns (forecasts, backtest).
+    """
+    if freq not in FORECAST_FREQUENCIES:
+        raise ValueError(f"freq must be one of {sorted(FORECAST_FREQUENCIES)}")
+    season, unit = FORECAST_FREQUENCIES[freq]
+    if freq == "day":
+        series = daily_series(executor, parquet_path, by=group_col)
+        keys = series.keys if group_col else pa.array(["total"])
+        periods = series.days.to_numpy(zero_copy_only=False).astype("datetime64[D]")
+        Y = series.values if group_col else series.values[None, :]
+    else:
+        keys, periods, Y = _monthly_matrix(executor, parquet_path, group_col)
+    horizon = max(int(horizon), 1)
+    holdout = min(horizon, Y.shape[1] - 2 * season)
+    fcs, errors = forecast_batch(Y, season, horizon, methods, holdout=max(holdout, 0), max_workers=max_workers)
+    key_name = group_col or "series"
+    n = Y.shape[0]
+    future = periods[-1] + np.arange(1, horizon + 1).astype(f"timedelta64[{unit}]") if periods.shape[0] else np.array([], dtype=f"datetime64[{unit}]")
+    day_type = pa.date32()
+    fc_parts, bt_parts = [], []
+    key_idx = np.repeat(np.arange(n), horizon)
+    for method, (fc, se) in fcs.items():
+        fc_parts.append(pa.table({
+            key_name: keys.take(pa.array(key_idx, pa.int64())),
+            "period": pa.array(np.tile(future.astype("datetime64[D]"), n), day_type),
+            "method": pa.array([method] * (n * horizon)),
+            "forecast": pa.array(fc.ravel(), pa.float64()),
+            "lower": pa.array((fc - Z_95 * se).ravel(), pa.float64()),
+            "upper": pa.array((fc + Z_95 * se).ravel(), pa.float64()),
+        }))
+        if errors is not None:
+            bt_parts.append(pa.table({
+                key_name: keys,
+                "method": pa.array([method] * n),
+                "mae": pa.array(errors[method]["mae"], pa.float64()),
+                "rmse": pa.array(errors[method]["rmse"], pa.float64()),
+                "mase": pa.array(errors[method]["mase"], pa.float64()),
+                "holdout": pa.array(np.full(n, holdout), pa.int64()),
+            }))
+    forecasts = pa.concat_tables(fc_parts)
+    if bt_parts:
+        backtest = pa.concat_tables(bt_parts)
+    else:
+        backtest = pa.table({key_name: pa.array([], keys.type), "method": pa.array([], pa.string()), "mae": pa.array([], pa.float64()), "rmse": pa.array([], pa.float64()), "mase": pa.array([], pa.float64()), "holdout": pa.array([], pa.int64())})
+    return forecasts, backtest
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+from typing import Any, Callable, Coroutine, Dict, Optional, Tuple
+
+from agent.exec.duck import AsyncDuckDBExecutor
+from agent.tools import analytics
+
+
+def _async_variant(fn: Callable[..., Any]) -> Callable[..., Coroutine[Any, Any, Any]]:
+    # Same signature as the sync tool, with an AsyncDuckDBExecutor in place of the executor
+    @functools.wraps(fn)
+    async def wrapper(executor: AsyncDuckDBExecutor, parquet_path: str, *args: Any, **kwargs: Any) -> Any:
+        return await executor.run(fn, parquet_path, *args, **kwargs)
+
+    wrapper.__name__ = wrapper.__qualname__ = f"{fn.__name__}_async"
+    return wrapper
+
+
+daily_totals_async = _async_variant(analytics.daily_totals)
+top_k_by_async = _async_variant(analytics.top_k_by)
+anomaly_candidates_async = _async_variant(analytics.anomaly_candidates)
+anomalies_vs_category_async = _async_variant(analytics.anomalies_vs_category)
+anomalies_iqr_async = _async_variant(analytics.anomalies_iqr)
+sudden_shifts_async = _async_variant(analytics.sudden_shifts)
+correlation_pipelines_async = _async_variant(analytics.correlation_pipelines)
+cluster_pipelines_monthly_async = _async_variant(analytics.cluster_pipelines_monthly)
+trends_summary_async = _async_variant(analytics.trends_summary)
+top_trending_segments_async = _async_variant(analytics.top_trending_segments)
+seasonality_summary_async = _async_variant(analytics.seasonality_summary)
+seasonal_decomposition_async = _async_variant(analytics.seasonal_decomposition)
+forecast_async = _async_variant(analytics.forecast)
+
+
+async def correlation_and_clustering(
+    executor: AsyncDuckDBExecutor,
+    parquet_path: str,
+    correlation_kwargs: Optional[Dict[str, Any]] = None,
+    clustering_kwargs: Optional[Dict[str, Any]] = None,
+) -> Tuple[Any, Any]:
+    """Composite question: pipeline correlation and monthly clustering with their scans overlapped."""
+    return tuple(await asyncio.gather(
+        correlation_pipelines_async(executor, parquet_path, **(correlation_kwargs or {})),
+        cluster_pipelines_monthly_async(executor, parquet_path, **(clustering_kwargs or {})),
+    ))  # type: ignore[return-value]
@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from agent.exec.duck import DuckDBExecutor
+from agent.exec.rollups import rollup_relation
+from agent.exec.series import f64
+from agent.exec.sql_builder import escape_ident
+from agent.utils.fingerprint import cache_root, dataset_fingerprint, path_key
+from agent.utils.parallel import map_tasks
+
+# Out-of-core clustering of many segments (e.g. ~19k locations) by their monthly or weekly
+# profiles. Features stream from DuckDB into a float32 (segment x period) matrix backed by a
+# memory-mapped file, and every later pass (scaling, partial_fit, predict) reads it block by block.
+FEATURE_VERSION = 1
+# freq -> (rollup, period expression over its columns, datediff unit)
+FREQUENCIES = {
+    "day": ("pipeline_daily", "day", "day"),
+    "month": ("segment_monthly", "month", "month"),
+    "week": ("pipeline_daily", "date_trunc('week', day)::DATE", "week"),
+}
+
+
+@dataclass
+class FeatureMatrix:
+    """(segment x period) float32 totals; `X` is usually a read-only memmap, so slice it per block."""
+
+    keys: List[str]
+    first_period: date
+    freq: str
+    X: np.ndarray
+
+    def blocks(self, block_rows: int) -> Iterator[Tuple[int, np.ndarray]]:
+        for start in range(0, self.X.shape[0], block_rows):
+            yield start, np.asarray(self.X[start:start + block_rows])
+
+
+def _n_periods(first: date, last: date, freq: str) -> int:
+    if freq == "month":
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    if freq == "day":
+        return (last - first).days + 1
+    return (last - first).days // 7 + 1
+
+
+def _period_start(d: date, freq: str) -> date:
+    if freq == "day":
+        return d
+    return d.replace(day=1) if freq == "month" else d - timedelta(days=d.weekday())
+
+
+class FeatureStore:
+    """
+    float32 feature matrices persisted under `cache_root()/features` as .npy files (opened with
+    mmap_mode='r') plus a JSON sidecar with keys and the dataset fingerprint; rebuilt when the
+    dataset changes.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None) -> None:
+        self.cache_dir = cache_dir or os.path.join(cache_root(), "features")
+
+    def _paths(self, parquet_path: str, group_col: str, freq: str) -> Tuple[str, str]:
+        base = os.path.join(self.cache_dir, f"{path_key(parquet_path)}_{group_col}_{freq}")
+        return base + ".npy", base + ".json"
+
+    def load(self, parquet_path: str, group_col: str, freq: str) -> Optional[FeatureMatrix]:
+        npy, meta_path = self._paths(parquet_path, group_col, freq)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != FEATURE_VERSION or meta.get("fingerprint") != dataset_fingerprint(parquet_path):
+                return None
+            X = np.load(npy, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        return FeatureMatrix(keys=meta["keys"], first_period=date.fromisoformat(meta["first_period"]), freq=freq, X=X)
+
+    def get_or_build(self, executor: DuckDBExecutor, parquet_path: str, group_col: str, freq: str) -> FeatureMatrix:
+        cached = self.load(parquet_path, group_col, freq)
+        if cached is not None:
+            return cached
+        os.makedirs(self.cache_dir, exist_ok=True)
+        npy, meta_path = self._paths(parquet_path, group_col, freq)
+        fp = dataset_fingerprint(parquet_path)
+        # Build into private files and rename so concurrent agents never read a partial matrix
+        tmp = f"{npy}.tmp-{os.getpid()}"
+        built = build_features(executor, parquet_path, group_col, freq, lambda shape: np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=shape))
+        keys, first_period = built.keys, built.first_period
+        if not keys:
+            return built
+        built.X.flush()  # type: ignore[attr-defined]
+        del built
+        os.replace(tmp, npy)
+        meta = {"version": FEATURE_VERSION, "fingerprint": fp, "keys": keys, "first_period": first_period.isoformat()}
+        with open(f"{meta_path}.tmp-{os.getpid()}", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(f"{meta_path}.tmp-{os.getpid()}", meta_path)
+        return FeatureMatrix(keys=keys, first_period=first_period, freq=freq, X=np.load(npy, mmap_mode="r"))
+
+
+def _temporary_memmap(shape: Tuple[int, int]) -> np.ndarray:
+    # Anonymous file: removed when the memmap is garbage collected
+    return np.memmap(tempfile.TemporaryFile(prefix="synmax-features-"), dtype=np.float32, mode="w+", shape=shape)
+
+
+def build_features(
+    executor: DuckDBExecutor,
+    parquet_path: str,
+    group_col: str = "loc_name",
+    freq: str = "month",
+    allocate: Any = None,
+    batch_rows: int = 65536,
+    min_nonzero: int = 0,
+) -> FeatureMatrix:
+    """
+    Stream per-(segment, period) totals sorted by segment and scatter them into a zero-filled
+    (segment x period) float32 matrix from `allocate(shape)` (a temporary memmap by default).
+    Segments with fewer than `min_nonzero` non-zero periods are dropped in SQL.
+    """
+    if freq not in FREQUENCIES:
+        raise ValueError(f"freq must be one of {sorted(FREQUENCIES)}, got {freq!r}")
+    rollup, period_expr, unit = FREQUENCIES[freq]
+    qcol = escape_ident(group_col)
+    src, params = rollup_relation(executor, parquet_path, rollup, [group_col])
+    base = (
+        f"WITH s AS (SELECT {qcol} AS key, {period_expr} AS period, SUM(total_qty) AS total_qty FROM {src} "
+        f"WHERE {qcol} IS NOT NULL AND {period_expr} IS NOT NULL GROUP BY 1, 2"
+        + (" QUALIFY COUNT(*) FILTER (WHERE SUM(total_qty) <> 0) OVER (PARTITION BY key) >= ?" if min_nonzero > 0 else "")
+        + ") "
+    )
+    if min_nonzero > 0:
+        params = params + [int(min_nonzero)]
+    keys_tbl = executor.query(base + "SELECT CAST(key AS VARCHAR) AS key, MIN(period) AS first, MAX(period) AS last FROM s GROUP BY key ORDER BY key", params)
+    keys = keys_tbl["key"].to_pylist()
+    if not keys:
+        return FeatureMatrix(keys=[], first_period=date.today(), freq=freq, X=np.zeros((0, 1), dtype=np.float32))
+    allocate = allocate or _temporary_memmap
+    first = _period_start(pc.min(keys_tbl["first"]).as_py(), freq)
+    last = pc.max(keys_tbl["last"]).as_py()
+    X = allocate((len(keys), _n_periods(first, last, freq)))
+    X[:] = 0.0
+    sql = base + (
+        f"SELECT (DENSE_RANK() OVER (ORDER BY key) - 1)::BIGINT AS key_no, datediff('{unit}', ?::DATE, period)::BIGINT AS idx, "
+        "total_qty FROM s ORDER BY 1, 2"
+    )
+    for batch in executor.query_batches(sql, params + [first.isoformat()], batch_rows=batch_rows):
+        X[batch.column(0).to_numpy(), batch.column(1).to_numpy()] = f64(batch.column(2))
+    return FeatureMatrix(keys=keys, first_period=first, freq=freq, X=X)
+
+
+def _scaler(scaling: str) -> Any:
+    if scaling == "standard":
+        return StandardScaler()
+    if scaling == "minmax":
+        return MinMaxScaler()
+    return None
+
+
+@dataclass
+class StreamingFit:
+    labels: np.ndarray  # int32 per segment
+    k: int
+    silhouette: Optional[float]
+    inertia: float
+
+
+def fit_streaming_kmeans(
+    fm: FeatureMatrix,
+    k: int,
+    scaling: str = "standard",
+    seed: int = 42,
+    block_rows: int = 4096,
+    epochs: int = 3,
+    silhouette_sample: int = 2000,
+) -> StreamingFit:
+    """
+    MiniBatchKMeans fitted with partial_fit over shuffled row blocks (scaler statistics from a
+    first partial_fit pass), labels predicted block by block and silhouette scored on a random
+    sample of at most `silhouette_sample` segments. Peak memory is a few blocks, not the matrix.
+    """
+    n = fm.X.shape[0]
+    k_eff = max(1, min(k, n))
+    block_rows = max(block_rows, k_eff)
+    scaler = _scaler(scaling)
+    if scaler is not None:
+        for _, block in fm.blocks(block_rows):
+            scaler.partial_fit(block)
+
+    def transform(block: np.ndarray) -> np.ndarray:
+        return scaler.transform(block) if scaler is not None else block
+
+    rng = np.random.default_rng(seed)
+    starts = np.arange(0, n, block_rows)
+    km = MiniBatchKMeans(n_clusters=k_eff, random_state=seed, batch_size=block_rows, n_init=3)
+    for _ in range(max(1, epochs)):
+        order = rng.permutation(starts)
+        if n - order[0] < k_eff:  # the first partial_fit call needs at least k rows (initialization)
+            order = np.roll(order, -1)
+        for start in order:
+            km.partial_fit(transform(np.asarray(fm.X[start:start + block_rows])))
+    labels = np.empty(n, dtype=np.int32)
+    inertia = 0.0
+    for start, block in fm.blocks(block_rows):
+        xb = transform(block)
+        labels[start:start + xb.shape[0]] = km.predict(xb)
+        inertia += float(-km.score(xb))
+    sil = None
+    if k_eff > 1 and n > k_eff:
+        idx = np.sort(rng.choice(n, size=min(n, silhouette_sample), replace=False))
+        sample_labels = labels[idx]
+        if len(np.unique(sample_labels)) > 1:
+            try:
+                sil = float(silhouette_score(transform(np.asarray(fm.X[idx])), sample_labels))
+            except Exception:
+                sil = None
+    return StreamingFit(labels=labels, k=k_eff, silhouette=sil, inertia=inertia)
+
+
+# k=auto: fits for every (k, seed) run in a process pool over one scaled feature matrix, shared
+# with the workers as a memory-mapped .npy instead of being pickled per task.
+_SWEEP_X: Optional[np.ndarray] = None
+_SWEEP_SAMPLE: Optional[np.ndarray] = None
+
+
+def _sweep_init(path: str, sample_idx: np.ndarray) -> None:
+    global _SWEEP_X, _SWEEP_SAMPLE
+    # One BLAS/OpenMP thread per pool worker; a serial sweep runs in this process and keeps its threads
+    if multiprocessing.parent_process() is not None:
+        try:
+            from threadpoolctl import threadpool_limits  # sklearn dependency
+
+            threadpool_limits(1)
+        except Exception:
+            pass
+    _SWEEP_X = np.load(path, mmap_mode="r")
+    _SWEEP_SAMPLE = sample_idx
+
+
+def _sweep_fit(task: Tuple[int, int, str]) -> Dict[str, Any]:
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import davies_bouldin_score
+
+    k, seed, algorithm = task
+    X = np.asarray(_SWEEP_X)
+    if algorithm == "minibatch":
+        km: Any = MiniBatchKMeans(n_clusters=k, n_init=1, random_state=seed, batch_size=min(1024, max(10, X.shape[0])))
+    else:
+        km = KMeans(n_clusters=k, n_init=1, random_state=seed)
+    labels = km.fit_predict(X).astype(np.int32)
+    sil = db = None
+    if len(np.unique(labels)) > 1:
+        sample = _SWEEP_SAMPLE if _SWEEP_SAMPLE is not None else slice(None)
+        if len(np.unique(labels[sample])) > 1:
+            sil = float(silhouette_score(X[sample], labels[sample]))
+        db = float(davies_bouldin_score(X, labels))
+    return {"k": k, "seed": seed, "labels": labels, "inertia": float(km.inertia_), "silhouette": sil, "davies_bouldin": db}
+
+
+# One row per k of a sweep
+K_SWEEP_SCHEMA = pa.schema([
+    ("k", pa.int64()),
+    ("silhouette_mean", pa.float64()),
+    ("silhouette_std", pa.float64()),
+    ("davies_bouldin_mean", pa.float64()),
+    ("inertia_mean", pa.float64()),
+    ("stability_ari", pa.float64()),
+    ("n_seeds", pa.int64()),
+    ("chosen", pa.bool_()),
+])
+
+
+@dataclass
+class KSweep:
+    """The chosen k, the labels of its best-scoring seed, and one summary row per k."""
+
+    k: int
+    seed: int
+    labels: np.ndarray
+    silhouette: Optional[float]
+    table: pa.Table
+
+
+def _mean(values: List[Optional[float]]) -> Optional[float]:
+    vals = [v for v in values if v is not None]
+    return float(np.mean(vals)) if vals else None
+
+
+def _stability(labelings: List[np.ndarray]) -> Optional[float]:
+    """Mean pairwise adjusted Rand index between the seeds' labelings (1.0: identical partitions)."""
+    from sklearn.metrics import adjusted_rand_score
+
+    scores = [adjusted_rand_score(a, b) for i, a in enumerate(labelings) for b in labelings[i + 1:]]
+    return float(np.mean(scores)) if scores else None
+
+
+def sweep_k(
+    X: np.ndarray,
+    k_values: Sequence[int],
+    seeds: Sequence[int] = (0, 1, 2),
+    algorithm: str = "kmeans",
+    silhouette_sample: int = 2000,
+    max_workers: Optional[int] = None,
+) -> KSweep:
+    """
+    Fit every (k, seed) with n_init=1 in a process pool (seeds stand in for KMeans' restarts) and
+    score each fit by silhouette on a fixed sample and by Davies-Bouldin. The chosen k has the highest
+    mean silhouette (to 2 decimals); ties go to the lower mean Davies-Bouldin, then the more stable
+    k (mean pairwise ARI across seeds), then the smaller one.
+    """
+    n = X.shape[0]
+    ks = sorted({int(k) for k in k_values if 2 <= int(k) < n})
+    if not ks:
+        raise ValueError(f"k=auto needs at least 3 rows to cluster, got {n}")
+    rng = np.random.default_rng(0)
+    sample_idx = np.sort(rng.choice(n, size=min(n, silhouette_sample), replace=False))
+    tasks = [(k, int(s), algorithm) for k in ks for s in seeds]
+    tmpdir = tempfile.mkdtemp(prefix="synmax-ksweep-")
+    path = os.path.join(tmpdir, "X.npy")
+    try:
+        np.save(path, np.ascontiguousarray(X))
+        fits = map_tasks(_sweep_fit, tasks, max_workers or os.cpu_count(), initializer=_sweep_init, initargs=(path, sample_idx))
+    finally:
+        global _SWEEP_X, _SWEEP_SAMPLE
+        _SWEEP_X = _SWEEP_SAMPLE = None
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    rows: List[Dict[str, Any]] = []
+    for k in ks:
+        per_k = [f for f in fits if f["k"] == k]
+        rows.append({
+            "k": k,
+            "silhouette_mean": _mean([f["silhouette"] for f in per_k]),
+            "silhouette_std": float(np.std([f["silhouette"] for f in per_k if f["silhouette"] is not None])) if any(f["silhouette"] is not None for f in per_k) else None,
+            "davies_bouldin_mean": _mean([f["davies_bouldin"] for f in per_k]),
+            "inertia_mean": _mean([f["inertia"] for f in per_k]),
+            "stability_ari": _stability([f["labels"] for f in per_k]),
+            "n_seeds": len(per_k),
+        })
+
+    def preference(r: Dict[str, Any]) -> Tuple[float, float, float, int]:
+        sil = r["silhouette_mean"] if r["silhouette_mean"] is not None else -np.inf
+        db = r["davies_bouldin_mean"] if r["davies_bouldin_mean"] is not None else np.inf
+        return (round(sil, 2), -db, r["stability_ari"] or 0.0, -r["k"])
+
+    best = max(range(len(rows)), key=lambda i: preference(rows[i]))
+    for i, r in enumerate(rows):
+        r["chosen"] = i == best
+    chosen_k = rows[best]["k"]
+    top = max((f for f in fits if f["k"] == chosen_k), key=lambda f: (f["silhouette"] if f["silhouette"] is not None else -np.inf, -f["seed"]))
+    return KSweep(k=chosen_k, seed=top["seed"], labels=top["labels"], silhouette=top["silhouette"], table=pa.Table.from_pylist(rows, schema=K_SWEEP_SCHEMA))
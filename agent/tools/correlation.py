@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Correlation of many series at once: columns of an (observations x series) matrix are the
+# variables. Everything is whole-matrix NumPy work; no per-pair Python loop.
+
+
+def rank_columns(x: np.ndarray) -> np.ndarray:
+    """Average ranks (1-based, ties share their mean rank) of each column, as scipy.stats.rankdata."""
+    n = x.shape[0]
+    order = np.argsort(x, axis=0, kind="stable")
+    xs = np.take_along_axis(x, order, axis=0)
+    pos = np.arange(n)[:, None]
+    starts = np.ones(xs.shape, dtype=bool)
+    starts[1:] = xs[1:] != xs[:-1]
+    ends = np.ones(xs.shape, dtype=bool)
+    ends[:-1] = starts[1:]
+    first = np.maximum.accumulate(np.where(starts, pos, 0), axis=0)
+    last = np.minimum.accumulate(np.where(ends, pos, n - 1)[::-1], axis=0)[::-1]
+    ranks = np.empty(x.shape, dtype=np.float64)
+    np.put_along_axis(ranks, order, (first + last) / 2.0 + 1.0, axis=0)
+    return ranks
+
+
+def standardize_columns(x: np.ndarray, dtype: type = np.float64) -> np.ndarray:
+    """Columns centred and scaled to unit norm, so Z.T @ Z is the Pearson matrix; constant columns become NaN."""
+    z = np.asarray(x, dtype=dtype)
+    z = z - z.mean(axis=0)
+    norms = np.sqrt(np.einsum("ij,ij->j", z, z))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z /= np.where(norms == 0, np.nan, norms).astype(dtype)
+    return z
+
+
+def correlation_matrix(x: np.ndarray, method: str = "pearson") -> np.ndarray:
+    """Series x series Pearson (or Spearman: Pearson on average ranks) matrix; NaN for constant series."""
+    if method.lower() == "spearman":
+        x = rank_columns(x)
+    z = standardize_columns(x)
+    return np.clip(z.T @ z, -1.0, 1.0)
+
+
+def correlation_pvalues(corr: np.ndarray, n_obs: int) -> Optional[np.ndarray]:
+    """
+    Two-sided p-values of H0: rho = 0 from t = r * sqrt((n - 2) / (1 - r^2)) with n - 2 degrees of
+    freedom (the test scipy's pearsonr/spearmanr use). None when scipy is not installed.
+    """
+    try:
+        from scipy.special import stdtr  # type: ignore
+    except Exception:
+        return None
+    df = n_obs - 2
+    if df <= 0:
+        return np.full(corr.shape, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = corr * np.sqrt(df / ((1.0 - corr) * (1.0 + corr)))
+    return 2.0 * stdtr(df, -np.abs(t))
+
+
+def top_pairs(corr: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The k most positively correlated pairs (i < j) of a symmetric matrix, in descending order
+    (ties by pair position); NaN entries are skipped. Selection is argpartition, so only the
+    k winners get sorted.
+    """
+    ii, jj = np.triu_indices(corr.shape[0], k=1)
+    vals = corr[ii, jj]
+    cand = np.flatnonzero(~np.isnan(vals))
+    if 0 <= k < cand.shape[0]:
+        cand = cand[np.argpartition(-vals[cand], k - 1)[:k]] if k > 0 else cand[:0]
+    cand = cand[np.lexsort((cand, -vals[cand]))]
+    return ii[cand], jj[cand], vals[cand]
+
+
+# Blocked top-K search for series counts where the full matrix does not fit in memory
+# (~19k locations -> a 19k x 19k float64 matrix is ~3GB). Series are rows of a float32
+# matrix of unit-norm centred vectors; tiles of Z_a @ Z_b.T are reduced to running top-K
+# candidates as they are produced, so only one tile per worker is alive at a time.
+_TILE_BYTES_PER_CELL = 13  # float32 product + its partitioned copy + boolean masks (surviving cells are O(k))
+_MIN_TILE = 64
+_BLOCK_ROWS = 4096
+_STANDARDIZE_BYTES_PER_CELL = 16  # gathered input rows + their float64 copy
+_RANK_BYTES_PER_CELL = 80  # rank_columns' sort order, sorted copy, tie masks, tie bounds and ranks
+
+
+def standardize_rows(x: np.ndarray, block_rows: int = _BLOCK_ROWS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (series x observations) -> float32 rows centred and scaled to unit norm, plus the indices of
+    the rows kept (constant series have no correlation and are dropped).
+    """
+    keep = np.flatnonzero(x.max(axis=1) > x.min(axis=1)) if x.size else np.empty(0, dtype=np.int64)
+    z = np.empty((keep.shape[0], x.shape[1]), dtype=np.float32)
+    step = max(int(block_rows), 1)
+    for start in range(0, keep.shape[0], step):  # float64 arithmetic, one block of rows at a time
+        rows = np.asarray(x[keep[start:start + step]], dtype=np.float64)
+        rows -= rows.mean(axis=1, keepdims=True)
+        rows /= np.sqrt(np.einsum("ij,ij->i", rows, rows))[:, None]
+        z[start:start + rows.shape[0]] = rows
+    return z, keep
+
+
+def rank_rows(x: np.ndarray, block_rows: int = _BLOCK_ROWS) -> np.ndarray:
+    """Average ranks of each row of a (series x observations) matrix as float32, ranked one block of rows at a time."""
+    ranks = np.empty(x.shape, dtype=np.float32)
+    step = max(int(block_rows), 1)
+    for start in range(0, x.shape[0], step):
+        ranks[start:start + step] = rank_columns(np.asarray(x[start:start + step]).T).T
+    return ranks
+
+
+def tile_size(budget_bytes: int, workers: int = 1) -> int:
+    """Largest square tile whose working set, times the number of workers, fits in budget_bytes."""
+    return max(_MIN_TILE, int(np.sqrt(max(budget_bytes, 0) / (_TILE_BYTES_PER_CELL * max(workers, 1)))))
+
+
+def _reduce(i: np.ndarray, j: np.ndarray, r: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if r.shape[0] > k:
+        sel = np.argpartition(-r, k - 1)[:k]
+        i, j, r = i[sel], j[sel], r[sel]
+    return i, j, r
+
+
+def _scan_blocks(z: np.ndarray, k: int, tile: int, blocks: range) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    n = z.shape[0]
+    best_i = best_j = np.empty(0, dtype=np.int64)
+    best_r = np.empty(0, dtype=np.float32)
+    floor = -np.inf
+    for a0 in blocks:
+        za = z[a0:a0 + tile]
+        for b0 in range(a0, n, tile):
+            c = za @ z[b0:b0 + tile].T
+            if b0 == a0:
+                c[np.tri(c.shape[0], c.shape[1], dtype=bool)] = -np.inf  # each pair once, no self pairs
+            flat = c.ravel()
+            above = flat > floor
+            if np.count_nonzero(above) > k:
+                # Only the tile's k largest can enter the running top-k: index arrays stay O(k), not O(tile)
+                above &= flat >= np.partition(flat, flat.shape[0] - k)[flat.shape[0] - k]
+            hit = np.flatnonzero(above)
+            if hit.shape[0] == 0:
+                continue
+            best_i = np.concatenate([best_i, a0 + hit // c.shape[1]])
+            best_j = np.concatenate([best_j, b0 + hit % c.shape[1]])
+            best_r = np.concatenate([best_r, flat[hit]])
+            best_i, best_j, best_r = _reduce(best_i, best_j, best_r, k)
+            if best_r.shape[0] == k:
+                floor = float(best_r.min())
+    return best_i, best_j, best_r
+
+
+def blocked_top_pairs(
+    z: np.ndarray,
+    k: int,
+    tile: int = 2048,
+    threads: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Top-k most positively correlated pairs (i < j) among the rows of a standardized float32 matrix
+    (see standardize_rows), in descending order, without materializing the n x n matrix. With
+    `threads` > 1, row blocks are spread over a thread pool (BLAS releases the GIL).
+    """
+    n = z.shape[0]
+    if k <= 0 or n < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float64)
+    tile = max(1, min(tile, n))
+    starts = range(0, n, tile)
+    workers = max(1, min(threads or 1, len(starts)))
+    if workers == 1:
+        parts = [_scan_blocks(z, k, tile, starts)]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        # Interleaved row blocks: early blocks have more tiles to their right
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(lambda w: _scan_blocks(z, k, tile, starts[w::workers]), range(workers)))
+    i = np.concatenate([p[0] for p in parts])
+    j = np.concatenate([p[1] for p in parts])
+    r = np.concatenate([p[2] for p in parts]).astype(np.float64)
+    i, j, r = _reduce(i, j, r, k)
+    order = np.lexsort((j, i, -r))
+    return i[order], j[order], np.minimum(r[order], 1.0)
+
+
+def top_correlated_series(
+    x: np.ndarray,
+    k: int,
+    method: str = "pearson",
+    max_memory_mb: int = 512,
+    threads: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Top-k correlated pairs among the rows of a (series x observations) matrix, with peak working
+    memory bounded by max_memory_mb: the input, its float32 standardized copy (and float32 ranks
+    for spearman, while they are standardized), one block of rows being ranked or standardized,
+    then one tile per worker. Returns row indices into `x` (i < j) and the correlations, in
+    descending order.
+    """
+    n, m = x.shape
+    limit = max_memory_mb * 1024 * 1024
+    spearman = method.lower() == "spearman"
+    resident = x.nbytes + n * m * 4 * (2 if spearman else 1)
+    per_row = m * (_RANK_BYTES_PER_CELL if spearman else _STANDARDIZE_BYTES_PER_CELL)
+    block_rows = min((limit - resident) // max(per_row, 1), _BLOCK_ROWS)
+    if block_rows < 1:
+        raise ValueError(f"max_memory_mb={max_memory_mb} is too small: the input and its {'ranked and ' if spearman else ''}standardized copies alone need {resident / 2**20:.0f}MB")
+    source = rank_rows(x, block_rows) if spearman else x
+    z, keep = standardize_rows(source, block_rows)
+    del source
+    budget = limit - x.nbytes - z.nbytes
+    if budget < _TILE_BYTES_PER_CELL * _MIN_TILE * _MIN_TILE:
+        raise ValueError(f"max_memory_mb={max_memory_mb} is too small: the input and its standardized matrix alone need {(x.nbytes + z.nbytes) / 2**20:.0f}MB")
+    workers = max(1, threads or 1)
+    i, j, r = blocked_top_pairs(z, k, tile=tile_size(budget, workers), threads=workers)
+    return keep[i], keep[j], r
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agent.utils.parallel import map_tasks, row_blocks
+
+# Trend + seasonal + residual decomposition of many daily series at once by Fourier regression:
+#   y(t) = a + b t + sum_j c_j max(0, t - knot_j)             (piecewise-linear trend)
+#        + sum_p sum_h [s_ph sin(2 pi h t / P) + c_ph cos(2 pi h t / P)]   (seasonal terms)
+# Every series shares the same time axis, hence the same design matrix X, so ordinary least squares
+# for all of them is one product with pinv(X). The robust variant (bisquare-weighted IRLS, as STL's
+# robustness loop) needs one weighted solve per series, done as a batched np.linalg.solve.
+PERIODS = {"week": 7.0, "year": 365.25}
+_ROBUST_ITERATIONS = 3
+
+
+@dataclass(frozen=True)
+class DecompositionBasis:
+    """Shared design matrix over the days of a series; `season_cols[name]` are X's columns of one period."""
+
+    days: np.ndarray  # datetime64[D]
+    X: np.ndarray  # days x terms
+    pinv: np.ndarray  # terms x days
+    trend_cols: slice
+    season_cols: Dict[str, slice]
+
+    @property
+    def span_years(self) -> float:
+        return float((self.days[-1] - self.days[0]).astype(np.int64)) / 365.25
+
+
+def decomposition_basis(
+    days: np.ndarray,
+    seasonality: Sequence[str] = ("week", "year"),
+    harmonics: int = 3,
+    trend_knots: int = 4,
+) -> DecompositionBasis:
+    """
+    Design matrix for `days` (sorted datetime64[D]). Trend knots are evenly spaced inside the span;
+    weekly terms get at most 3 harmonics (7-day period). Raises ValueError for an unknown period.
+    """
+    days = np.asarray(days, dtype="datetime64[D]")
+    t_days = (days - days[0]).astype(np.float64)
+    t = t_days / 365.25  # years: keeps the trend columns on the scale of the Fourier ones
+    span = t[-1] if t.shape[0] else 0.0
+    cols: List[np.ndarray] = [np.ones_like(t), t]
+    for knot in np.linspace(0.0, span, max(int(trend_knots), 0) + 2)[1:-1]:
+        cols.append(np.maximum(t - knot, 0.0))
+    trend_cols = slice(0, len(cols))
+    season_cols: Dict[str, slice] = {}
+    for name in seasonality:
+        if name not in PERIODS:
+            raise ValueError(f"unknown seasonality {name!r}; expected one of {sorted(PERIODS)}")
+        period = PERIODS[name]
+        start = len(cols)
+        for h in range(1, min(int(harmonics), int(period // 2)) + 1):
+            angle = 2.0 * np.pi * h * t_days / period
+            cols.extend([np.sin(angle), np.cos(angle)])
+        season_cols[name] = slice(start, len(cols))
+    X = np.column_stack(cols)
+    return DecompositionBasis(days=days, X=X, pinv=np.linalg.pinv(X), trend_cols=trend_cols, season_cols=season_cols)
+
+
+def fit_coefficients(basis: DecompositionBasis, Y: np.ndarray, robust: bool = False) -> np.ndarray:
+    """(series x terms) least-squares coefficients for the rows of Y (series x days)."""
+    Y = np.asarray(Y, dtype=np.float64)
+    beta = Y @ basis.pinv.T
+    if not robust:
+        return beta
+    X = basis.X
+    ridge = 1e-9 * np.eye(X.shape[1])
+    for _ in range(_ROBUST_ITERATIONS):
+        resid = Y - beta @ X.T
+        scale = 6.0 * np.median(np.abs(resid), axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            u = np.where(scale > 0, resid / scale, 0.0)
+        w = np.where(np.abs(u) < 1.0, (1.0 - u * u) ** 2, 0.0)
+        xtwx = np.einsum("nt,tp,tq->npq", w, X, X, optimize=True) + ridge
+        xtwy = (w * Y) @ X
+        beta = np.linalg.solve(xtwx, xtwy[..., None])[..., 0]
+    return beta
+
+
+def components(basis: DecompositionBasis, Y: np.ndarray, beta: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(trend, seasonal, residual), each series x days; seasonal sums every period."""
+    X = basis.X
+    trend = beta[:, basis.trend_cols] @ X[:, basis.trend_cols].T
+    seasonal = beta[:, basis.trend_cols.stop:] @ X[:, basis.trend_cols.stop:].T
+    return trend, seasonal, np.asarray(Y, dtype=np.float64) - trend - seasonal
+
+
+def _strength(component: np.ndarray, resid: np.ndarray) -> np.ndarray:
+    """max(0, 1 - var(R) / var(C + R)) per series (Wang, Smith & Hyndman); NaN for flat series."""
+    total = np.var(component + resid, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = 1.0 - np.var(resid, axis=1) / np.where(total > 0, total, np.nan)
+    return np.clip(out, 0.0, 1.0)
+
+
+def _profile(part: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
+    """Mean of `part` per calendar group (month / weekday) for every series: series x groups."""
+    onehot = np.zeros((groups.shape[0], n_groups))
+    onehot[np.arange(groups.shape[0]), groups] = 1.0
+    counts = onehot.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (part @ onehot) / np.where(counts > 0, counts, np.nan)
+
+
+def summarize_chunk(basis: DecompositionBasis, Y: np.ndarray, robust: bool = False) -> Dict[str, np.ndarray]:
+    """Per-series decomposition statistics for one block of rows (components are not kept)."""
+    beta = fit_coefficients(basis, Y, robust=robust)
+    trend, seasonal, resid = components(basis, Y, beta)
+    span = basis.span_years
+    out = {
+        "trend_change_per_year": (trend[:, -1] - trend[:, 0]) / span if span > 0 else np.full(Y.shape[0], np.nan),
+        "trend_strength": _strength(trend, resid),
+        "seasonal_strength": _strength(seasonal, resid),
+        "resid_std": resid.std(axis=1),
+    }
+    X = basis.X
+    if "year" in basis.season_cols:
+        cols = basis.season_cols["year"]
+        months = basis.days.astype("datetime64[M]").astype(np.int64) % 12
+        profile = _profile(beta[:, cols] @ X[:, cols].T, months, 12)
+        out["yearly_amplitude"] = np.nanmax(profile, axis=1) - np.nanmin(profile, axis=1)
+        out["peak_month"] = np.nanargmax(profile, axis=1) + 1
+    if "week" in basis.season_cols:
+        cols = basis.season_cols["week"]
+        weekdays = (basis.days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday; 0 = Monday
+        profile = _profile(beta[:, cols] @ X[:, cols].T, weekdays, 7)
+        out["weekly_amplitude"] = profile.max(axis=1) - profile.min(axis=1)
+        out["peak_weekday"] = profile.argmax(axis=1)
+    return out
+
+
+def _summarize_task(args: Tuple[DecompositionBasis, np.ndarray, bool]) -> Dict[str, np.ndarray]:
+    return summarize_chunk(*args)
+
+
+def decompose_batch(
+    basis: DecompositionBasis,
+    Y: np.ndarray,
+    robust: bool = False,
+    chunk_rows: int = 1024,
+    max_workers: Optional[int] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Decomposition statistics for every row of Y (series x days), `chunk_rows` series at a time so
+    the components of only one block are alive. With max_workers > 1 blocks are spread over a
+    process pool (worth it for the robust fit, whose per-series solves dominate).
+    """
+    parts = map_tasks(_summarize_task, [(basis, block, robust) for block in row_blocks(Y, chunk_rows)], max_workers)
+    if not parts:
+        return {}
+    return {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
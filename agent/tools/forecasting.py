@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+from itertools import product
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agent.utils.parallel import map_tasks, row_blocks
+
+# Forecasts for many series at once. Rows of Y (series x periods) are the series; every recursion
+# steps through time once and updates the state of all series (and, for Holt-Winters, of every
+# candidate smoothing-parameter set) with whole-array operations.
+METHODS = ("seasonal_naive", "holt_winters")
+# Holt-Winters smoothing parameters searched per series (alpha, beta, gamma)
+HW_GRID = tuple(product((0.1, 0.3, 0.6), (0.01, 0.1), (0.05, 0.2, 0.5)))
+Z_95 = 1.959963984540054
+
+
+def seasonal_naive(Y: np.ndarray, season: int, horizon: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Forecast = value one season earlier. Returns (series x horizon forecasts, series x horizon
+    standard errors); the error of step h grows with the number of seasons it reaches ahead.
+    """
+    T = Y.shape[1]
+    steps = np.arange(horizon)
+    fc = Y[:, T - season + steps % season]
+    resid = Y[:, season:] - Y[:, :-season]
+    sigma = np.sqrt(np.mean(resid * resid, axis=1)) if resid.shape[1] else np.full(Y.shape[0], np.nan)
+    return fc, sigma[:, None] * np.sqrt(steps // season + 1.0)[None, :]
+
+
+def _hw_init(Y: np.ndarray, season: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    first = Y[:, :season].mean(axis=1)
+    trend = (Y[:, season:2 * season].mean(axis=1) - first) / season
+    level = first + trend * (season - 1) / 2.0  # level at the end of the first season
+    seasonal = Y[:, :season] - first[:, None]
+    return level, trend, seasonal
+
+
+def holt_winters(
+    Y: np.ndarray,
+    season: int,
+    horizon: int,
+    grid: Sequence[Tuple[float, float, float]] = HW_GRID,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Additive Holt-Winters (level, trend, seasonal) for every row of Y (needs 2 full seasons).
+    Each series takes the (alpha, beta, gamma) of `grid` with the lowest one-step-ahead squared
+    error; all series x all candidates run through one pass over time. Returns (forecasts,
+    standard errors, chosen parameters), the first two series x horizon, the last series x 3.
+    """
+    n, T = Y.shape
+    params = np.asarray(grid, dtype=np.float64)  # G x 3
+    alpha, beta, gamma = (params[:, i][None, :] for i in range(3))
+    level, trend, seasonal = _hw_init(Y, season)
+    G = params.shape[0]
+    level = np.repeat(level[:, None], G, axis=1)
+    trend = np.repeat(trend[:, None], G, axis=1)
+    # Time and season slot lead, so each step reads and writes contiguous (series x candidates) blocks
+    seasonal = np.ascontiguousarray(np.repeat(seasonal.T[:, :, None], G, axis=2))  # season x n x G, slot t % season
+    cols = np.ascontiguousarray(Y.T)
+    sse = np.zeros((n, G))
+    err, fit, prev = np.empty((n, G)), np.empty((n, G)), np.empty((n, G))
+    one_a, one_b, one_g = 1 - alpha, 1 - beta, 1 - gamma
+    # In-place updates: the loop is bound by memory traffic over the n x G state arrays
+    for t in range(season, T):
+        y = cols[t][:, None]
+        s = seasonal[t % season]
+        np.add(level, trend, out=fit)  # level + trend: the non-seasonal one-step prediction
+        np.subtract(y, fit, out=err)
+        err -= s
+        np.square(err, out=prev)
+        sse += prev
+        prev[...] = level
+        # level = alpha (y - s) + (1 - alpha)(level + trend) = (level + trend) + alpha * err
+        np.multiply(err, alpha, out=level)
+        level += fit
+        # trend = beta (level - prev) + (1 - beta) trend
+        trend *= one_b
+        np.subtract(level, prev, out=prev)
+        prev *= beta
+        trend += prev
+        # s = gamma (y - level) + (1 - gamma) s
+        s *= one_g
+        np.subtract(y, level, out=prev)
+        prev *= gamma
+        s += prev
+    seasonal = seasonal.transpose(1, 2, 0)  # n x G x season
+    best = np.argmin(sse, axis=1)
+    rows = np.arange(n)
+    level, trend, seasonal = level[rows, best], trend[rows, best], seasonal[rows, best]
+    chosen = params[best]
+    sigma = np.sqrt(sse[rows, best] / max(T - season, 1))
+    steps = np.arange(1, horizon + 1)
+    fc = level[:, None] + trend[:, None] * steps[None, :] + seasonal[:, (T - 1 + steps) % season]
+    # h-step variance of the additive model: sigma^2 (1 + sum_{j<h} c_j^2), c_j = a(1 + j b) + g [j % m == 0]
+    j = steps[:-1]
+    c = chosen[:, :1] * (1 + j[None, :] * chosen[:, 1:2]) + chosen[:, 2:3] * (j % season == 0)[None, :]
+    var_mult = 1.0 + np.concatenate([np.zeros((n, 1)), np.cumsum(c * c, axis=1)], axis=1)
+    return fc, sigma[:, None] * np.sqrt(var_mult), chosen
+
+
+def forecast_methods(Y: np.ndarray, season: int, horizon: int, methods: Sequence[str] = METHODS) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """method -> (forecasts, standard errors), both series x horizon."""
+    out: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    for method in methods:
+        if method == "seasonal_naive":
+            out[method] = seasonal_naive(Y, season, horizon)
+        elif method == "holt_winters":
+            fc, se, _ = holt_winters(Y, season, horizon)
+            out[method] = (fc, se)
+        else:
+            raise ValueError(f"unknown forecast method {method!r}; expected one of {METHODS}")
+    return out
+
+
+def backtest_errors(Y: np.ndarray, season: int, holdout: int, methods: Sequence[str] = METHODS) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Fit on all but the last `holdout` periods and score the forecasts of those periods:
+    method -> {mae, rmse, mase} per series (MASE scales by the in-sample seasonal-naive MAE).
+    """
+    train, test = Y[:, :-holdout], Y[:, -holdout:]
+    naive_mae = np.mean(np.abs(train[:, season:] - train[:, :-season]), axis=1)
+    out: Dict[str, Dict[str, np.ndarray]] = {}
+    for method, (fc, _) in forecast_methods(train, season, holdout, methods).items():
+        err = test - fc
+        mae = np.mean(np.abs(err), axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mase = mae / np.where(naive_mae > 0, naive_mae, np.nan)
+        out[method] = {"mae": mae, "rmse": np.sqrt(np.mean(err * err, axis=1)), "mase": mase}
+    return out
+
+
+def _forecast_task(args: Tuple[np.ndarray, int, int, Tuple[str, ...], int]) -> Tuple[Dict[str, Tuple[np.ndarray, np.ndarray]], Optional[Dict[str, Dict[str, np.ndarray]]]]:
+    Y, season, horizon, methods, holdout = args
+    backtest = backtest_errors(Y, season, holdout, methods) if holdout else None
+    return forecast_methods(Y, season, horizon, methods), backtest
+
+
+def forecast_batch(
+    Y: np.ndarray,
+    season: int,
+    horizon: int,
+    methods: Sequence[str] = METHODS,
+    holdout: int = 0,
+    chunk_rows: int = 1024,
+    max_workers: Optional[int] = None,
+) -> Tuple[Dict[str, Tuple[np.ndarray, np.ndarray]], Optional[Dict[str, Dict[str, np.ndarray]]]]:
+    """
+    Forecasts (and, with `holdout` > 0, backtest errors) for every row of Y, `chunk_rows` series at
+    a time so the Holt-Winters search state stays small; max_workers > 1 spreads chunks over a
+    process pool. Raises ValueError when the series are too short for the seasonal methods.
+    """
+    need = 2 * season + holdout
+    if Y.shape[1] < need:
+        raise ValueError(f"need at least {need} periods (2 seasons of {season}, plus {holdout} held out); have {Y.shape[1]}")
+    tasks = [(block, season, horizon, tuple(methods), holdout) for block in row_blocks(Y, chunk_rows)]
+    parts = map_tasks(_forecast_task, tasks, max_workers)
+    if not parts:
+        empty = np.empty((0, horizon))
+        return {m: (empty, empty) for m in methods}, None
+    forecasts = {m: (np.concatenate([p[0][m][0] for p in parts]), np.concatenate([p[0][m][1] for p in parts])) for m in methods}
+    backtest = None
+    if holdout:
+        backtest = {m: {k: np.concatenate([p[1][m][k] for p in parts]) for k in ("mae", "rmse", "mase")} for m in methods}  # type: ignore[index]
+    return forecasts, backtest
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import json
+import os
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.exec.dataset import DAY_COLUMN, SORT_KEYS, ParquetDataset, file_day_bounds, resolve_dataset
+from agent.exec.duck import DuckDBConfig, DuckDBExecutor
+from agent.exec.rollups import RollupStore
+from agent.exec.sql_builder import escape_ident
+from agent.utils.fingerprint import dataset_fingerprint
+
+STATE_FILE = "_ingest_state.json"
+# Partition directories ingest knows how to place new days into
+DAY_PARTITION_KEYS = ("year", "month", DAY_COLUMN)
+
+
+def _sql_str(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _day_list(days: List[date]) -> str:
+    return ", ".join(f"DATE '{d.isoformat()}'" for d in days)
+
+
+def _read_files(files: List[str]) -> str:
+    # Explicit file list, read by column name and without inferring partition columns from paths
+    return f"read_parquet([{', '.join(_sql_str(f) for f in files)}], union_by_name = true, hive_partitioning = false)"
+
+
+def _read_dataset_files(ds: ParquetDataset, files: List[str]) -> str:
+    # Same reader options as the full dataset scan, so partition columns match what the rollups saw
+    return f"read_parquet([{', '.join(_sql_str(f) for f in files)}]{ds.options_sql()})"
+
+
+def load_state(dataset_dir: str) -> Dict[str, Any]:
+    path = os.path.join(dataset_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_state(dataset_dir: str, state: Dict[str, Any]) -> None:
+    path = os.path.join(dataset_dir, STATE_FILE)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def current_watermark(executor: DuckDBExecutor, ds: ParquetDataset, state: Dict[str, Any]) -> Optional[date]:
+    """Last gas day processed: from the ingest state, else the dataset's partition dirs / footer statistics."""
+    if state.get("watermark"):
+        return date.fromisoformat(state["watermark"])
+    files = ds.files()
+    if not files:
+        return None
+    highs = []
+    for f in files:
+        bounds = file_day_bounds(f)
+        if bounds is None:
+            row = executor.query(f"SELECT MAX({DAY_COLUMN})::DATE AS hi FROM {_read_files(files)}").to_pylist()
+            return row[0]["hi"] if row else None
+        highs.append(bounds[1])
+    return max(highs)
+
+
+def _partition_dir(ds: ParquetDataset, day: date) -> str:
+    values = {"year": str(day.year), "month": f"{day.month:02d}", DAY_COLUMN: day.isoformat()}
+    return os.path.join(ds.path, *[f"{k}={values[k]}" for k in ds.hive_keys])
+
+
+def _unique_path(directory: str, stem: str) -> str:
+    path = os.path.join(directory, f"{stem}.parquet")
+    n = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f"{stem}-{n}.parquet")
+        n += 1
+    return path
+
+
+def _stage(executor: DuckDBExecutor, relation: str, where: str, out_path: str, order: str) -> str:
+    """Write the rows for `out_path` to a private temp file next to it (not matched by dataset globs); returns its path."""
+    tmp = f"{out_path}.tmp-{os.getpid()}"
+    executor.query(
+        f"COPY (SELECT * FROM {relation} WHERE {where}"
+        + (f" ORDER BY {order}" if order else "")
+        + f") TO {_sql_str(tmp)} (FORMAT PARQUET, COMPRESSION ZSTD)"
+    )
+    return tmp
+
+
+def ingest_files(
+    dataset_dir: str,
+    new_files: List[str],
+    restate: bool = False,
+    use_rollups: bool = True,
+    rollups: Optional[RollupStore] = None,
+    settings: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Append new gas days from `new_files` to a parquet dataset directory and fold them into the
+    cached rollups and profile statistics without rescanning history.
+
+    Days after the watermark (last processed gas day) are appended as new files. Days at or before
+    it are late data: skipped, or with `restate` they replace the rows the dataset holds for those
+    days (files holding them are rewritten without them). Only the incoming rows and the restated
+    days' old rows are aggregated. The watermark and a log of batches live in `_ingest_state.json`
+    inside the dataset directory. `settings` are DuckDB connection settings (see DuckDBConfig.settings).
+    """
+    dataset_dir = os.path.abspath(dataset_dir)
+    ds = resolve_dataset(dataset_dir)
+    if not isinstance(ds, ParquetDataset) or not os.path.isdir(dataset_dir):
+        raise ValueError(f"ingest appends to a parquet dataset directory, not {dataset_dir}")
+    unknown = [k for k in ds.hive_keys if k not in DAY_PARTITION_KEYS]
+    if unknown:
+        raise ValueError(f"cannot place new days into partition directories keyed on {', '.join(unknown)}")
+    existing = {os.path.abspath(f) for f in ds.files()}
+    new_files = [os.path.abspath(f) for f in new_files]
+    inside = [f for f in new_files if f in existing]
+    if inside:
+        raise ValueError(f"already part of the dataset: {', '.join(inside)}")
+
+    # DuckDBConfig.settings() keys are the config's resource fields; ingest is never cut off by a deadline
+    executor = DuckDBExecutor(DuckDBConfig(timeout_sec=0, **(settings or {})))
+    if rollups is None and use_rollups:
+        rollups = RollupStore()
+    try:
+        return _ingest(executor, ds, new_files, restate, rollups)
+    finally:
+        executor.close()
+
+
+def _ingest(executor: DuckDBExecutor, ds: ParquetDataset, new_files: List[str], restate: bool, store: Optional[RollupStore]) -> Dict[str, Any]:
+    dataset_dir = ds.path
+    state = load_state(dataset_dir)
+    watermark = current_watermark(executor, ds, state)
+    old_fp = dataset_fingerprint(dataset_dir) if ds.files() else ""
+
+    executor.query(f"CREATE TEMP TABLE _ingest_incoming AS SELECT * FROM {_read_files(new_files)} WHERE {DAY_COLUMN} IS NOT NULL")
+    days = [r["day"] for r in executor.query(f"SELECT DISTINCT {DAY_COLUMN}::DATE AS day FROM _ingest_incoming ORDER BY 1").to_pylist()]
+    new_days = [d for d in days if watermark is None or d > watermark]
+    late_days = [d for d in days if watermark is not None and d <= watermark]
+    restated = late_days if restate else []
+    skipped = [] if restate else late_days
+    accepted = new_days + restated
+    report: Dict[str, Any] = {
+        "dataset": dataset_dir,
+        "new_days": [d.isoformat() for d in new_days],
+        "restated_days": [d.isoformat() for d in restated],
+        "skipped_days": [d.isoformat() for d in skipped],
+        "rows_added": 0,
+        "rows_removed": 0,
+        "files_written": [],
+        "files_rewritten": [],
+        "rollups": "none",
+    }
+    if not accepted:
+        report["watermark"] = watermark.isoformat() if watermark else None
+        return report
+
+    columns = [r["column_name"] for r in executor.query("DESCRIBE SELECT * FROM _ingest_incoming").to_pylist()]
+    order = ", ".join(escape_ident(c) for c in SORT_KEYS if c in columns)
+    executor.query(f"CREATE TEMP TABLE _ingest_added AS SELECT * FROM _ingest_incoming WHERE {DAY_COLUMN}::DATE IN ({_day_list(accepted)})")
+    report["rows_added"] = int(executor.query("SELECT COUNT(*) AS n FROM _ingest_added").to_pylist()[0]["n"])
+
+    removed: Optional[str] = None
+    if restated:
+        # Files that may hold the restated days: footer/partition pruning, then an exact count
+        candidates = ds.files_for_days((min(restated).isoformat(), max(restated).isoformat()))
+        holders = []
+        for f in candidates:
+            n = executor.query(f"SELECT COUNT(*) AS n FROM {_read_files([f])} WHERE {DAY_COLUMN}::DATE IN ({_day_list(restated)})").to_pylist()[0]["n"]
+            if n:
+                holders.append(f)
+        executor.query(
+            f"CREATE TEMP TABLE _ingest_removed AS SELECT * FROM "
+            + (f"{_read_dataset_files(ds, holders)} WHERE {DAY_COLUMN}::DATE IN ({_day_list(restated)})" if holders else "_ingest_added LIMIT 0")
+        )
+        removed = "_ingest_removed"
+        report["rows_removed"] = int(executor.query("SELECT COUNT(*) AS n FROM _ingest_removed").to_pylist()[0]["n"])
+
+    # Every output is staged in a temp file first; the dataset only changes once all of them are written,
+    # and the new rows land before the restated ones leave their old files, so a failure never drops days.
+    written: List[Tuple[str, str]] = []  # (temp file, final path) of the batch files
+    rewritten: List[Tuple[str, str]] = []  # the same for holders that keep rows of other days
+    emptied: List[str] = []
+    try:
+        if restated:
+            keep = f"{DAY_COLUMN} IS NULL OR {DAY_COLUMN}::DATE NOT IN ({_day_list(restated)})"
+            for f in holders:
+                left = executor.query(f"SELECT COUNT(*) AS n FROM {_read_files([f])} WHERE {keep}").to_pylist()[0]["n"]
+                if left:
+                    rewritten.append((_stage(executor, _read_files([f]), keep, f, order), f))
+                else:
+                    emptied.append(f)
+                report["files_rewritten"].append(f)
+        # One file per batch (per partition directory for hive layouts), sorted for zonemap/row-group pruning
+        by_dir: Dict[str, List[date]] = {}
+        for d in accepted:
+            by_dir.setdefault(_partition_dir(ds, d), []).append(d)
+        for directory, part_days in by_dir.items():
+            os.makedirs(directory, exist_ok=True)
+            lo, hi = min(part_days), max(part_days)
+            out = _unique_path(directory, f"gas_days_{lo.isoformat()}_{hi.isoformat()}")
+            written.append((_stage(executor, "_ingest_added", f"{DAY_COLUMN}::DATE IN ({_day_list(part_days)})", out, order), out))
+            report["files_written"].append(out)
+    except BaseException:
+        for tmp, _ in written + rewritten:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        raise
+    for tmp, out in written + rewritten:
+        os.replace(tmp, out)
+    for f in emptied:
+        os.remove(f)
+
+    new_fp = dataset_fingerprint(dataset_dir)
+    if store is not None and old_fp:
+        added = _read_dataset_files(ds, report["files_written"])
+        updated = store.apply_increment(executor, dataset_dir, old_fp, new_fp, added, removed)
+        report["rollups"] = "updated" if updated else "rebuilt on next use"
+
+    if new_days and (watermark is None or max(new_days) > watermark):
+        watermark = max(new_days)
+    report["watermark"] = watermark.isoformat() if watermark else None
+    state["watermark"] = report["watermark"]
+    state.setdefault("batches", []).append({
+        "ingested_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "sources": new_files,
+        "new_days": report["new_days"],
+        "restated_days": report["restated_days"],
+        "skipped_days": report["skipped_days"],
+        "rows_added": report["rows_added"],
+        "rows_removed": report["rows_removed"],
+        "files_written": [os.path.relpath(f, dataset_dir) for f in report["files_written"]],
+    })
+    _save_state(dataset_dir, state)
+    return report
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from agent.exec.dataset import DAY_COLUMN, SORT_KEYS, is_glob, resolve_dataset
+
+DICTIONARY_COLUMNS = ["pipeline_name", "category_short", "state_abb"]
+DEFAULT_ROW_GROUP_SIZE = 122_880  # ~1 week of gas days per row group on the full feed
+
+
+@dataclass
+class ScanProbe:
+    """Columns and day range a standard question reads; used to estimate bytes scanned."""
+    question: str
+    columns: List[str]
+    day_range: Optional[Tuple[date, date]] = None
+
+
+def standard_probes(first_day: date, last_day: date) -> List[ScanProbe]:
+    year = last_day.year
+    year_range = (date(year, 1, 1), date(year, 12, 31))
+    return [
+        ScanProbe("top 5 pipeline_name by scheduled_quantity", ["pipeline_name", "scheduled_quantity"]),
+        ScanProbe(f"sum scheduled_quantity by month in {year}", ["eff_gas_day", "scheduled_quantity"], year_range),
+        ScanProbe(
+            f"anomalous points vs categories in {year}",
+            ["eff_gas_day", "category_short", "loc_name", "state_abb", "rec_del_sign", "scheduled_quantity"],
+            year_range,
+        ),
+        ScanProbe(
+            "pipeline totals over the last 30 gas days",
+            ["eff_gas_day", "pipeline_name", "scheduled_quantity"],
+            (last_day - timedelta(days=29), last_day),
+        ),
+        ScanProbe(f"total scheduled_quantity in TX in {year}", ["eff_gas_day", "state_abb", "scheduled_quantity"], year_range),
+    ]
+
+
+def _as_date(v: Any) -> Any:
+    return v.date() if hasattr(v, "date") else v
+
+
+def estimate_scan_bytes(files: List[str], columns: List[str], day_range: Optional[Tuple[date, date]] = None) -> int:
+    """
+    Compressed bytes DuckDB must read for `columns`, skipping row groups whose
+    eff_gas_day min/max statistics fall outside `day_range`.
+    """
+    total = 0
+    for f in files:
+        md = pq.ParquetFile(f).metadata
+        names = md.schema.names
+        idx = {n: i for i, n in enumerate(names)}
+        for rg in range(md.num_row_groups):
+            group = md.row_group(rg)
+            if day_range is not None and DAY_COLUMN in idx:
+                st = group.column(idx[DAY_COLUMN]).statistics
+                if st is not None and st.has_min_max:
+                    if _as_date(st.max) < day_range[0] or _as_date(st.min) > day_range[1]:
+                        continue
+            for c in columns:
+                if c in idx:
+                    total += group.column(idx[c]).total_compressed_size
+    return total
+
+
+def optimize_dataset(
+    src_path: str,
+    out_path: str,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    compression_level: Optional[int] = None,
+    batch_rows: int = 65_536,
+    settings: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Rewrite the dataset as one parquet file sorted by (eff_gas_day, pipeline_name), with zstd
+    compression, dictionary-encoded low-cardinality strings and fixed-size row groups so
+    day-range filters can skip row groups via min/max statistics.
+    Returns a report with file sizes and before/after bytes scanned for the standard questions.
+    `settings` are DuckDB connection settings (see DuckDBConfig.settings).
+    """
+    ds = resolve_dataset(src_path)
+    # Sorting 24M rows may exceed memory; let DuckDB spill instead of preserving input order
+    con = duckdb.connect(database=":memory:", config={"preserve_insertion_order": False, **(settings or {})})
+    source_sql, params = ds.relation()
+    columns = [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {source_sql}", params).fetchall()]
+    order = ", ".join(c for c in SORT_KEYS if c in columns)
+    sql = f"SELECT * FROM {source_sql}" + (f" ORDER BY {order}" if order else "")
+    reader = con.execute(sql, params).to_arrow_reader(batch_rows)
+
+    tmp = f"{out_path}.tmp-{os.getpid()}"
+    writer = pq.ParquetWriter(
+        tmp,
+        reader.schema,
+        compression="zstd",
+        compression_level=compression_level,
+        use_dictionary=[c for c in DICTIONARY_COLUMNS if c in columns],
+        write_statistics=True,
+    )
+    pending: List[pa.RecordBatch] = []
+    pending_rows = 0
+    rows_written = 0
+    try:
+        # Buffer stream batches so every row group (except the last) has exactly row_group_size rows
+        for batch in reader:
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= row_group_size:
+                tbl = pa.Table.from_batches(pending)
+                full = (pending_rows // row_group_size) * row_group_size
+                writer.write_table(tbl.slice(0, full), row_group_size=row_group_size)
+                rows_written += full
+                rest = tbl.slice(full)
+                pending = rest.to_batches()
+                pending_rows = rest.num_rows
+        if pending_rows:
+            writer.write_table(pa.Table.from_batches(pending), row_group_size=row_group_size)
+            rows_written += pending_rows
+        writer.close()
+    except BaseException:
+        writer.close()
+        os.remove(tmp)
+        raise
+    finally:
+        con.close()
+    os.replace(tmp, out_path)
+
+    before_files = ds.files()
+    first_day, last_day = _day_bounds(out_path)
+    probes = standard_probes(first_day, last_day) if first_day and last_day else []
+    scans = []
+    for p in probes:
+        before = estimate_scan_bytes(before_files, p.columns, p.day_range)
+        after = estimate_scan_bytes([out_path], p.columns, p.day_range)
+        scans.append({"question": p.question, "bytes_before": before, "bytes_after": after})
+    out_md = pq.ParquetFile(out_path).metadata
+    return {
+        "source": src_path,
+        "output": out_path,
+        "rows": rows_written,
+        "row_groups": out_md.num_row_groups,
+        "row_group_size": row_group_size,
+        "file_bytes_before": sum(os.path.getsize(f) for f in before_files),
+        "file_bytes_after": os.path.getsize(out_path),
+        "scans": scans,
+    }
+
+
+def _day_bounds(path: str) -> Tuple[Optional[date], Optional[date]]:
+    md = pq.ParquetFile(path).metadata
+    if DAY_COLUMN not in md.schema.names:
+        return None, None
+    idx = md.schema.names.index(DAY_COLUMN)
+    lo: Optional[date] = None
+    hi: Optional[date] = None
+    for rg in range(md.num_row_groups):
+        st = md.row_group(rg).column(idx).statistics
+        if st is None or not st.has_min_max:
+            continue
+        mn, mx = _as_date(st.min), _as_date(st.max)
+        lo = mn if lo is None or mn < lo else lo
+        hi = mx if hi is None or mx > hi else hi
+    return lo, hi
+
+
+def default_output_path(src_path: str) -> str:
+    # Sibling of the source (never inside a dataset directory/glob, where it would be re-read)
+    base = src_path.rstrip(os.sep)
+    while is_glob(base):
+        base = os.path.dirname(base)
+    if base.endswith(".parquet"):
+        base = base[: -len(".parquet")]
+    return base + ".optimized.parquet"
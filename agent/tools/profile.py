@@ -2,12 +2,14 @@ from __future__ import annotations
 
 from typing import Dict, Any, List, Optional
 
+from agent.exec.dataset import scan_relation
 from agent.exec.duck import DuckDBExecutor
 
 
 def profile_dataset(executor: DuckDBExecutor, parquet_path: str, sample_rows: int = 1000) -> Dict[str, Any]:
     # Schema (names and types) via DuckDB's DESCRIBE
-    schema = executor.query("DESCRIBE SELECT * FROM read_parquet(?) LIMIT 0", [parquet_path])
+    source_sql, params = scan_relation(parquet_path)
+    schema = executor.query(f"DESCRIBE SELECT * FROM {source_sql} LIMIT 0", params)
     schema_df = schema.to_pandas()
     cols = [c for c in schema_df["column_name"].tolist() if c and c != ""] if "column_name" in schema_df.columns else []
 
@@ -15,7 +17,7 @@ def profile_dataset(executor: DuckDBExecutor, parquet_path: str, sample_rows: in
     stats: Dict[str, Any] = {}
     if cols:
         # Use sampling for speed
-        sample_tbl = executor.query("SELECT * FROM read_parquet(?) USING SAMPLE {rows} ROWS".format(rows=sample_rows), [parquet_path]).to_pandas()
+        sample_tbl = executor.query(f"SELECT * FROM {source_sql} USING SAMPLE {sample_rows} ROWS", params).to_pandas()
         for col in cols:
             s = sample_tbl[col] if col in sample_tbl.columns else None
             if s is None:
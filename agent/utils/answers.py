@@ -20,9 +20,21 @@ def _first_row_dict(result: Any) -> Optional[Dict[str, Any]]:
     return None
 
 
+def _approximate(answer: str, row: Dict[str, Any]) -> str:
+    """Label an answer estimated from the sample and append the first aggregate's 95% interval."""
+    answer = answer.replace("Answer:", "Answer (approximate):", 1)
+    for name in ("row_count", "total_scheduled_quantity"):
+        lo, hi = row.get(f"{name}_ci_low"), row.get(f"{name}_ci_high")
+        if lo is not None and hi is not None:
+            return f"{answer} [95% CI {lo:,.0f} .. {hi:,.0f}]"
+    return answer
+
+
 def make_concise_answer(result: Any, context: Dict[str, Any]) -> str:
     kind = context.get("analytics") or context.get("intent")
     row = _first_row_dict(result) or {}
+    if context.get("approx"):
+        return _approximate(make_concise_answer(result, {**context, "approx": False}), row)
 
     # Analytics cases first
     if kind == "correlation":
@@ -55,6 +67,29 @@ def make_concise_answer(result: Any, context: Dict[str, Any]) -> str:
             return f"Answer: top anomalous location = {loc} ({cat}), max|z|={z:.2f}, anomaly_days={days}"
         return "Answer: identified anomalous locations vs category baselines."
 
+    if kind == "decomposition":
+        # Rows come strongest seasonality first, keyed by the segment column (or "series")
+        if row:
+            key_col = next(iter(row))
+            strength = row.get("seasonal_strength")
+            parts = [f"seasonal strength {strength:.2f}" if strength is not None else "no seasonal signal"]
+            if row.get("peak_month") is not None:
+                parts.append(f"peak month {row['peak_month']}")
+            if row.get("peak_weekday") is not None:
+                parts.append(f"peak weekday {row['peak_weekday']} (0 = Monday)")
+            return f"Answer: most seasonal {key_col} = {row[key_col]} ({', '.join(parts)})"
+        return "Answer: no series to decompose."
+
+    if kind == "forecast":
+        # First row: the first segment's next-period forecast of the first method
+        if row:
+            key_col = next(iter(row))
+            return (
+                f"Answer: {key_col} {row[key_col]} on {row.get('period')}: {row.get('forecast'):,.0f} "
+                f"(95% interval {row.get('lower'):,.0f} .. {row.get('upper'):,.0f}, {row.get('method')})"
+            )
+        return "Answer: no series to forecast."
+
     # Deterministic patterns
     if "row_count" in row:
         return f"Answer: row_count = {row['row_count']}"
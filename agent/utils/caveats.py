@@ -29,6 +29,8 @@ def build_caveats(result: Any, context: Dict[str, Any]) -> List[str]:
     high_null_cols = [c for c, p in prof.items() if getattr(p, 'null_rate', 0.0) > 0.5]
     if high_null_cols:
         notes.append("High null rates detected in: " + ", ".join(high_null_cols[:5]))
+    if context.get("approx"):
+        notes.append("Approximate: totals are stratified-sample estimates; groups with few sampled rows have wide intervals and groups absent from the sample are missing, so top-N ranks near the cut-off may differ from the exact answer.")
     if context.get("analytics") == "correlation":
         notes.append("Correlation does not imply causation; trends may be confounded.")
         if context.get("method") == "spearman":
@@ -36,15 +38,26 @@ def build_caveats(result: Any, context: Dict[str, Any]) -> List[str]:
         if context.get("include_pvalue"):
             notes.append("P-values assume independence and sufficient observations; apply multiple-comparisons caution.")
     if context.get("analytics") == "clustering":
-        notes.append("Cluster memberships depend on scaling and k; verify stability.")
+        if context.get("k_auto"):
+            notes.append("k was chosen by sampled silhouette and Davies-Bouldin across seeds; check the stability (ARI) column of the k sweep.")
+        else:
+            notes.append("Cluster memberships depend on scaling and k; verify stability.")
         if context.get("algorithm") == "minibatch":
             notes.append("MiniBatch KMeans approximates centroids; results may vary with batch size and seed.")
+        if context.get("algorithm") == "minibatch-stream":
+            notes.append("Streamed MiniBatch KMeans approximates centroids block by block; the silhouette is computed on a sample of segments.")
     if context.get("analytics") == "anomalies_vs_category":
         notes.append("Anomalies are relative to category baselines; investigate data quality and one-off events.")
     if context.get("analytics") == "anomalies_iqr":
         notes.append("IQR fences flag global outliers; seasonal variation may require seasonal adjustment.")
     if context.get("analytics") == "sudden_shifts":
         notes.append("Rolling-window z-scores are sensitive to window size; verify robustness across windows.")
+    if context.get("analytics") == "decomposition":
+        notes.append("Seasonal terms are fixed Fourier shapes (weekly, yearly); changing seasonal patterns and holidays end up in the residual.")
+        notes.append("Strengths are 1 - var(residual)/var(component + residual); flat segments have none.")
+    if context.get("analytics") == "forecast":
+        notes.append("Intervals assume independent, normal one-step errors; level shifts and holidays inside the horizon are not anticipated.")
+        notes.append("MASE below 1 beats the in-sample seasonal naive; backtest errors come from a single held-out window.")
     if context.get("analytics") == "trends":
         notes.append("Growth rates can be unstable on small denominators; prefer longer horizons for stability.")
     return notes
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import hashlib
+import os
+
+
+def cache_root() -> str:
+    # Local, gitignored cache for derived artifacts (rollups, result spill, samples)
+    return os.path.abspath(os.environ.get("SYNMAX_CACHE_DIR", os.path.join(os.getcwd(), ".cache")))
+
+
+def path_key(path: str) -> str:
+    return hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+
+
+def dataset_fingerprint(path: str) -> str:
+    """Identity of a dataset version: absolute path + size + mtime (of every file for globs/directories)."""
+    from agent.exec.dataset import resolve_dataset
+
+    abspath = os.path.abspath(path)
+    ds = resolve_dataset(path)
+    h = hashlib.sha1(abspath.encode("utf-8"))
+    files = ds.files()
+    if not files:
+        raise FileNotFoundError(path)
+    for f in files:
+        st = os.stat(f)
+        h.update(f"|{os.path.abspath(f)}|{st.st_size}|{st.st_mtime_ns}".encode("utf-8"))
+    return h.hexdigest()
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def row_blocks(Y: np.ndarray, block_rows: int) -> List[np.ndarray]:
+    """Consecutive float64 blocks of at most `block_rows` rows of Y (series x periods)."""
+    step = max(int(block_rows), 1)
+    return [np.asarray(Y[s:s + step], dtype=np.float64) for s in range(0, Y.shape[0], step)]
+
+
+def map_tasks(
+    fn: Callable[[Any], Any],
+    tasks: Sequence[Any],
+    max_workers: Optional[int] = None,
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: Tuple[Any, ...] = (),
+) -> List[Any]:
+    """
+    [fn(task) for task in tasks], spread over a process pool when max_workers > 1 and there is more
+    than one task; serially in this process otherwise (after calling `initializer` here). `fn` and
+    the tasks must be picklable.
+    """
+    workers = max(1, min(max_workers or 1, len(tasks)))
+    if workers == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [fn(t) for t in tasks]
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        return list(pool.map(fn, tasks))
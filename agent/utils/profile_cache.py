@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
+from agent.exec.dataset import resolve_dataset, scan_relation
 from agent.exec.duck import DuckDBExecutor
+from agent.utils.fingerprint import dataset_fingerprint
 
 
 @dataclass
@@ -20,8 +22,7 @@ def _first_scalar(obj: Any) -> Any:
     try:
         import pyarrow as pa  # type: ignore
         if isinstance(obj, pa.Table):
-            df = obj.to_pandas()
-            return df.iloc[0, 0]
+            return obj.column(0)[0].as_py()
     except Exception:
         pass
     try:
@@ -36,27 +37,52 @@ def _first_scalar(obj: Any) -> Any:
         return None
 
 
+def _maintained_profile(executor: DuckDBExecutor, parquet_path: str) -> Optional[Dict[str, ColumnProfile]]:
+    # Exact counts kept by the rollup store (and updated by `ingest`), so no full scan is needed
+    store = getattr(executor, "rollups", None)
+    if store is None:
+        return None
+    try:
+        stats = store.profile_stats(executor, parquet_path)
+    except Exception:
+        return None
+    if not stats:
+        return None
+    return {
+        col: ColumnProfile(null_rate=float(nulls / rows) if rows else 0.0, approx_distinct=distinct)
+        for col, (rows, nulls, distinct) in stats.items()
+    }
+
+
 class ProfileCache:
     def __init__(self) -> None:
-        self._cache: Dict[Tuple[str, int], Dict[str, ColumnProfile]] = {}
+        # (path, sample_rows) -> (dataset fingerprint, profile); a changed dataset is re-profiled
+        self._cache: Dict[Tuple[str, int], Tuple[str, Dict[str, ColumnProfile]]] = {}
 
     def get_or_profile(self, executor: DuckDBExecutor, parquet_path: str, sample_rows: int = 10000) -> Dict[str, ColumnProfile]:
         key = (parquet_path, sample_rows)
-        if key in self._cache:
-            return self._cache[key]
+        try:
+            fp = dataset_fingerprint(parquet_path)
+        except OSError:
+            fp = ""
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == fp:
+            return cached[1]
+        maintained = _maintained_profile(executor, parquet_path)
+        if maintained is not None:
+            self._cache[key] = (fp, maintained)
+            return maintained
         # Build sample view (inline path to avoid prepared param limitation)
-        path_sql = parquet_path.replace("'", "''")
-        executor.query(f"CREATE OR REPLACE TEMP VIEW sample AS SELECT * FROM read_parquet('{path_sql}') USING SAMPLE {sample_rows} ROWS")
+        executor.query(f"CREATE OR REPLACE TEMP VIEW sample AS SELECT * FROM {resolve_dataset(parquet_path).relation_inline()} USING SAMPLE {sample_rows} ROWS")
         # Get schema from sample (column names)
         schema_tbl = executor.query("DESCRIBE SELECT * FROM sample LIMIT 0")
-        schema_df = schema_tbl.to_pandas()
-        columns: List[str] = schema_df["column_name"].tolist() if "column_name" in schema_df.columns else []
+        columns: List[str] = schema_tbl.column("column_name").to_pylist() if "column_name" in schema_tbl.column_names else []
         # Approx distinct counts in one pass over full data
         if columns:
             exprs = ", ".join([f"approx_count_distinct({_quote_ident(c)}) AS c{i}" for i, c in enumerate(columns)])
-            row_tbl = executor.query(f"SELECT {exprs} FROM read_parquet(?)", [parquet_path])
-            row_df = row_tbl.to_pandas()
-            row_vals = row_df.iloc[0].tolist()
+            source_sql, params = scan_relation(parquet_path)
+            row_tbl = executor.query(f"SELECT {exprs} FROM {source_sql}", params)
+            row_vals = [row_tbl.column(i)[0].as_py() for i in range(row_tbl.num_columns)]
         else:
             row_vals = []
         # Null rates from sample
@@ -68,11 +94,11 @@ class ProfileCache:
             null_rate = float((nulls_val or 0) / sample_ct) if sample_ct else 0.0
             approx_distinct = int(row_vals[idx] or 0) if idx < len(row_vals) else 0
             profile[col] = ColumnProfile(null_rate=null_rate, approx_distinct=approx_distinct)
-        self._cache[key] = profile
+        self._cache[key] = (fp, profile)
         return profile
 
     def summarize(self, parquet_path: str, sample_rows: int) -> Dict[str, Any]:
-        prof = self._cache.get((parquet_path, sample_rows), {})
+        prof = self._cache.get((parquet_path, sample_rows), ("", {}))[1]
         return {
             "sample_rows": sample_rows,
             "columns_profiled": len(prof),
@@ -3,6 +3,7 @@ from __future__ import annotations
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional, Tuple
 
+from agent.exec.dataset import scan_relation
 from agent.exec.duck import DuckDBExecutor
 
 
@@ -27,9 +28,10 @@ class SchemaCache:
         if key in self._cache:
             return self._cache[key]
         # Load schema via DESCRIBE
-        arrow_tbl = executor.query("DESCRIBE SELECT * FROM read_parquet(?) LIMIT 0", [parquet_path])
-        df = arrow_tbl.to_pandas()
-        columns = [ColumnInfo(name=row["column_name"], type=row["column_type"]) for _, row in df.iterrows()]
+        # Multi-file sources are read with union_by_name, so this is the unified schema
+        source_sql, params = scan_relation(parquet_path)
+        arrow_tbl = executor.query(f"DESCRIBE SELECT * FROM {source_sql} LIMIT 0", params)
+        columns = [ColumnInfo(name=row["column_name"], type=row["column_type"]) for row in arrow_tbl.to_pylist()]
         datetime_cols = [c.name for c in columns if any(t in c.type.upper() for t in ["DATE", "TIMESTAMP", "TIMESTAMPTZ", "TIME"])]
         snapshot = SchemaSnapshot(columns=columns, datetime_columns=datetime_cols)
         self._cache[key] = snapshot
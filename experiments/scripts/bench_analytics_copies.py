@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Per-tool time and peak allocation of the Arrow/NumPy analytics against the pandas round trip
+(to_pandas -> pivot/rolling -> Table.from_pandas) they replaced.
+
+Queries are answered from a warm result cache, so both sides measure only the post-query work.
+Needs pandas for the reference side:
+
+    python experiments/scripts/bench_analytics_copies.py --path data/pipeline_data.parquet
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import numpy as np  # noqa: E402
+import pyarrow as pa  # noqa: E402
+
+from agent.exec.duck import DuckDBExecutor  # noqa: E402
+from agent.exec.result_cache import ResultCache  # noqa: E402
+from agent.tools import analytics  # noqa: E402
+
+
+class RecordingExecutor(DuckDBExecutor):
+    """Keeps the tables each tool fetched, so the pandas reference runs on identical inputs."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.fetched: List[pa.Table] = []
+
+    def query(self, sql: str, params=None):
+        tbl = super().query(sql, params)
+        self.fetched.append(tbl)
+        return tbl
+
+
+def ref_iqr(tbl: pa.Table) -> pa.Table:
+    df = tbl.to_pandas()
+    q1, q3 = df["total_qty"].quantile(0.25), df["total_qty"].quantile(0.75)
+    lower, upper = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    out = df.loc[(df["total_qty"] < lower) | (df["total_qty"] > upper), ["day", "total_qty"]].copy()
+    out["lower"], out["upper"], out["method"] = lower, upper, "IQR(k=1.5)"
+    out = out.sort_values(by="total_qty", key=lambda s: (s - (q1 + q3) / 2).abs(), ascending=False).head(50)
+    return pa.Table.from_pandas(out, preserve_index=False)
+
+
+def ref_shifts(tbl: pa.Table) -> pa.Table:
+    df = tbl.to_pandas().sort_values("day").reset_index(drop=True)
+    roll = df["total_qty"].rolling(7, min_periods=3)
+    df["rolling_mean"], df["rolling_std"] = roll.mean(), roll.std()
+    df["z"] = (df["total_qty"] - df["rolling_mean"]) / df["rolling_std"].replace(0, np.nan)
+    df = df[np.abs(df["z"]).fillna(0) >= 3.0].sort_values("z", key=lambda s: np.abs(s), ascending=False).head(50)
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def ref_correlation(tbl: pa.Table) -> pa.Table:
+    pivot = tbl.to_pandas().pivot(index="day", columns="pipeline_name", values="total_qty").fillna(0)
+    corr = pivot.corr(method="pearson")
+    corr.index.name, corr.columns.name = "a", "b"
+    mask = np.triu(np.ones(corr.shape), k=0).astype(bool)
+    pairs = corr.where(~mask).stack().reset_index(name="corr").sort_values("corr", ascending=False).head(20)
+    return pa.Table.from_pandas(pairs, preserve_index=False)
+
+
+def ref_cluster(tbl: pa.Table) -> pa.Table:
+    import pandas as pd
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+
+    pivot = tbl.to_pandas().pivot(index="pipeline_name", columns="month", values="total_qty").fillna(0)
+    X = StandardScaler().fit_transform(pivot.values)
+    labels = KMeans(n_clusters=min(5, X.shape[0]), n_init=10, random_state=42).fit_predict(X)
+    return pa.Table.from_pandas(pd.DataFrame({"pipeline_name": pivot.index.tolist(), "cluster": labels.tolist()}), preserve_index=False)
+
+
+def ref_trends_daily(tbl: pa.Table) -> pa.Table:
+    df = tbl.to_pandas().sort_values("day").reset_index(drop=True)
+    for w in (7, 30):
+        df[f"ma_{w}"] = df["total_qty"].rolling(window=w, min_periods=max(2, w // 2)).mean()
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def ref_trending(tbl: pa.Table) -> pa.Table:
+    import pandas as pd
+
+    pivot = tbl.to_pandas().pivot(index="month", columns="key", values="total").sort_index()
+    growth = pivot.pct_change(fill_method=None).tail(1).T
+    out = pd.DataFrame({
+        "key": growth.index,
+        "mom_growth": growth.iloc[:, 0].values,
+        "months_observed": pivot.notna().sum(axis=0).values,
+        "last_total": pivot.tail(1).T.iloc[:, 0].values,
+    })
+    out = out.replace([np.inf, -np.inf], np.nan).dropna(subset=["mom_growth"])
+    out = out[out["months_observed"] >= 6].sort_values("mom_growth", ascending=False).head(10)
+    return pa.Table.from_pandas(out, preserve_index=False)
+
+
+TOOLS: List[Tuple[str, Callable[..., Any], Callable[[pa.Table], pa.Table]]] = [
+    ("anomalies_iqr", analytics.anomalies_iqr, ref_iqr),
+    ("sudden_shifts", analytics.sudden_shifts, ref_shifts),
+    ("correlation_pipelines", analytics.correlation_pipelines, ref_correlation),
+    ("cluster_pipelines_monthly", analytics.cluster_pipelines_monthly, ref_cluster),
+    ("trends_summary(by=day)", lambda ex, p: analytics.trends_summary(ex, p, by="day"), ref_trends_daily),
+    ("top_trending_segments(loc_name)", lambda ex, p: analytics.top_trending_segments(ex, p, group_col="loc_name"), ref_trending),
+]
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    best = float("inf")
+    peak = 0
+    for _ in range(repeat):
+        gc.collect()
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {"ms": best * 1000, "peak_mb": peak / 1e6}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="tests/fixtures/sample.parquet")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    ex = RecordingExecutor()
+    ex.dataset_path = args.path
+    ex.result_cache = ResultCache(max_bytes=1 << 30)
+    print(f"{'tool':34} {'arrow ms':>9} {'arrow MB':>9} {'pandas ms':>10} {'pandas MB':>10} {'MB saved':>9}")
+    for name, tool, ref in TOOLS:
+        ex.fetched.clear()
+        tool(ex, args.path)  # warms the result cache and records the tool's input
+        inputs = ex.fetched[-1]
+        new = measure(lambda: tool(ex, args.path), args.repeat)
+        old = measure(lambda: ref(inputs), args.repeat)
+        print(f"{name:34} {new['ms']:9.2f} {new['peak_mb']:9.2f} {old['ms']:10.2f} {old['peak_mb']:10.2f} {old['peak_mb'] - new['peak_mb']:9.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -12,3 +12,453 @@ def test_anomalies_vs_category_runs():
     ex = DuckDBExecutor()
     tbl = anomalies_vs_category(ex, 'tests/fixtures/sample.parquet', z_threshold=2.0, min_anomaly_days=1, year=2024)
     assert tbl is not None
+
+
+def test_rollups_match_raw_and_rebuild_on_change(tmp_path):
+    import os
+    import shutil
+    from agent.exec.rollups import RollupStore
+    src = str(tmp_path / 'data.parquet')
+    shutil.copy('tests/fixtures/sample.parquet', src)
+    raw = daily_totals(DuckDBExecutor(), src).to_pydict()
+    ex = DuckDBExecutor()
+    ex.rollups = RollupStore(cache_dir=str(tmp_path / 'rollups'))
+    rolled = daily_totals(ex, src).to_pydict()
+    assert rolled['day'] == raw['day']
+    assert all(abs(a - b) < 1e-6 for a, b in zip(rolled['total_qty'], raw['total_qty']))
+    rollup_file = ex.rollups.rollup_file(src)
+    first_build = os.stat(rollup_file).st_mtime_ns
+    # Touching the source changes its fingerprint, so the rollup is rebuilt
+    st = os.stat(src)
+    os.utime(src, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert daily_totals(ex, src).num_rows == len(raw['day'])
+    assert os.stat(rollup_file).st_mtime_ns != first_build
+
+
+def test_stale_rollup_file_is_rebuilt_once_by_a_fresh_store(tmp_path):
+    import os
+    import shutil
+    from agent.exec.rollups import RollupStore
+    src = str(tmp_path / 'data.parquet')
+    shutil.copy('tests/fixtures/sample.parquet', src)
+    cache = str(tmp_path / 'rollups')
+    first = DuckDBExecutor()
+    first.rollups = RollupStore(cache_dir=cache)
+    expected = daily_totals(first, src)
+    rollup_file = first.rollups.rollup_file(src)
+    built = os.stat(rollup_file).st_mtime_ns
+    os.utime(src, ns=(built + 10**9, built + 10**9))
+    # A new session finds the stale file on disk: one rebuild, attached under the same alias
+    ex = DuckDBExecutor()
+    ex.rollups = RollupStore(cache_dir=cache)
+    alias = ex.rollups.ensure(ex, src)
+    rebuilt = os.stat(rollup_file).st_mtime_ns
+    assert rebuilt != built
+    assert daily_totals(ex, src).equals(expected)
+    assert ex.rollups.ensure(ex, src) == alias and os.stat(rollup_file).st_mtime_ns == rebuilt
+
+
+def test_analytics_accept_partitioned_directory(tmp_path):
+    import duckdb
+    duckdb.sql(
+        "COPY (SELECT *, year(eff_gas_day) AS year FROM read_parquet('tests/fixtures/sample.parquet')) "
+        f"TO '{tmp_path}' (FORMAT parquet, PARTITION_BY (year))"
+    )
+    single = anomalies_vs_category(DuckDBExecutor(), 'tests/fixtures/sample.parquet', z_threshold=2.0, min_anomaly_days=1, year=2024)
+    multi = anomalies_vs_category(DuckDBExecutor(), str(tmp_path), z_threshold=2.0, min_anomaly_days=1, year=2024)
+    assert multi.column('loc_name').to_pylist() == single.column('loc_name').to_pylist()
+
+
+def test_duckdb_backend_matches_parquet(tmp_path):
+    from agent.exec.dataset import import_to_duckdb, imported_fingerprint
+    from agent.exec.duck import DuckDBConfig
+    from agent.utils.fingerprint import dataset_fingerprint
+    src = 'tests/fixtures/sample.parquet'
+    db = str(tmp_path / 'pipeline.duckdb')
+    import_to_duckdb(src, db)
+    assert imported_fingerprint(db) == dataset_fingerprint(src)
+    raw = daily_totals(DuckDBExecutor(), src).to_pydict()
+    ex = DuckDBExecutor(DuckDBConfig(database=db, read_only=True))
+    native = daily_totals(ex, db).to_pydict()
+    assert native['day'] == raw['day']
+    assert all(abs(a - b) < 1e-6 for a, b in zip(native['total_qty'], raw['total_qty']))
+
+
+def test_async_correlation_and_clustering_match_sync():
+    import asyncio
+    from agent.exec.duck import AsyncDuckDBExecutor
+    from agent.tools.analytics import cluster_pipelines_monthly, correlation_pipelines
+    from agent.tools.analytics_async import correlation_and_clustering
+    src = 'tests/fixtures/sample.parquet'
+    ex = DuckDBExecutor()
+
+    async def run():
+        async with AsyncDuckDBExecutor(ex) as aexec:
+            return await correlation_and_clustering(aexec, src, clustering_kwargs={"k": 3})
+
+    corr, clusters = asyncio.run(run())
+    assert corr.equals(correlation_pipelines(ex, src))
+    assert clusters.equals(cluster_pipelines_monthly(ex, src, k=3))
+
+
+def test_analytics_run_without_pandas(monkeypatch):
+    import sys
+    from agent.tools.analytics import correlation_pipelines, sudden_shifts, top_trending_segments, trends_summary
+    src = 'tests/fixtures/sample.parquet'
+    ex = DuckDBExecutor()
+    monkeypatch.setitem(sys.modules, 'pandas', None)
+    corr = correlation_pipelines(ex, src, method='spearman', include_pvalue=True)
+    assert corr.column_names == ['a', 'b', 'corr', 'pvalue'] and corr.num_rows > 0
+    assert sudden_shifts(ex, src, sigma=2.0).num_rows > 0
+    assert trends_summary(ex, src, by='day').column_names == ['day', 'total_qty', 'ma_7', 'ma_30']
+    assert top_trending_segments(ex, src, min_months=1).num_rows > 0
+
+
+def test_time_series_tools_share_one_daily_scan(tmp_path):
+    import os
+    import shutil
+    from agent.exec.series import DailySeriesStore
+    from agent.tools.analytics import anomalies_iqr, sudden_shifts, trends_summary
+    src = str(tmp_path / 'data.parquet')
+    shutil.copy('tests/fixtures/sample.parquet', src)
+    plain = DuckDBExecutor()
+    expected = [anomalies_iqr(plain, src), sudden_shifts(plain, src, sigma=2.0), trends_summary(plain, src, by='day')]
+
+    ex = DuckDBExecutor()
+    ex.series = DailySeriesStore()
+    sqls = []
+    query = ex.query
+    ex.query = lambda sql, params=None: sqls.append(sql) or query(sql, params)
+    got = [anomalies_iqr(ex, src), sudden_shifts(ex, src, sigma=2.0), trends_summary(ex, src, by='day')]
+    assert all(g.equals(e) for g, e in zip(got, expected))
+    assert len(sqls) == 1 and ex.series.stats() == {"hits": 2, "misses": 1, "entries": 1}
+
+    by_state = ex.series.get(ex, src, by='state_abb')
+    assert by_state.values.flags['C_CONTIGUOUS'] and by_state.values.shape == (len(by_state.keys), len(by_state.days))
+    assert abs(by_state.values.sum(axis=0) - ex.series.get(ex, src).values).max() < 1e-6
+
+    os.utime(src, (1, 1))  # new dataset version -> reloaded
+    anomalies_iqr(ex, src)
+    assert ex.series.stats()["misses"] == 3
+
+
+def test_correlation_matrix_and_pvalues_match_scipy():
+    import numpy as np
+    from scipy.stats import pearsonr, spearmanr
+    from agent.tools.correlation import correlation_matrix, correlation_pvalues, top_pairs
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(60, 8))
+    x[:, 1] = x[:, 0] + rng.normal(scale=0.1, size=60)
+    x[::3, 2] = 0.0  # ties for the ranking
+    for method, ref in (("pearson", pearsonr), ("spearman", spearmanr)):
+        corr = correlation_matrix(x, method)
+        pvals = correlation_pvalues(corr, x.shape[0])
+        for a, b in ((0, 1), (2, 5), (3, 7)):
+            r, p = ref(x[:, a], x[:, b])
+            assert abs(corr[a, b] - r) < 1e-12 and abs(pvals[a, b] - p) <= 1e-9 * max(p, 1e-300)
+    i, j, r = top_pairs(correlation_matrix(x), 3)
+    assert (i[0], j[0]) == (0, 1) and list(r) == sorted(r, reverse=True) and (i < j).all()
+
+
+def test_correlation_pipelines_all_pipelines_with_pvalues():
+    from agent.tools.analytics import correlation_pipelines
+    src = 'tests/fixtures/sample.parquet'
+    ex = DuckDBExecutor()
+    full = correlation_pipelines(ex, src, top_k_pipelines=None, top_pairs=1000, method='spearman', include_pvalue=True)
+    top = correlation_pipelines(ex, src, top_k_pipelines=None, top_pairs=5, method='spearman', include_pvalue=True)
+    assert full.slice(0, 5).equals(top)
+    assert all(0.0 <= p <= 1.0 for p in full['pvalue'].to_pylist() if p is not None)
+
+
+def test_blocked_top_pairs_match_dense_search_within_memory_budget():
+    import numpy as np
+    from agent.tools.correlation import correlation_matrix, top_correlated_series, top_pairs
+    rng = np.random.default_rng(1)
+    x = rng.normal(size=(700, 90))
+    x[5] = 2 * x[6] + rng.normal(scale=0.01, size=90)
+    x[10] = 3.0  # constant series are skipped
+    dense_i, dense_j, dense_r = top_pairs(correlation_matrix(x.T), 50)
+    for threads in (None, 3):
+        i, j, r = top_correlated_series(x, 50, max_memory_mb=1, threads=threads)  # 64-row tiles
+        assert (i == dense_i).all() and (j == dense_j).all() and np.abs(r - dense_r).max() < 1e-5
+    assert (i[0], j[0]) == (5, 6)
+
+
+def test_spearman_top_pairs_stay_within_memory_budget():
+    import tracemalloc
+    import numpy as np
+    import pytest
+    from agent.tools.correlation import correlation_matrix, top_correlated_series, top_pairs
+    rng = np.random.default_rng(2)
+    x = rng.normal(size=(3000, 100))  # 2.3MB of float64 input
+    x[7] = np.exp(x[8])  # monotone in x[8]: rank correlation 1
+    with pytest.raises(ValueError, match='too small'):
+        top_correlated_series(x, 20, method='spearman', max_memory_mb=4)
+    tracemalloc.start()
+    try:
+        i, j, r = top_correlated_series(x, 20, method='spearman', max_memory_mb=6)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # The input is already allocated; everything else fits in what the budget leaves over
+    assert peak <= 6 * 2**20 - x.nbytes
+    dense_i, dense_j, dense_r = top_pairs(correlation_matrix(x.T, method='spearman'), 20)
+    assert (i == dense_i).all() and (j == dense_j).all() and np.abs(r - dense_r).max() < 1e-5
+    assert (i[0], j[0]) == (7, 8)
+
+
+def test_correlated_series_pairs_by_location():
+    from agent.tools.analytics import correlated_series_pairs
+    src = 'tests/fixtures/sample.parquet'
+    tbl = correlated_series_pairs(DuckDBExecutor(), src, top_pairs=5, min_days=5, threads=2)
+    assert tbl.column_names == ['a', 'b', 'corr'] and tbl.num_rows == 5
+    corr = tbl['corr'].to_pylist()
+    assert corr == sorted(corr, reverse=True) and all(a < b for a, b in zip(tbl['a'].to_pylist(), tbl['b'].to_pylist()))
+    assert correlated_series_pairs(DuckDBExecutor(), src, min_days=100000).num_rows == 0
+
+
+def test_grouped_iqr_fences_match_per_group_quantiles():
+    import numpy as np
+    from agent.tools.analytics import anomalies_iqr
+    src = 'tests/fixtures/sample.parquet'
+    ex = DuckDBExecutor()
+    got = anomalies_iqr(ex, src, group_col='loc_name', limit=100000)
+    assert got.column_names[:3] == ['loc_name', 'day', 'total_qty'] and got.num_rows > 0
+    rows = ex.query(
+        "SELECT loc_name, eff_gas_day::DATE AS day, SUM(COALESCE(scheduled_quantity, 0)) AS t "
+        "FROM read_parquet(?) WHERE loc_name IS NOT NULL GROUP BY 1, 2", [src]
+    ).to_pylist()
+    groups = {}
+    for r in rows:
+        groups.setdefault(r['loc_name'], []).append((r['day'], r['t']))
+    expected = set()
+    for loc, days in groups.items():
+        q1, q3 = np.quantile([t for _, t in days], [0.25, 0.75])
+        expected |= {(loc, d) for d, t in days if t < q1 - 1.5 * (q3 - q1) or t > q3 + 1.5 * (q3 - q1)}
+    assert set(zip(got['loc_name'].to_pylist(), got['day'].to_pylist())) == expected
+
+
+def test_grouped_sudden_shifts_score_every_segment_in_one_query():
+    import numpy as np
+    from agent.tools.analytics import sudden_shifts
+    src = 'tests/fixtures/sample.parquet'
+    ex = DuckDBExecutor()
+    got = sudden_shifts(ex, src, window=7, sigma=3.0, limit=100000, group_col='pipeline_name')
+    assert got.column_names == ['pipeline_name', 'day', 'total_qty', 'rolling_mean', 'rolling_std', 'z'] and got.num_rows > 0
+    rows = ex.query(
+        "SELECT pipeline_name, eff_gas_day::DATE AS day, SUM(COALESCE(scheduled_quantity, 0)) AS t "
+        "FROM read_parquet(?) WHERE pipeline_name IS NOT NULL GROUP BY 1, 2 ORDER BY 1, 2", [src]
+    ).to_pylist()
+    series = {}
+    for r in rows:
+        series.setdefault(r['pipeline_name'], []).append((r['day'], r['t']))
+    expected = {}
+    for name, days in series.items():
+        x = np.array([t for _, t in days])
+        for i in range(3, len(x)):
+            prior = x[max(0, i - 7):i]
+            z = (x[i] - prior.mean()) / prior.std(ddof=1) if prior.std() > 0 else 0.0
+            if abs(z) >= 3.0:
+                expected[(name, days[i][0])] = z
+    zs = dict(zip(zip(got['pipeline_name'].to_pylist(), got['day'].to_pylist()), got['z'].to_pylist()))
+    assert zs.keys() == expected.keys() and all(abs(zs[key] - z) < 1e-6 for key, z in expected.items())
+
+
+def test_cluster_segments_streams_features_and_reuses_the_store(tmp_path, monkeypatch):
+    import numpy as np
+    from agent.tools import clustering
+    from agent.tools.analytics import cluster_segments
+    monkeypatch.setenv('SYNMAX_CACHE_DIR', str(tmp_path))
+    src = 'tests/fixtures/sample.parquet'
+    ex = DuckDBExecutor()
+    first = cluster_segments(ex, src, k=4, block_rows=16, silhouette_sample=20)
+    assert first.column_names[:2] == ['loc_name', 'cluster'] and first.num_rows == 60
+    assert first['silhouette'][0].as_py() is not None and set(first['algorithm'].to_pylist()) == {'minibatch-stream'}
+
+    fm = clustering.FeatureStore().load(src, 'loc_name', 'month')
+    assert isinstance(fm.X, np.memmap) and fm.X.dtype == np.float32
+    # The streamed matrix is the dense (location x month) pivot
+    rows = ex.query(
+        "SELECT loc_name, date_trunc('month', eff_gas_day)::DATE AS m, SUM(COALESCE(scheduled_quantity, 0)) AS t "
+        "FROM read_parquet(?) GROUP BY 1, 2", [src]
+    ).to_pylist()
+    for r in rows[:50]:
+        i = fm.keys.index(r['loc_name'])
+        j = (r['m'].year - fm.first_period.year) * 12 + r['m'].month - fm.first_period.month
+        assert abs(fm.X[i, j] - r['t']) <= 1e-6 * max(1.0, abs(r['t']))
+
+    monkeypatch.setattr(clustering, 'build_features', lambda *a, **kw: (_ for _ in ()).throw(AssertionError('rebuilt')))
+    assert cluster_segments(ex, src, k=4, block_rows=16, silhouette_sample=20).equals(first)
+
+
+def test_cluster_auto_k_sweep_picks_one_k_and_pool_matches_serial():
+    from threadpoolctl import threadpool_info, threadpool_limits
+    from agent.tools import clustering
+    from agent.tools.analytics import cluster_pipelines_auto_k, cluster_pipelines_monthly
+    src = 'tests/fixtures/sample.parquet'
+    ex = DuckDBExecutor()
+    with threadpool_limits(2):
+        clusters, sweep = cluster_pipelines_auto_k(ex, src, k_values=(2, 3, 4), seeds=(0, 1), max_workers=1)
+        # The serial sweep ran in this process: its thread pools and the shared matrix are left as they were
+        assert all(p['num_threads'] == 2 for p in threadpool_info()) and clustering._SWEEP_X is None
+    assert sweep['k'].to_pylist() == [2, 3, 4] and sum(sweep['chosen'].to_pylist()) == 1
+    chosen = sweep['k'].to_pylist()[sweep['chosen'].to_pylist().index(True)]
+    assert set(clusters['k'].to_pylist()) == {chosen} and len(set(clusters['cluster'].to_pylist())) == chosen
+    pooled, pooled_sweep = cluster_pipelines_auto_k(ex, src, k_values=(2, 3, 4), seeds=(0, 1), max_workers=2)
+    assert pooled.equals(clusters) and pooled_sweep.equals(sweep)
+    assert cluster_pipelines_monthly(ex, src, k='auto').num_rows == clusters.num_rows
+    # Too few pipelines to sweep: a fixed k=2 fit and an empty sweep with the same columns
+    few, empty = cluster_pipelines_auto_k(ex, src, top_k_pipelines=2)
+    assert few.num_rows == 2 and empty.num_rows == 0 and empty.schema.equals(sweep.schema)
+
+
+def test_top_trending_segments_ranks_growth_in_sql():
+    import numpy as np
+    from agent.tools.analytics import top_trending_segments
+    src = 'tests/fixtures/sample.parquet'
+    ex = DuckDBExecutor()
+    rows = ex.query(
+        "SELECT loc_name AS key, date_trunc('month', eff_gas_day)::DATE AS m, SUM(COALESCE(scheduled_quantity, 0)) AS t "
+        "FROM read_parquet(?) GROUP BY 1, 2", [src]
+    ).to_pylist()
+    months = sorted({r['m'] for r in rows})
+    keys = sorted({r['key'] for r in rows})
+    dense = np.full((len(keys), len(months)), np.nan)
+    for r in rows:
+        dense[keys.index(r['key']), months.index(r['m'])] = r['t']
+    for growth, lag in (('mom', 1), ('yoy', 12)):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            expected = dense[:, -1] / dense[:, -1 - lag] - 1
+        order = [i for i in np.argsort(-expected, kind='stable') if np.isfinite(expected[i])][:7]
+        got = top_trending_segments(ex, src, group_col='loc_name', n=7, min_months=1, growth=growth)
+        assert got.column_names == ['key', f'{growth}_growth', 'months_observed', 'last_total']
+        assert got['key'].to_pylist() == [keys[i] for i in order]
+        assert np.allclose(got[f'{growth}_growth'].to_numpy(), expected[order])
+        assert got['months_observed'].to_pylist() == [int((~np.isnan(dense[i])).sum()) for i in order]
+
+
+def test_batched_decomposition_matches_per_series_fits_and_recovers_peaks():
+    import numpy as np
+    from agent.tools.analytics import seasonal_decomposition
+    from agent.tools.decomposition import decompose_batch, decomposition_basis, fit_coefficients
+    days = np.arange(np.datetime64('2022-01-01'), np.datetime64('2024-12-31'))
+    t = (days - days[0]).astype(float)
+    rng = np.random.default_rng(0)
+    # Yearly peak mid-July, weekly peak on Sundays (2022-01-02 was a Sunday)
+    Y = 50 + 10 * np.cos(2 * np.pi * (t - 195) / 365.25) + 3 * np.cos(2 * np.pi * (t - 1) / 7) + rng.normal(size=(12, t.shape[0]))
+    Y[0, ::40] += 200
+    basis = decomposition_basis(days)
+    expected = np.linalg.lstsq(basis.X, Y.T, rcond=None)[0].T
+    assert np.allclose(fit_coefficients(basis, Y), expected, atol=1e-8)
+    stats = decompose_batch(basis, Y, chunk_rows=5)
+    assert set(stats['peak_month'][1:]) == {7} and set(stats['peak_weekday'][1:]) == {6}
+    assert (stats['seasonal_strength'][1:] > 0.95).all()
+    robust = decompose_batch(basis, Y, robust=True, chunk_rows=5)
+    pooled = decompose_batch(basis, Y, robust=True, chunk_rows=5, max_workers=2)
+    assert all(np.allclose(robust[name], pooled[name]) for name in robust)
+
+    tbl = seasonal_decomposition(DuckDBExecutor(), 'tests/fixtures/sample.parquet', group_col='pipeline_name')
+    assert tbl.num_rows == 8 and tbl.column_names[:2] == ['pipeline_name', 'n_days']
+    strength = tbl['seasonal_strength'].to_pylist()
+    assert strength == sorted(strength, reverse=True)
+    from agent.utils.answers import make_concise_answer
+    assert make_concise_answer(tbl, {'analytics': 'decomposition'}).startswith(f"Answer: most seasonal pipeline_name = {tbl['pipeline_name'][0].as_py()} (seasonal strength ")
+
+
+def test_batched_forecasts_match_scalar_holt_winters_and_backtest():
+    import datetime
+    import numpy as np
+    from agent.tools.analytics import forecast
+    from agent.tools.forecasting import HW_GRID, forecast_batch, holt_winters, seasonal_naive
+    rng = np.random.default_rng(1)
+    t = np.arange(120)
+    Y = 100 + 0.5 * t + 10 * np.sin(2 * np.pi * t / 7) + rng.normal(scale=2.0, size=(9, t.shape[0]))
+
+    def scalar_sse(y, a, b, g, m=7):
+        first = y[:m].mean()
+        trend = (y[m:2 * m].mean() - first) / m
+        level, season, sse = first + trend * (m - 1) / 2, list(y[:m] - first), 0.0
+        for i in range(m, y.shape[0]):
+            s = season[i % m]
+            err = y[i] - level - trend - s
+            sse += err * err
+            prev, level = level, a * (y[i] - s) + (1 - a) * (level + trend)
+            trend = b * (level - prev) + (1 - b) * trend
+            season[i % m] = g * (y[i] - level) + (1 - g) * s
+        return sse
+
+    _, _, chosen = holt_winters(Y, 7, 5)
+    for y, params in zip(Y, chosen):
+        assert tuple(params) == min(HW_GRID, key=lambda p: scalar_sse(y, *p))
+    # A pure weekly pattern repeats exactly under the seasonal naive
+    fc, se = seasonal_naive(np.tile(np.arange(7.0), (2, 4)), 7, 10)
+    assert np.array_equal(fc[0], np.arange(10) % 7) and not se.any()
+    serial = forecast_batch(Y, 7, 14, holdout=14, chunk_rows=4)
+    pooled = forecast_batch(Y, 7, 14, holdout=14, chunk_rows=4, max_workers=2)
+    for method in serial[0]:
+        assert np.allclose(serial[0][method][0], pooled[0][method][0])
+        assert np.allclose(serial[1][method]['mase'], pooled[1][method]['mase'])
+    assert serial[1]['holt_winters']['mae'].mean() < serial[1]['seasonal_naive']['mae'].mean()
+
+    fc_tbl, bt = forecast(DuckDBExecutor(), 'tests/fixtures/sample.parquet', group_col='pipeline_name', horizon=10)
+    assert fc_tbl.num_rows == 8 * 10 * 2 and bt.num_rows == 8 * 2
+    assert fc_tbl.column_names == ['pipeline_name', 'period', 'method', 'forecast', 'lower', 'upper']
+    lower, upper = fc_tbl['lower'].to_numpy(), fc_tbl['upper'].to_numpy()
+    assert (lower <= fc_tbl['forecast'].to_numpy()).all() and (fc_tbl['forecast'].to_numpy() <= upper).all()
+    from agent.utils.answers import make_concise_answer
+    assert make_concise_answer(fc_tbl, {'analytics': 'forecast'}).startswith("Answer: pipeline_name Pipeline 0 on ")
+    monthly, _ = forecast(DuckDBExecutor(), 'tests/fixtures/sample.parquet', group_col=None, freq='month', horizon=3)
+    assert monthly['period'].to_pylist()[:3] == [datetime.date(2025, 3, 1), datetime.date(2025, 4, 1), datetime.date(2025, 5, 1)]
+
+
+def test_category_anomaly_sweeps_reuse_the_materialized_slice(tmp_path):
+    import shutil
+    from agent.exec.materialized import MaterializedRelations
+    src = str(tmp_path / 'data.parquet')
+    shutil.copy('tests/fixtures/sample.parquet', src)
+    plain = DuckDBExecutor()
+    ex = DuckDBExecutor()
+    ex.materialized = MaterializedRelations(max_entries=1)
+    sweep = [dict(z_threshold=z, min_anomaly_days=d, limit=lim) for z, d, lim in ((2.0, 1, 50), (1.5, 3, 10), (3.0, 1, 5))]
+    for kw in sweep:
+        expected = anomalies_vs_category(plain, src, year=2024, **kw)
+        assert anomalies_vs_category(ex.cursor(), src, year=2024, **kw).equals(expected)
+    assert ex.materialized.stats() == {'hits': 2, 'misses': 1, 'entries': 1}
+    # Another slice evicts the first; the dropped table is gone from the scratch database
+    anomalies_vs_category(ex, src, year=2024, state='TX')
+    tables = ex.query("SELECT table_name FROM duckdb_tables() WHERE database_name = 'synmax_scratch'").to_pylist()
+    assert len(tables) == 1 and ex.materialized.stats()['misses'] == 2
+
+
+def test_category_anomalies_run_inline_on_a_read_only_database(tmp_path):
+    from agent.exec.dataset import import_to_duckdb
+    from agent.exec.duck import DuckDBConfig
+    from agent.exec.materialized import MaterializedRelations
+    db = str(tmp_path / 'pipeline.duckdb')
+    import_to_duckdb('tests/fixtures/sample.parquet', db)
+    expected = anomalies_vs_category(DuckDBExecutor(), 'tests/fixtures/sample.parquet', year=2024, z_threshold=2.5, min_anomaly_days=2)
+    ex = DuckDBExecutor(DuckDBConfig(database=db, read_only=True))
+    ex.materialized = MaterializedRelations()
+    # A read-only connection cannot attach the scratch database: the slice is scored inline
+    got = anomalies_vs_category(ex, db, year=2024, z_threshold=2.5, min_anomaly_days=2)
+    assert got.num_rows == expected.num_rows > 0
+    assert got['loc_name'].to_pylist() == expected['loc_name'].to_pylist()
+    assert ex.materialized.stats()['entries'] == 0
+
+
+def test_rollups_build_for_a_read_only_database(tmp_path):
+    import os
+    from agent.exec.dataset import import_to_duckdb
+    from agent.exec.duck import DuckDBConfig
+    from agent.exec.rollups import RollupStore
+    db = str(tmp_path / 'pipeline.duckdb')
+    import_to_duckdb('tests/fixtures/sample.parquet', db)
+    expected = daily_totals(DuckDBExecutor(), 'tests/fixtures/sample.parquet')
+    ex = DuckDBExecutor(DuckDBConfig(database=db, read_only=True))
+    ex.rollups = RollupStore(cache_dir=str(tmp_path / 'rollups'))
+    # The file is written on a separate connection, then attached read-only to the --db executor
+    alias = ex.rollups.ensure(ex, db)
+    assert os.path.exists(ex.rollups.rollup_file(db))
+    got = daily_totals(ex, db)
+    assert got['day'].to_pylist() == expected['day'].to_pylist()
+    assert ex.query(f"SELECT COUNT(*) AS n FROM {alias}.pipeline_daily").to_pylist()[0]['n'] > 0
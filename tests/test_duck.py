@@ -0,0 +1,75 @@
+import pytest
+
+from agent.exec.duck import DuckDBConfig, DuckDBExecutor, QueryTimeout
+
+
+def test_query_timeout_interrupts_and_connection_survives():
+    ex = DuckDBExecutor(DuckDBConfig(timeout_sec=1))
+    with pytest.raises(QueryTimeout):
+        ex.query("SELECT SUM(a * b) FROM range(5000000000) t(a), range(5) u(b)")
+    assert ex.query("SELECT 1 AS x").to_pylist() == [{"x": 1}]
+
+
+def test_resource_settings_from_env_and_overrides(monkeypatch, tmp_path):
+    monkeypatch.setenv("DUCKDB_THREADS", "2")
+    monkeypatch.setenv("DUCKDB_PRESERVE_INSERTION_ORDER", "false")
+    cfg = DuckDBConfig.from_env(memory_limit="512MB", temp_directory=str(tmp_path), threads=None)
+    assert cfg.settings() == {"threads": 2, "memory_limit": "512MB", "temp_directory": str(tmp_path), "preserve_insertion_order": False}
+    effective = DuckDBExecutor(cfg).effective_settings()
+    assert effective["threads"] == "2"
+    assert effective["preserve_insertion_order"] == "false"
+    assert effective["temp_directory"] == str(tmp_path)
+
+
+def test_query_batches_streams_bounded_head():
+    from agent.exec.result_cache import ResultCache
+    from agent.exec.streaming import read_head
+    ex = DuckDBExecutor()
+    ex.result_cache = ResultCache(spill_dir=None)
+    ex.dataset_path = 'tests/fixtures/sample.parquet'
+    sql = "SELECT range AS x FROM range(200000)"
+    head = read_head(ex.query_batches(sql, batch_rows=1000), max_rows=50)
+    assert head.table.num_rows == 50 and head.total_rows == 200000 and head.truncated and head.complete
+    # Without counting, the stream stops after the head: a lower bound, and nothing is cached
+    entries = ex.result_cache.stats()["mem_entries"]
+    early = read_head(ex.query_batches("SELECT range AS y FROM range(300000)", batch_rows=1000), max_rows=50, count_rest=False)
+    assert early.table.num_rows == 50 and 50 < early.total_rows < 300000 and early.truncated and not early.complete
+    assert ex.result_cache.stats()["mem_entries"] == entries
+    # Fully read streams land in the result cache and are replayed from it
+    assert read_head(ex.query_batches(sql)).total_rows == 200000
+    assert ex.result_cache.stats()["hits"] == 1
+
+
+def test_profiler_captures_operator_tree_and_reporter_writes_it(tmp_path):
+    import json
+    from agent.report.reporter import Reporter
+    ex = DuckDBExecutor()
+    profiler = ex.enable_profiling()
+    sql = "SELECT pipeline_name, SUM(scheduled_quantity) AS total FROM read_parquet(?) GROUP BY 1"
+    ex.query(sql, ['tests/fixtures/sample.parquet'])
+    (prof,) = profiler.profiles()
+    assert prof["sql"] == sql and prof["rows_scanned"] == 47400
+    names = json.dumps(prof["operators"])
+    assert "PARQUET_SCAN" in names or "TABLE_SCAN" in names
+    assert prof["hotspots"] and prof["hotspots"][0]["time_sec"] is not None
+    run_dir = Reporter(base_dir=str(tmp_path), profiler=profiler).save_artifacts({"intent": "sql"}, sql, [], "ok", latency_sec=0.1)
+    saved = json.loads((tmp_path / run_dir.split("/")[-1] / "profile.json").read_text())
+    assert saved["queries"][0]["sql"] == sql
+
+
+def test_abandoned_streams_disarm_their_watchdog():
+    import gc
+    from agent.exec.streaming import read_head
+    ex = DuckDBExecutor(DuckDBConfig(timeout_sec=30))
+    # Closed early by read_head
+    read_head(ex.query_batches("SELECT range AS x FROM range(300000)", batch_rows=1000), max_rows=10, count_rest=False)
+    assert ex._stream_timer is None
+    # Never read, then dropped
+    reader = ex.query_batches("SELECT range AS x FROM range(300000)", batch_rows=1000)
+    timer = ex._stream_timer
+    assert timer is not None and timer.is_alive()
+    del reader
+    gc.collect()
+    timer.join(1)
+    assert not timer.is_alive() and ex._stream_timer is None
+    assert ex.query("SELECT 1 AS x").to_pylist() == [{"x": 1}]
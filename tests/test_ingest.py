@@ -0,0 +1,92 @@
+import os
+
+import duckdb
+
+from agent.exec.duck import DuckDBExecutor
+from agent.exec.rollups import RollupStore
+from agent.tools.ingest import ingest_files, load_state
+
+SRC = 'tests/fixtures/sample.parquet'
+
+
+def _split(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    con = duckdb.connect()
+    con.execute(f"COPY (SELECT * FROM '{SRC}' WHERE eff_gas_day < DATE '2025-02-01') TO '{data / 'history.parquet'}' (FORMAT PARQUET)")
+    con.execute(f"COPY (SELECT * FROM '{SRC}' WHERE eff_gas_day >= DATE '2025-02-01') TO '{tmp_path / 'feb.parquet'}' (FORMAT PARQUET)")
+    con.execute(
+        f"COPY (SELECT * REPLACE (scheduled_quantity * 2 AS scheduled_quantity) FROM '{SRC}' WHERE eff_gas_day = DATE '2025-01-15') "
+        f"TO '{tmp_path / 'jan15.parquet'}' (FORMAT PARQUET)"
+    )
+    return str(data)
+
+
+def _rollup_rows(ex, store, path, name):
+    return ex.query(f"SELECT * EXCLUDE (n_rows) FROM {store.table(ex, path, name)} ORDER BY ALL").to_pylist()
+
+
+def test_ingest_appends_and_restates_incrementally(tmp_path):
+    data = _split(tmp_path)
+    store = RollupStore(cache_dir=str(tmp_path / 'rollups'))
+    ex = DuckDBExecutor()
+    store.ensure(ex, data)
+
+    report = ingest_files(data, [str(tmp_path / 'feb.parquet')], rollups=store)
+    assert report['rollups'] == 'updated' and report['watermark'] == '2025-02-28'
+    again = ingest_files(data, [str(tmp_path / 'jan15.parquet')], rollups=store)
+    assert again['skipped_days'] == ['2025-01-15'] and again['rows_added'] == 0
+    report = ingest_files(data, [str(tmp_path / 'jan15.parquet')], restate=True, rollups=store)
+    assert report['restated_days'] == ['2025-01-15'] and report['rows_removed'] == report['rows_added']
+    assert report['rollups'] == 'updated'
+    assert load_state(data)['watermark'] == '2025-02-28'
+    # The folded-in file is current: reading it again does not rebuild it
+    folded = os.stat(store.rollup_file(data)).st_mtime_ns
+    store.profile_stats(ex, data)
+    assert os.stat(store.rollup_file(data)).st_mtime_ns == folded
+
+    rebuilt, ex_full = RollupStore(cache_dir=str(tmp_path / 'rebuilt')), DuckDBExecutor()
+    for name, dims in (('pipeline_daily', 2), ('segment_monthly', 5)):
+        inc = _rollup_rows(ex, store, data, name)
+        full = _rollup_rows(ex_full, rebuilt, data, name)
+        assert [list(r.values())[:dims] for r in inc] == [list(r.values())[:dims] for r in full]
+        assert all(abs(a['total_qty'] - b['total_qty']) < 1e-6 for a, b in zip(inc, full))
+    inc_profile, full_profile = store.profile_stats(ex, data), rebuilt.profile_stats(ex_full, data)
+    assert list(inc_profile) == list(full_profile)
+    for col, (rows, nulls, distinct) in full_profile.items():
+        assert inc_profile[col][:2] == (rows, nulls)
+        # Exact value sets for dimensions; near-unique quantities only carry an estimate
+        if col == 'scheduled_quantity':
+            assert abs(inc_profile[col][2] - distinct) <= 0.1 * distinct
+        else:
+            assert inc_profile[col][2] == distinct
+    with_sets = ex.query(f"SELECT DISTINCT column_name FROM {store.table(ex, data, '_distinct_values')}").to_pylist()
+    assert 'scheduled_quantity' not in {r['column_name'] for r in with_sets}
+
+
+def test_failed_restate_leaves_the_dataset_untouched(tmp_path, monkeypatch):
+    import glob
+    from agent.tools import ingest
+    data = _split(tmp_path)
+    before = duckdb.connect().execute(f"SELECT COUNT(*), SUM(scheduled_quantity) FROM '{data}/*.parquet'").fetchone()
+    stage = ingest._stage
+    calls = []
+
+    def failing_stage(*args, **kwargs):
+        calls.append(args[3])
+        if len(calls) == 2:
+            raise OSError('disk full')
+        return stage(*args, **kwargs)
+
+    monkeypatch.setattr(ingest, '_stage', failing_stage)
+    try:
+        ingest_files(data, [str(tmp_path / 'jan15.parquet')], restate=True, use_rollups=False)
+    except OSError:
+        pass
+    else:
+        raise AssertionError('expected the injected failure')
+    # The holder was staged before the failure, but nothing replaced or removed it
+    after = duckdb.connect().execute(f"SELECT COUNT(*), SUM(scheduled_quantity) FROM '{data}/*.parquet'").fetchone()
+    assert after == before and len(calls) == 2
+    assert not glob.glob(f"{data}/**/*.tmp-*", recursive=True)
+    assert load_state(data).get('watermark') is None
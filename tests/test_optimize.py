@@ -0,0 +1,13 @@
+import pyarrow.parquet as pq
+
+from agent.tools.optimize import optimize_dataset
+
+
+def test_optimize_sorts_and_reduces_scanned_bytes(tmp_path):
+    out = str(tmp_path / 'opt.parquet')
+    report = optimize_dataset('tests/fixtures/sample.parquet', out, row_group_size=4096)
+    assert report['rows'] == pq.ParquetFile(out).metadata.num_rows
+    days = pq.read_table(out, columns=['eff_gas_day']).column(0).to_pylist()
+    assert days == sorted(days)
+    year_scans = [s for s in report['scans'] if ' in ' in s['question']]
+    assert year_scans and all(s['bytes_after'] < s['bytes_before'] for s in year_scans)
@@ -0,0 +1,37 @@
+from agent.exec.duck import DuckDBExecutor
+from agent.exec.result_cache import ResultCache, normalize_sql
+
+PATH = 'tests/fixtures/sample.parquet'
+SQL = "SELECT pipeline_name, SUM(scheduled_quantity) AS total FROM read_parquet(?) GROUP BY 1 ORDER BY 2 DESC LIMIT ?"
+
+
+def test_repeated_query_hits_cache(tmp_path):
+    ex = DuckDBExecutor()
+    ex.dataset_path = PATH
+    ex.result_cache = ResultCache(spill_dir=str(tmp_path))
+    first = ex.query(SQL, [PATH, 5])
+    second = ex.query("  " + SQL.replace(" FROM", "\n FROM") + ";", [PATH, 5])
+    assert second is first
+    stats = ex.result_cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1
+
+
+
+def test_whitespace_inside_literals_keeps_keys_apart(tmp_path):
+    assert normalize_sql("SELECT  'A  B' AS \"x  y\"\n FROM t;") == "SELECT 'A  B' AS \"x  y\" FROM t"
+    assert normalize_sql("SELECT 'it''s  ok'") == "SELECT 'it''s  ok'"
+    ex = DuckDBExecutor()
+    ex.dataset_path = PATH
+    ex.result_cache = ResultCache(spill_dir=str(tmp_path))
+    assert ex.query("SELECT 'A  B' AS v").to_pylist() == [{'v': 'A  B'}]
+    assert ex.query("SELECT 'A B' AS v").to_pylist() == [{'v': 'A B'}]
+
+def test_evicted_results_spill_to_disk(tmp_path):
+    ex = DuckDBExecutor()
+    ex.dataset_path = PATH
+    ex.result_cache = ResultCache(max_bytes=1, spill_dir=str(tmp_path))
+    first = ex.query(SQL, [PATH, 5])
+    again = ex.query(SQL, [PATH, 5])
+    assert again.equals(first)
+    stats = ex.result_cache.stats()
+    assert stats['disk_hits'] == 1 and stats['mem_entries'] == 0
@@ -0,0 +1,11 @@
+from agent.exec.session import DuckDBSession
+
+
+def test_session_reuses_connection_and_caches():
+    with DuckDBSession('tests/fixtures/sample.parquet') as session:
+        preview = session.preview(5)
+        assert preview.num_rows == 5
+        schema = session.schema()
+        assert any(c.name == 'eff_gas_day' for c in schema.columns)
+        assert session.schema() is schema
+        assert session.profile(sample_rows=100) is session.profile(sample_rows=100)
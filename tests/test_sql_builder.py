@@ -21,3 +21,106 @@ def test_build_sum_by_group():
     assert 'GROUP BY' in sql
     assert params[0].endswith('sample.parquet')
     assert params[-1] == 5
+
+
+def test_day_filter_prunes_partitions(tmp_path):
+    import duckdb
+    duckdb.sql(
+        "COPY (SELECT *, year(eff_gas_day) AS year, month(eff_gas_day) AS month "
+        "FROM read_parquet('tests/fixtures/sample.parquet')) "
+        f"TO '{tmp_path}' (FORMAT parquet, PARTITION_BY (year, month))"
+    )
+    plan = QueryPlan(
+        columns=[],
+        filters=[Filter(column='eff_gas_day', op='BETWEEN', value=['2024-03-01', '2024-04-30'])],
+        group_by=[],
+        aggregations={'total': 'SUM(scheduled_quantity)'},
+        order_by=[],
+    )
+    sql, params = build_sql(str(tmp_path), plan, schema)
+    files = params[0]
+    assert len(files) == 2 and all('year=2024' in f for f in files)
+    pruned = duckdb.execute(sql, params).fetchone()[0]
+    full = duckdb.execute(
+        "SELECT SUM(scheduled_quantity) FROM read_parquet('tests/fixtures/sample.parquet') "
+        "WHERE eff_gas_day BETWEEN '2024-03-01' AND '2024-04-30'"
+    ).fetchone()[0]
+    assert abs(pruned - full) < 1e-6
+
+
+def test_approx_plans_estimate_totals_from_the_stratified_sample(tmp_path):
+    import os
+    from agent.exec.duck import DuckDBExecutor
+    from agent.exec.sampling import SampleStore, build_approx_sql
+    src = 'tests/fixtures/sample.parquet'
+    ex = DuckDBExecutor()
+    plan = QueryPlan(
+        columns=['pipeline_name'],
+        filters=[Filter(column='eff_gas_day', op='BETWEEN', value=['2024-01-01', '2024-12-31'])],
+        group_by=['pipeline_name'],
+        aggregations={'total': 'SUM(scheduled_quantity)', 'rows': 'COUNT(*)'},
+        order_by=[('total', 'DESC')],
+        limit=5,
+    )
+    exact = {r['pipeline_name']: r for r in ex.query(*build_sql(src, plan, schema)).to_pylist()}
+
+    # A sample as large as every stratum is the population: estimates are exact with zero-width intervals
+    full = SampleStore(cache_dir=str(tmp_path / 'full'), min_per_stratum=10**6)
+    got = ex.query(*build_approx_sql(full.ensure(ex, src), plan, schema)).to_pylist()
+    assert [r['pipeline_name'] for r in got] == list(exact)
+    for r in got:
+        assert abs(r['total'] - exact[r['pipeline_name']]['total']) < 1e-6 * exact[r['pipeline_name']]['total']
+        assert r['total_ci_low'] == r['total_ci_high'] == r['total'] and r['rows'] == exact[r['pipeline_name']]['rows']
+
+    store = SampleStore(cache_dir=str(tmp_path / 'small'), rate=0.05, min_per_stratum=10)
+    alias = store.ensure(ex, src)
+    stats = store.stats(ex, src)
+    assert stats['sample'] < stats['population'] / 3 and os.path.exists(store.sample_file(src))
+    got = ex.query(*build_approx_sql(alias, plan, schema)).to_pylist()
+    for r in got:
+        # Whole (pipeline, month) strata pass the year filter, so counts are exact; totals are bracketed
+        assert r['rows'] == r['rows_ci_low'] == exact[r['pipeline_name']]['rows']
+        assert r['total_ci_low'] < r['total'] < r['total_ci_high']
+    inside = sum(r['total_ci_low'] <= exact[r['pipeline_name']]['total'] <= r['total_ci_high'] for r in got)
+    assert inside >= len(got) - 1
+
+    distinct = QueryPlan(columns=[], filters=[], group_by=[], aggregations={'n': 'COUNT(DISTINCT pipeline_name)'}, order_by=[])
+    assert build_approx_sql(alias, distinct, schema) is None
+
+
+def test_stale_sample_file_is_rebuilt_by_a_fresh_store(tmp_path):
+    import os
+    import shutil
+    from agent.exec.duck import DuckDBExecutor
+    from agent.exec.sampling import SampleStore
+    src = str(tmp_path / 'data.parquet')
+    shutil.copy('tests/fixtures/sample.parquet', src)
+    cache = str(tmp_path / 'samples')
+    SampleStore(cache_dir=cache).ensure(DuckDBExecutor(), src)
+    built = os.stat(SampleStore(cache_dir=cache).sample_file(src)).st_mtime_ns
+    os.utime(src, ns=(built + 10**9, built + 10**9))
+    # A new session finds the file on disk, sees the dataset changed and rebuilds it
+    ex = DuckDBExecutor()
+    store = SampleStore(cache_dir=cache)
+    alias = store.ensure(ex, src)
+    assert os.stat(store.sample_file(src)).st_mtime_ns != built
+    assert store.stats(ex, src)['population'] == ex.query(f"SELECT COUNT(*) AS n FROM read_parquet('{src}')").to_pylist()[0]['n']
+    assert ex.query(f"SELECT COUNT(*) AS n FROM {alias}.sample").to_pylist()[0]['n'] > 0
+
+
+def test_approx_plans_run_on_a_read_only_database(tmp_path):
+    import os
+    from agent.exec.dataset import import_to_duckdb
+    from agent.exec.duck import DuckDBConfig, DuckDBExecutor
+    from agent.exec.sampling import SampleStore, build_approx_sql
+    db = str(tmp_path / 'pipeline.duckdb')
+    import_to_duckdb('tests/fixtures/sample.parquet', db)
+    plan = QueryPlan(columns=['pipeline_name'], filters=[], group_by=['pipeline_name'], aggregations={'rows': 'COUNT(*)'}, order_by=[])
+    exact = {r['pipeline_name']: r['rows'] for r in DuckDBExecutor().query(*build_sql('tests/fixtures/sample.parquet', plan, schema)).to_pylist()}
+    # --db opens the database read-only: the sample is built on a separate connection and attached afterwards
+    ex = DuckDBExecutor(DuckDBConfig(database=db, read_only=True))
+    store = SampleStore(cache_dir=str(tmp_path / 'samples'), min_per_stratum=10**6)
+    alias = store.ensure(ex, db)
+    assert os.path.exists(store.sample_file(db))
+    got = {r['pipeline_name']: r['rows'] for r in ex.query(*build_approx_sql(alias, plan, schema)).to_pylist()}
+    assert got == exact